@@ -1,12 +1,14 @@
 from flask_admin import Admin
 
 from ..app import db
+from ..scheme.merge import MergeCandidate
 from ..scheme.object import ObjectLink
 from ..scheme.platform import Platform, PlatformGroup, Scrap
 from ..scheme.value import Value, ValueSource
 from .views import (
     AllObjectView,
     EpisodeView,
+    MergeCandidateView,
     MovieView,
     ObjectLinkView,
     PersonView,
@@ -35,5 +37,8 @@ def setup_admin(app):
         MovieView(db.session, name="Movies"),
         SeriesView(db.session, name="Series"),
         EpisodeView(db.session, name="Episodes"),
+        MergeCandidateView(
+            MergeCandidate, db.session, name="Merge candidates", category="Matching"
+        ),
     )
     admin.init_app(app, endpoint="admin", url="/admin")
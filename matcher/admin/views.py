@@ -10,8 +10,9 @@ from sqlalchemy.orm import joinedload
 
 from ..app import db
 from ..scheme.enums import ExternalObjectType, PlatformType, ValueType
-from ..scheme.object import Episode, ExternalObject, ObjectLink
+from ..scheme.object import ExternalObject, ObjectLink
 from ..scheme.platform import Platform
+from ..scheme.stats import SeriesStats
 from ..scheme.value import Value
 from .filters import (
     ExternalObjectPlatformFilter,
@@ -45,6 +46,15 @@ def link_formatter(route):
     return formatter
 
 
+def object_id_formatter(view, context, model, name):
+    return rules.Markup(
+        '<a href="{}">{}</a>'.format(
+            url_for("allobjects.details_view", id=getattr(model, name)),
+            getattr(model, name),
+        )
+    )
+
+
 def series_formatter(view, context, model, name):
     series = model.related_object.series
     if series is not None:
@@ -63,7 +73,11 @@ def meta_formatter(attr):
 
 
 def episodes_formatter(view, context, model, name):
-    count = db.session.query(Episode).filter(Episode.series == model).count()
+    count = (
+        db.session.query(SeriesStats.episodes_count)
+        .filter(SeriesStats.series_id == model.id, SeriesStats.platform_id.is_(None))
+        .scalar()
+    ) or 0
     return rules.Markup(
         '<a href="{}">{}</a>'.format(
             url_for("episodes.index_view", flt1_5=model.id), count
@@ -183,6 +197,16 @@ class ObjectLinkView(DefaultView):
     column_searchable_list = ["external_id"]
 
 
+class MergeCandidateView(DefaultView):
+    can_create = False
+    column_default_sort = ("score", True)
+    column_list = ("obj_id", "into_id", "score", "status", "message")
+    column_filters = ["status", "score"]
+    column_editable_list = ["status"]
+    form_columns = ("status",)
+    column_formatters = {"obj_id": object_id_formatter, "into_id": object_id_formatter}
+
+
 class ExternalObjectView(DefaultView):
     def __init__(self, *args, **kwargs):
         kwargs["category"] = "External Objects"
@@ -1,6 +1,6 @@
 from flask_restplus import Mask, Model, fields
 
-from matcher.scheme.enums import PlatformType
+from matcher.scheme.enums import ExternalObjectType, PlatformType
 from matcher.scheme.platform import ScrapStatus
 
 platform_base = Model(
@@ -42,11 +42,75 @@ scrap = Model(
         "status": fields.String(choice=[str(s) for s in ScrapStatus]),
         "platform": fields.Nested(platform),
         "stats": fields.Raw(),
+        "links_count": fields.Integer,
+        "objects_count": fields.Integer,
     },
     mask="id,date,status,platform{id,name,slug}",
 )
 
 
+external_object = Model(
+    "External object",
+    {
+        "id": fields.Integer,
+        "type": fields.String(enum=[str(t) for t in ExternalObjectType]),
+        "titles": fields.List(fields.String, attribute="attributes.titles"),
+        "dates": fields.List(fields.Integer, attribute="attributes.dates"),
+        "countries": fields.List(fields.String, attribute="attributes.countries"),
+    },
+)
+
+external_object_detail = external_object.clone(
+    "External object detail",
+    {
+        "links_count": fields.Integer,
+        "values_count": fields.Integer,
+        "seasons_count": fields.Integer,
+        "episodes_count": fields.Integer,
+    },
+)
+
+object_link = Model(
+    "Object link",
+    {
+        "id": fields.Integer,
+        "external_id": fields.String,
+        "url": fields.String,
+        "platform": fields.Nested(platform_base),
+    },
+    mask="id,external_id,url,platform{id,name,slug}",
+)
+
+value_source = Model(
+    "Value source",
+    {"platform": fields.Nested(platform_base), "score": fields.Integer},
+    mask="platform{id,name,slug},score",
+)
+
+value = Model(
+    "Value",
+    {
+        "id": fields.Integer,
+        "type": fields.String,
+        "text": fields.String,
+        "score": fields.Integer,
+        "sources": fields.List(fields.Nested(value_source)),
+    },
+)
+
+episode = Model(
+    "Episode",
+    {
+        "id": fields.Integer(attribute="external_object_id"),
+        "season": fields.Integer,
+        "episode": fields.Integer,
+        "titles": fields.List(
+            fields.String, attribute="external_object.attributes.titles"
+        ),
+    },
+)
+
+
 queue = Model(
     "Queue", {"workers": fields.List(fields.String(example="celery@c679340222ca"))}
 )
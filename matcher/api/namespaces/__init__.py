@@ -1,4 +1,4 @@
-from . import groups, platforms, queue, scraps
+from . import groups, objects, platforms, queue, scraps
 
 
 def register_all(api):
@@ -6,3 +6,4 @@ def register_all(api):
     api.add_namespace(groups.api)
     api.add_namespace(scraps.api)
     api.add_namespace(queue.api)
+    api.add_namespace(objects.api)
@@ -1,5 +1,6 @@
 from flask_restplus import Namespace, reqparse
 
+from matcher.pagination import Key
 from matcher.scheme.platform import PlatformGroup
 
 from .. import models, pagination
@@ -20,7 +21,7 @@ class PlatformGroupList(InjectedResource):
     """List and create platform groups"""
 
     @api.doc("list_platform_groups")
-    @pagination.wrap(api, models.platform_group)
+    @pagination.wrap(api, models.platform_group, keys=[Key(PlatformGroup.id)])
     def get(self):
         """List all platform groups"""
         return self.query(PlatformGroup)
@@ -0,0 +1,196 @@
+from flask_restplus import Namespace, abort, fields, reqparse
+from sqlalchemy.orm import joinedload, undefer
+
+from matcher.pagination import InvalidCursor, Key, cached_count, keyset_paginate
+from matcher.scheme.enums import ExternalObjectType
+from matcher.scheme.object import Episode, ExternalObject, ObjectLink
+from matcher.scheme.search import ObjectSearch
+from matcher.scheme.stats import SeriesStats
+from matcher.scheme.value import Value
+
+from .. import inputs, models, pagination
+from ..resources import InjectedResource
+
+api = Namespace("objects", description="External object operations")
+
+search_arguments = reqparse.RequestParser()
+search_arguments.add_argument(
+    "q", type=str, required=True, location="args", help="The search terms"
+)
+search_arguments.add_argument(
+    "type",
+    type=inputs.custom_enum(ExternalObjectType),
+    required=False,
+    location="args",
+)
+search_arguments.add_argument(
+    "cursor",
+    type=str,
+    required=False,
+    location="args",
+    help="Start after this cursor",
+)
+search_arguments.add_argument(
+    "per_page",
+    type=int,
+    required=False,
+    location="args",
+    choices=[5, 10, 20, 30, 40, 50],
+    default=20,
+)
+
+for key in [
+    "platform_base",
+    "external_object",
+    "external_object_detail",
+    "object_link",
+    "value_source",
+    "value",
+    "episode",
+]:
+    model = getattr(models, key)
+    api.models[model.name] = model
+api.models[pagination.model.name] = pagination.model
+
+search_page = api.model(
+    "External object search page",
+    {
+        "items": fields.List(fields.Nested(models.external_object)),
+        "pagination": fields.Nested(pagination.model),
+    },
+)
+
+
+@api.route("/search")
+class ObjectSearchList(InjectedResource):
+    """Search objects by their titles and names"""
+
+    @api.doc("search_objects")
+    @api.expect(search_arguments)
+    @api.marshal_with(search_page)
+    def get(self):
+        """Search objects, the best ranked first
+
+        Only the IDs of the matches are paged through, and the objects of the
+        page are then loaded in one query.
+        """
+        args = search_arguments.parse_args()
+
+        ids = self.query(ObjectSearch.external_object_id, ObjectSearch.score).filter(
+            ObjectSearch.matches(args["q"])
+        )
+        if args["type"] is not None:
+            ids = ids.join(
+                ExternalObject, ExternalObject.id == ObjectSearch.external_object_id
+            ).filter(ExternalObject.type == args["type"])
+
+        try:
+            page = keyset_paginate(
+                ids,
+                [
+                    Key(ObjectSearch.score, descending=True),
+                    Key(ObjectSearch.external_object_id, descending=True),
+                ],
+                cursor=args["cursor"] or None,
+                per_page=args["per_page"],
+            )
+        except InvalidCursor:
+            abort(400, "Invalid cursor")
+
+        page.items = ObjectSearch.hydrate(
+            self.query(ExternalObject).options(joinedload(ExternalObject.attributes)),
+            [row.external_object_id for row in page.items],
+        )
+        return {"items": page.items, "pagination": page}
+
+
+@api.route("/<int:id>")
+@api.response(404, "Object not found")
+class ObjectItem(InjectedResource):
+    """Show the summary of an object.
+
+    Its links, values and episodes are paged through separately.
+    """
+
+    @api.doc("get_object")
+    @api.marshal_with(models.external_object_detail)
+    def get(self, id):
+        """Fetch the summary of an object"""
+        obj = (
+            self.query(ExternalObject)
+            .options(
+                joinedload(ExternalObject.attributes),
+                undefer(ExternalObject.links_count),
+            )
+            .get_or_404(id)
+        )
+
+        summary = {
+            "id": obj.id,
+            "type": obj.type,
+            "attributes": obj.attributes,
+            "links_count": obj.links_count,
+            "values_count": cached_count(
+                self.query(Value).filter(Value.external_object_id == obj.id)
+            ),
+        }
+
+        stats = (
+            self.query(SeriesStats)
+            .filter(SeriesStats.series_id == obj.id, SeriesStats.platform_id.is_(None))
+            .first()
+        )
+        if stats is not None:
+            summary["seasons_count"] = stats.seasons_count
+            summary["episodes_count"] = stats.episodes_count
+
+        return summary
+
+
+@api.route("/<int:id>/links")
+@api.response(404, "Object not found")
+class ObjectLinkList(InjectedResource):
+    """List the links of an object"""
+
+    @api.doc("list_object_links")
+    @pagination.wrap(api, models.object_link, keys=[Key(ObjectLink.id)])
+    def get(self, id):
+        """List the links of an object, with their platform"""
+        obj = self.query(ExternalObject).get_or_404(id)
+        return ObjectLink.of_object(self.session, obj.id).order_by(ObjectLink.id)
+
+
+@api.route("/<int:id>/values")
+@api.response(404, "Object not found")
+class ObjectValueList(InjectedResource):
+    """List the values of an object"""
+
+    @api.doc("list_object_values")
+    @pagination.wrap(api, models.value, keys=[Key(Value.id)])
+    def get(self, id):
+        """List the values of an object, with their sources"""
+        obj = self.query(ExternalObject).get_or_404(id)
+        return Value.of_object(self.session, obj.id).order_by(Value.id)
+
+
+@api.route("/<int:id>/episodes")
+@api.response(404, "Object not found")
+class ObjectEpisodeList(InjectedResource):
+    """List the episodes of a series"""
+
+    @api.doc("list_object_episodes")
+    @pagination.wrap(
+        api,
+        models.episode,
+        keys=[
+            Key(Episode.season, nullable=True),
+            Key(Episode.episode, nullable=True),
+            Key(Episode.external_object_id),
+        ],
+    )
+    def get(self, id):
+        """List the episodes of a series, by season and episode"""
+        obj = self.query(ExternalObject).get_or_404(id)
+        return Episode.of_series(self.session, obj.id).order_by(
+            Episode.season, Episode.episode, Episode.external_object_id
+        )
@@ -1,5 +1,6 @@
 from flask_restplus import Namespace, inputs, reqparse
 
+from matcher.pagination import Key
 from matcher.scheme.enums import PlatformType
 from matcher.scheme.platform import Platform
 
@@ -20,7 +21,7 @@ platform_arguments.add_argument("base_score", type=int, required=False)
 platform_arguments.add_argument("group_id", type=int, required=False)
 
 search_arguments = reqparse.RequestParser()
-search_arguments.add_argument("q", type=str, required=False)
+search_arguments.add_argument("q", type=str, required=False, location="args")
 
 for key in ["platform_base", "platform", "platform_group"]:
     model = getattr(models, key)
@@ -32,7 +33,9 @@ class PlatformList(InjectedResource):
     """List all platforms"""
 
     @api.doc("list_platforms")
-    @pagination.wrap(api, models.platform, arguments=[search_arguments])
+    @pagination.wrap(
+        api, models.platform, arguments=[search_arguments], keys=[Key(Platform.id)]
+    )
     def get(self):
         """List all platforms"""
         query = self.query(Platform)
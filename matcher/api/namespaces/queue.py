@@ -29,7 +29,7 @@ class Queue(InjectedResource):
 
     @api.doc("queue_object")
     def post(self):
-        """Queue a new object for insertion"""
+        """Queue a new object for insertion, see also ``matcher gateway``"""
         # FIXME: works but is quite ugly
 
         scrap_id = request.headers.get("x-scrap-id", None)
@@ -1,9 +1,13 @@
+from datetime import timedelta
+
 import pendulum
 from flask_restplus import Namespace, abort, reqparse
-from sqlalchemy import DATE, Interval, cast, func
+from flask_restplus.inputs import date
 
+from matcher.pagination import Key
 from matcher.scheme.enums import ScrapStatus
 from matcher.scheme.platform import Platform, Scrap
+from matcher.scheme.stats import ScrapRollup
 
 from .. import inputs, models, pagination
 from ..resources import InjectedResource
@@ -32,7 +36,7 @@ class ScrapList(InjectedResource):
     """List and create scraps"""
 
     @api.doc("list_scraps")
-    @pagination.wrap(api, models.scrap)
+    @pagination.wrap(api, models.scrap, keys=[Key(Scrap.id)])
     def get(self):
         """List all scraps"""
         return self.query(Scrap)
@@ -55,7 +59,7 @@ class ScrapList(InjectedResource):
         scrap = Scrap(platform=platform, status=ScrapStatus.SCHEDULED)
 
         if args["status"]:
-            scrap.to_status(args["status"])
+            scrap.to_status(args["status"], celery=self.celery)
 
         self.session.add(scrap)
         self.session.commit()
@@ -94,46 +98,59 @@ class ScrapItem(InjectedResource):
             scrap.stats = args["stats"]
 
         if args["status"]:
-            scrap.to_status(args["status"])
+            scrap.to_status(args["status"], celery=self.celery)
 
         self.session.commit()
 
         return scrap
 
 
+stats_arguments = reqparse.RequestParser()
+stats_arguments.add_argument("start", required=False, type=date, location="args")
+stats_arguments.add_argument("end", required=False, type=date, location="args")
+stats_arguments.add_argument(
+    "granularity",
+    required=False,
+    default="day",
+    choices=ScrapRollup.GRANULARITIES,
+    location="args",
+)
+stats_arguments.add_argument(
+    "platform", required=False, action="append", location="args"
+)
+
+
 @api.route("/stats")
 class ScrapStats(InjectedResource):
-    """Show statistics about last scraps"""
+    """Show statistics about the finished scraps"""
 
+    @api.doc("scrap_stats")
+    @api.expect(stats_arguments)
     def get(self):
-        now = pendulum.now()
-        series = self.query(
-            cast(
-                func.generate_series(
-                    cast(now.subtract(weeks=1), type_=DATE),
-                    cast(now, type_=DATE),
-                    cast("1 day", type_=Interval),
-                ),
-                type_=DATE,
-            ).label("timestep")
-        ).subquery()
-
-        stats = (
-            self.query(
-                series.c.timestep, func.count(Scrap.id), func.sum(Scrap.links_count)
-            )
-            .outerjoin(
-                (
-                    Scrap,
-                    cast(Scrap.date, type_=DATE) == cast(series.c.timestep, type_=DATE),
-                )
-            )
-            .group_by(series.c.timestep)
-            .order_by(series.c.timestep)
-            .all()
+        """Count the scraps and what they found, by day, week, month or year
+
+        The last week is shown by default.
+        """
+        args = stats_arguments.parse_args()
+        end = args["end"] or pendulum.today().date()
+        start = args["start"] or end - timedelta(weeks=1)
+        if start > end:
+            abort(400, "The start of the range is after its end")
+
+        platforms = None
+        if args["platform"]:
+            platforms = []
+            for key in args["platform"]:
+                platform = Platform.lookup(self.session, key)
+                if platform is None:
+                    abort(404, "Platform not found")
+                platforms.append(platform.id)
+
+        stats = ScrapRollup.series(
+            self.session, start, end, args["granularity"], platforms=platforms
         )
 
         return {
-            str(date): {"scraps": int(scraps), "items": int(items)}
-            for (date, scraps, items) in stats
+            str(day): {"scraps": scraps, "items": links, "objects": objects}
+            for (day, scraps, links, objects) in stats
         }
@@ -1,11 +1,35 @@
 from functools import wraps
 
-from flask_restplus import Model, fields, reqparse
+from flask_restplus import Model, abort, fields, inputs, reqparse
+
+from matcher.pagination import InvalidCursor, keyset_paginate
 
 pagination_arguments = reqparse.RequestParser()
-pagination_arguments.add_argument("page", type=int, required=False, default=1)
 pagination_arguments.add_argument(
-    "per_page", type=int, required=False, choices=[5, 10, 20, 30, 40, 50], default=10
+    "page", type=int, required=False, default=1, location="args"
+)
+pagination_arguments.add_argument(
+    "per_page",
+    type=int,
+    required=False,
+    choices=[5, 10, 20, 30, 40, 50],
+    default=10,
+    location="args",
+)
+pagination_arguments.add_argument(
+    "cursor",
+    type=str,
+    required=False,
+    location="args",
+    help="Use keyset pagination, starting after this cursor (empty for the start)",
+)
+pagination_arguments.add_argument(
+    "total",
+    type=inputs.boolean,
+    required=False,
+    default=False,
+    location="args",
+    help="Count the results when using keyset pagination",
 )
 
 
@@ -18,11 +42,19 @@ model = Model(
         "total": fields.Integer(description="Total number of results"),
         "has_next": fields.Boolean(description="Does it have a next page?"),
         "has_prev": fields.Boolean(description="Does it have a previous page?"),
+        "next_cursor": fields.String(description="Cursor of the next page"),
+        "prev_cursor": fields.String(description="Cursor of the previous page"),
     },
 )
 
 
-def wrap(api, _model, arguments=[]):
+def wrap(api, _model, arguments=[], keys=None):
+    """Paginate the query returned by a resource.
+
+    When ordering keys are given, the results can also be paginated with a
+    cursor, which stays fast deep into big tables, see :mod:`matcher.pagination`.
+    """
+
     def decorator(func):
         api.add_model("Pagination", model)
         wrapped_model = api.model(
@@ -37,7 +69,24 @@ def wrap(api, _model, arguments=[]):
         @api.expect(pagination_arguments, *arguments)
         @wraps(func)
         def f(*args, **kwargs):
-            pagination = func(*args, **kwargs).paginate()
+            query = func(*args, **kwargs)
+            # Page numbers are read by `paginate` itself
+            params = pagination_arguments.parse_args() if keys is not None else {}
+
+            if params.get("cursor") is not None:
+                try:
+                    pagination = keyset_paginate(
+                        query,
+                        keys,
+                        cursor=params["cursor"] or None,
+                        per_page=params["per_page"],
+                        total=params["total"],
+                    )
+                except InvalidCursor:
+                    abort(400, "Invalid cursor")
+            else:
+                pagination = query.paginate()
+
             return {"items": pagination.items, "pagination": pagination}
 
         return f
@@ -0,0 +1,141 @@
+from matcher.scheme.enums import ExternalObjectType, ValueType
+from matcher.scheme.object import Episode, ExternalObject, ObjectLink
+from matcher.scheme.platform import Platform
+from matcher.scheme.search import ObjectSearch
+from matcher.scheme.value import Value, ValueSource
+
+
+def test_search(client, session):
+    platforms = [
+        Platform(name="Platform {}".format(i), slug="platform-{}".format(i))
+        for i in range(2)
+    ]
+
+    def movie(titles, platforms):
+        return ExternalObject(
+            type=ExternalObjectType.MOVIE,
+            values=[
+                Value(
+                    type=ValueType.TITLE,
+                    text=title,
+                    sources=[ValueSource(platform=platforms[0], score_factor=1)],
+                )
+                for title in titles
+            ],
+            links=[
+                ObjectLink(platform=platform, external_id=titles[0])
+                for platform in platforms
+            ],
+        )
+
+    # The fifth title of an object is still searchable
+    titles = ["Le Fabuleux Destin", "Die fabelhafte Welt", "Il favoloso mondo"]
+    amelie = movie(titles + ["El fabuloso destino", "Amélie"], platforms)
+    other = movie(["Amelie", "Another one"], platforms[:1])
+    unrelated = movie(["Something else"], platforms)
+    session.add_all(platforms + [amelie, other, unrelated])
+    session.commit()
+
+    ObjectSearch.refresh(session)
+    session.commit()
+
+    # Without accents, the object found on more platforms first
+    response = client.get("/api/objects/search?q=amelie")
+    assert [item["id"] for item in response.json["items"]] == [amelie.id, other.id]
+    assert response.json["items"][0]["type"] == "movie"
+
+    # With a typo
+    response = client.get("/api/objects/search?q=fabuleus destin")
+    assert [item["id"] for item in response.json["items"]] == [amelie.id]
+
+    response = client.get("/api/objects/search?q=amelie&per_page=5&cursor=")
+    assert response.json["pagination"]["has_next"] is False
+
+    response = client.get("/api/objects/search?q=amelie&cursor=nope")
+    assert response.status_code == 400
+
+
+def test_detail(client, session):
+    platform = Platform(name="Platform", slug="platform")
+    obj = ExternalObject(
+        type=ExternalObjectType.MOVIE,
+        values=[
+            Value(
+                type=ValueType.TITLE,
+                text="Title {}".format(i),
+                sources=[ValueSource(platform=platform, score_factor=1)],
+            )
+            for i in range(3)
+        ],
+        links=[ObjectLink(platform=platform, external_id=str(i)) for i in range(7)],
+    )
+    session.add_all([platform, obj])
+    session.commit()
+
+    response = client.get("/api/objects/{}".format(obj.id))
+    assert response.json["links_count"] == 7
+    assert response.json["values_count"] == 3
+    assert response.json["episodes_count"] is None
+
+    # The links are paged through with a cursor
+    response = client.get("/api/objects/{}/links?per_page=5&cursor=".format(obj.id))
+    items = response.json["items"]
+    cursor = response.json["pagination"]["next_cursor"]
+    response = client.get(
+        "/api/objects/{}/links?per_page=5&cursor={}".format(obj.id, cursor)
+    )
+    items += response.json["items"]
+    assert response.json["pagination"]["has_next"] is False
+    assert [item["external_id"] for item in items] == [str(i) for i in range(7)]
+
+    response = client.get("/api/objects/{}/values".format(obj.id))
+    assert [item["text"] for item in response.json["items"]] == [
+        "Title 0",
+        "Title 1",
+        "Title 2",
+    ]
+    assert response.json["items"][0]["sources"][0]["platform"]["slug"] == "platform"
+
+    response = client.get("/api/objects/{}/links".format(obj.id + 1))
+    assert response.status_code == 404
+
+
+def test_episodes(client, session):
+    series = ExternalObject(type=ExternalObjectType.SERIES)
+    numbers = [(2, 1), (1, 2), (None, None), (1, 1), (2, 2), (1, 3), (None, None)]
+    episodes = [
+        Episode(
+            external_object=ExternalObject(type=ExternalObjectType.EPISODE),
+            series=series,
+            season=season,
+            episode=episode,
+        )
+        for (season, episode) in numbers
+    ]
+    session.add_all([series] + episodes)
+    session.commit()
+
+    def key(episode):
+        return (episode.season is None, episode.season, episode.episode)
+
+    expected = [
+        episode.external_object_id
+        for episode in sorted(episodes, key=lambda e: (key(e), e.external_object_id))
+    ]
+
+    # Without a cursor, the episodes are paged through by number
+    response = client.get("/api/objects/{}/episodes".format(series.id))
+    assert response.status_code == 200
+    assert [item["id"] for item in response.json["items"]] == expected
+
+    response = client.get(
+        "/api/objects/{}/episodes?per_page=5&cursor=".format(series.id)
+    )
+    items = response.json["items"]
+    cursor = response.json["pagination"]["next_cursor"]
+    response = client.get(
+        "/api/objects/{}/episodes?per_page=5&cursor={}".format(series.id, cursor)
+    )
+    items += response.json["items"]
+    assert response.json["pagination"]["has_next"] is False
+    assert [item["id"] for item in items] == expected
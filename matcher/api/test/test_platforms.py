@@ -22,6 +22,38 @@ def test_list(client, session):
     ]
 
 
+def test_list_cursor(client, session):
+    platforms = [
+        Platform(name="foo", slug="foo-{}".format(i), type=PlatformType.INFO)
+        for i in range(7)
+    ]
+    session.add_all(platforms)
+    session.commit()
+    ids = sorted(platform.id for platform in platforms)
+
+    response = client.get("/api/platforms/?cursor=&per_page=5&total=true")
+    assert [item["id"] for item in response.json["items"]] == ids[:5]
+    pagination = response.json["pagination"]
+    assert pagination["total"] == 7
+    assert pagination["has_next"] and not pagination["has_prev"]
+
+    response = client.get(
+        "/api/platforms/?cursor={}&per_page=5".format(pagination["next_cursor"])
+    )
+    assert [item["id"] for item in response.json["items"]] == ids[5:]
+    pagination = response.json["pagination"]
+    assert pagination["total"] is None, "the total is only counted when asked"
+    assert pagination["has_prev"] and not pagination["has_next"]
+
+    response = client.get(
+        "/api/platforms/?cursor={}&per_page=5".format(pagination["prev_cursor"])
+    )
+    assert [item["id"] for item in response.json["items"]] == ids[:5]
+
+    response = client.get("/api/platforms/?cursor=garbage")
+    assert response.status_code == 400
+
+
 def test_create(client, session):
     response = client.post(
         "/api/platforms/",
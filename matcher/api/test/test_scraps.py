@@ -177,3 +177,51 @@ def test_put_transitions(from_status, to_status, valid, client, session, platfor
     else:
         assert response.status_code == HTTPStatus.BAD_REQUEST
         assert response.json["type"] == "invalid_transition"
+
+
+def test_stats(client, session, platform):
+    day = datetime(2019, 3, 4, 12)
+    scraps = [
+        Scrap(platform=platform, status=ScrapStatus.RUNNING, date=day)
+        for _ in range(4)
+    ]
+    session.add_all(scraps)
+    session.commit()
+
+    statuses = [
+        ScrapStatus.SUCCESS,
+        ScrapStatus.FAILED,
+        ScrapStatus.ABORTED,
+        ScrapStatus.FAILED,
+    ]
+    for (scrap, status) in zip(scraps, statuses):
+        scrap.to_status(status)
+        session.commit()
+
+    # The last one is rescheduled, and only counted once it finishes again
+    for status in [ScrapStatus.SCHEDULED, ScrapStatus.RUNNING]:
+        scraps[3].to_status(status)
+        session.commit()
+    scraps[3].date = day
+    scraps[3].to_status(ScrapStatus.SUCCESS)
+    session.commit()
+
+    # Aborted scraps are not counted
+    response = client.get(
+        "/api/scraps/stats?start=2019-03-01&end=2019-03-31&granularity=week"
+    )
+    assert response.json == {
+        "2019-02-25": {"scraps": 0, "items": 0, "objects": 0},
+        "2019-03-04": {"scraps": 3, "items": 0, "objects": 0},
+        "2019-03-11": {"scraps": 0, "items": 0, "objects": 0},
+        "2019-03-18": {"scraps": 0, "items": 0, "objects": 0},
+        "2019-03-25": {"scraps": 0, "items": 0, "objects": 0},
+    }
+
+    response = client.get(
+        "/api/scraps/stats?start=2019-03-04&end=2019-03-04&platform=" + platform.slug
+    )
+    assert response.json == {"2019-03-04": {"scraps": 3, "items": 0, "objects": 0}}
+
+    response = client.get("/api/scraps/stats?start=2019-03-04&end=2019-03-01")
+    assert response.status_code == HTTPStatus.BAD_REQUEST
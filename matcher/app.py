@@ -19,6 +19,8 @@ from raven.contrib.flask import Sentry
 
 from .commands import setup_cli
 from .filters import register as register_filters
+from .metrics import setup_metrics
+from .profiler import setup_profiler
 from .scheme import metadata
 
 db = SQLAlchemy(metadata=metadata)
@@ -139,6 +141,8 @@ def create_app(info=None):
 
     app.jinja_env.add_extension("jinja2.ext.do")
     register_filters(app)
+    setup_metrics(app)
+    setup_profiler(app)
 
     DebugToolbarExtension(app=app)
     Migrate(
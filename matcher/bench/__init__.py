@@ -0,0 +1,9 @@
+"""Benchmarks of the ingest, import, match and export hot paths.
+
+They run against a real PostgreSQL database filled with synthetic data, see
+the ``matcher bench`` command.
+"""
+from .data import DataGenerator
+from .suite import BENCHMARKS, run, write_report
+
+__all__ = ["BENCHMARKS", "DataGenerator", "run", "write_report"]
@@ -0,0 +1,164 @@
+"""Synthetic data for the benchmarks.
+
+The data mimics what the scrapers and imports bring: a handful of VOD
+platforms from different countries, and titles in several languages that are
+found with slight variations on more than one platform.
+
+"""
+import random
+from typing import Any, Dict, List, Tuple
+
+from matcher.scheme.enums import ExternalObjectType, PlatformType, ValueType
+from matcher.scheme.object import ExternalObject, ObjectLink
+from matcher.scheme.platform import Platform
+from matcher.scheme.value import Value, ValueSource
+
+__all__ = ["DataGenerator"]
+
+# Words used to build the titles, by language
+WORDS = {
+    "en": "the last night secret of house river kings dark summer lost city war",
+    "fr": "la dernière nuit secret maison rivière rois été perdu ville château",
+    "de": "der die letzte nacht geheimnis haus fluss könige sommer stadt straße",
+    "es": "el la última noche secreto casa río reyes verano ciudad guerra niño",
+    "it": "il la ultima notte segreto casa fiume buio estate città guerra storia",
+}
+WORDS = {language: words.split() for (language, words) in WORDS.items()}
+
+COUNTRIES = ["FR", "DE", "GB", "ES", "IT", "US", "BE", "NL"]
+
+GENRES = ["Drama", "Comedy", "Thriller", "Documentary", "Animation", "Horror"]
+
+
+class DataGenerator(object):
+    """Generate realistic looking objects, deterministically.
+
+    Parameters
+    ----------
+    session : sqlalchemy.orm.session.Session
+    seed : int
+        the same seed always generates the same data
+    platforms : int
+        how many platforms to create
+
+    """
+
+    def __init__(self, session, seed=0, platforms=8):
+        self.session = session
+        self.random = random.Random(seed)
+        self.platform_count = platforms
+        self.platforms = []  # type: List[Platform]
+        self._next_id = 0
+
+    def setup(self) -> List[Platform]:
+        """Create the platforms"""
+        self.platforms = [
+            Platform(
+                name="Bench Platform {}".format(index),
+                slug="bench-{}".format(index),
+                country=COUNTRIES[index % len(COUNTRIES)],
+                type=[PlatformType.TVOD, PlatformType.SVOD][index % 2],
+            )
+            for index in range(self.platform_count)
+        ]
+        self.session.add_all(self.platforms)
+        self.session.commit()
+        return self.platforms
+
+    def external_id(self) -> str:
+        self._next_id += 1
+        return "bench-{:08d}".format(self._next_id)
+
+    def title(self, language=None) -> str:
+        language = language or self.random.choice(list(WORDS))
+        words = self.random.sample(WORDS[language], self.random.randint(2, 5))
+        return " ".join(words).capitalize()
+
+    def variant(self, title: str) -> str:
+        """A slightly different version of a title, as another platform has it"""
+        return self.random.choice(
+            [
+                title,
+                title.upper(),
+                title + " ({})".format(self.random.randint(1950, 2020)),
+                title.replace(" ", " - ", 1),
+            ]
+        )
+
+    def attributes(self, title: str) -> Dict[str, Any]:
+        return {
+            "title": [title, self.title()],
+            "date": str(self.random.randint(1950, 2020)),
+            "country": self.random.sample(COUNTRIES, self.random.randint(1, 2)),
+            "genres": self.random.sample(GENRES, 2),
+            "duration": str(self.random.randint(20, 180)),
+        }
+
+    def scrap_payloads(self, count: int, platform: Platform) -> List[dict]:
+        """Raw payloads, as sent by the scrapers to `insert_dict`"""
+        return [
+            {
+                "type": "movie",
+                "attributes": self.attributes(self.title()),
+                "links": [{"platform": platform.slug, "id": self.external_id()}],
+            }
+            for _ in range(count)
+        ]
+
+    def import_rows(
+        self, count: int
+    ) -> List[Tuple[List[int], List[Tuple[ValueType, List[str]]], list]]:
+        """Rows, as given to `ImportFile.process_row`"""
+        rows = []
+        for _ in range(count):
+            platforms = self.random.sample(self.platforms, 2)
+            attributes = [
+                (ValueType.TITLE, [self.title()]),
+                (ValueType.DATE, [str(self.random.randint(1950, 2020))]),
+                (ValueType.COUNTRY, self.random.sample(COUNTRIES, 1)),
+            ]
+            links = [(platform, [self.external_id()]) for platform in platforms]
+            rows.append(([], attributes, links))
+        return rows
+
+    def objects(self, count: int, duplicates=0.3) -> List[ExternalObject]:
+        """Create linked objects with their values.
+
+        A share of the objects is created again on another platform with a
+        variant of the title, so that the matcher has pairs to find.
+        """
+        objects = []
+        while len(objects) < count:
+            title = self.title()
+            attributes = self.attributes(title)
+            copies = 2 if self.random.random() < duplicates else 1
+
+            for platform in self.random.sample(self.platforms, copies):
+                texts = {
+                    (ValueType.from_name(type), text)
+                    for (type, values) in attributes.items()
+                    for text in ([values] if isinstance(values, str) else values)
+                }
+                texts.add((ValueType.TITLE, self.variant(title)))
+
+                values = []
+                for (type, text) in sorted(texts, key=str):
+                    source = ValueSource(platform=platform, score_factor=1)
+                    values.append(Value(type=type, text=text, sources=[source]))
+
+                objects.append(
+                    ExternalObject(
+                        type=ExternalObjectType.MOVIE,
+                        values=values,
+                        links=[
+                            ObjectLink(
+                                platform=platform, external_id=self.external_id()
+                            )
+                        ],
+                    )
+                )
+
+        objects = objects[:count]
+        self.session.add_all(objects)
+        self.session.commit()
+        return objects
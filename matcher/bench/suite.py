@@ -0,0 +1,255 @@
+"""The benchmarks themselves.
+
+Each benchmark prepares its data, times the hot path with a :obj:`Timer`, and
+returns how many items it processed. :func:`run` collects the results in a
+report that can be saved as JSON, one file per commit.
+
+"""
+import json
+import logging
+import subprocess
+import time
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+
+from matcher.scheme.enums import (
+    ExportFileStatus,
+    ExportRowType,
+    ExternalObjectType,
+    ImportFileStatus,
+    ScrapStatus,
+)
+from matcher.scheme.export import ExportFile, ExportTemplate
+from matcher.scheme.import_ import ImportFile
+from matcher.scheme.object import ExternalObject
+from matcher.scheme.platform import Scrap, Session
+from matcher.scheme.views import (
+    AttributesView,
+    PlatformSourceOrderByValueType,
+    ValueScoreView,
+)
+
+from .data import DataGenerator
+
+__all__ = ["BENCHMARKS", "Timer", "run", "write_report"]
+
+logger = logging.getLogger(__name__)
+
+BENCHMARKS = OrderedDict()
+"""The registered benchmarks, as (function, unit) by name"""
+
+
+def benchmark(name, unit):
+    """Register a benchmark.
+
+    The function is called with a :obj:`.data.DataGenerator`, the scale of the
+    run and a :obj:`Timer`, and returns the number of ``unit`` processed.
+    """
+
+    def decorator(func):
+        BENCHMARKS[name] = (func, unit)
+        return func
+
+    return decorator
+
+
+class Timer(object):
+    """Accumulate the time spent in a ``with`` block."""
+
+    def __init__(self):
+        self.elapsed = 0.0
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed += time.perf_counter() - self._start
+
+
+@benchmark("insert_dict", "objects")
+def bench_insert_dict(data, scale, timer):
+    session = data.session
+    platform = data.platforms[0]
+    scrap = Scrap(platform=platform, status=ScrapStatus.RUNNING)
+    session.add(scrap)
+    session.commit()
+
+    payloads = [
+        ExternalObject.normalize_dict(payload)
+        for payload in data.scrap_payloads(100 * scale, platform)
+    ]
+
+    with timer:
+        for payload in payloads:
+            ExternalObject.insert_dict(payload, scrap)
+
+    return len(payloads)
+
+
+@benchmark("process_row", "rows")
+def bench_process_row(data, scale, timer):
+    session = data.session
+    file = ImportFile(
+        filename="bench.csv",
+        status=ImportFileStatus.PROCESSING,
+        fields={},
+        platform=data.platforms[0],
+        imported_external_object_type=ExternalObjectType.MOVIE,
+    )
+    session.add(file)
+    session.commit()
+
+    rows = data.import_rows(100 * scale)
+
+    with timer:
+        for (external_object_ids, attributes, links) in rows:
+            file.process_row(external_object_ids, attributes, links, session=session)
+
+    return len(rows)
+
+
+@benchmark("similar", "pairs")
+def bench_similar(data, scale, timer):
+    objects = data.objects(200 * scale)
+    ids = [obj.id for obj in objects[: 20 * scale]]
+
+    pairs = 0
+    with timer:
+        for id in ids:
+            obj = data.session.query(ExternalObject).get(id)
+            pairs += sum(1 for _ in obj.similar())
+
+    return pairs
+
+
+@benchmark("export", "rows")
+def bench_export(data, scale, timer):
+    session = data.session
+    objects = data.objects(500 * scale)
+
+    scrap = Scrap(
+        platform=data.platforms[0],
+        status=ScrapStatus.SUCCESS,
+        links=[link for obj in objects for link in obj.links],
+    )
+    scrap_session = Session(name="bench", scraps=[scrap])
+    session.add_all([scrap, scrap_session])
+    session.commit()
+    scrap_session.refresh_links(session=session)
+    AttributesView.refresh(session=session, concurrently=False)
+    session.commit()
+
+    template = ExportTemplate(
+        external_object_type=ExternalObjectType.MOVIE,
+        row_type=ExportRowType.OBJECT_LINK,
+        fields=[
+            {"name": "ID", "value": "external_object.id"},
+            {"name": "Titles", "value": "attributes.titles | join(', ')"},
+            {"name": "Countries", "value": "attributes.countries | join(', ')"},
+            {"name": "Platform", "value": "platform.name"},
+        ],
+    )
+    file = ExportFile(
+        template=template,
+        session=scrap_session,
+        status=ExportFileStatus.QUERYING,
+        path="bench",
+        filters={},
+    )
+    session.add(file)
+    session.commit()
+
+    with timer:
+        rows = sum(1 for _ in file.render_rows(session=session))
+
+    return rows
+
+
+@benchmark("refresh_views", "views")
+def bench_refresh_views(data, scale, timer):
+    data.objects(500 * scale)
+    views = [ValueScoreView, PlatformSourceOrderByValueType, AttributesView]
+
+    with timer:
+        for view in views:
+            view.refresh(session=data.session, concurrently=False)
+            data.session.commit()
+
+    return len(views)
+
+
+def current_commit():
+    """The commit the code runs from, if it can be found"""
+    try:
+        return (
+            subprocess.check_output(
+                ["git", "rev-parse", "HEAD"],
+                cwd=str(Path(__file__).parent),
+                stderr=subprocess.DEVNULL,
+            )
+            .decode()
+            .strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(session, scale=1, seed=0, only=None):
+    """Run the benchmarks against an empty database.
+
+    Parameters
+    ----------
+    session : sqlalchemy.orm.session.Session
+    scale : int
+        multiplies the amount of generated data
+    seed : int
+        seed of the data generator
+    only : list of str, optional
+        only run those benchmarks
+
+    Returns
+    -------
+    dict
+        the report, with the rate of each benchmark
+
+    """
+    data = DataGenerator(session, seed=seed)
+    data.setup()
+
+    results = []
+    for (name, (func, unit)) in BENCHMARKS.items():
+        if only and name not in only:
+            continue
+
+        timer = Timer()
+        count = func(data, scale, timer)
+        rate = count / timer.elapsed if timer.elapsed else None
+        logger.info("%s: %d %s in %.2fs", name, count, unit, timer.elapsed)
+
+        results.append(
+            {
+                "name": name,
+                "unit": unit,
+                "count": count,
+                "seconds": timer.elapsed,
+                "rate": rate,
+            }
+        )
+
+    return {
+        "commit": current_commit(),
+        "date": datetime.now().isoformat(),
+        "scale": scale,
+        "seed": seed,
+        "results": results,
+    }
+
+
+def write_report(report, path):
+    """Save a report as JSON"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("w") as file:
+        json.dump(report, file, indent=2)
@@ -0,0 +1,35 @@
+from matcher.bench import BENCHMARKS, DataGenerator, run, write_report
+
+
+class TestDataGenerator(object):
+    def test_deterministic(self):
+        first = DataGenerator(None, seed=42)
+        second = DataGenerator(None, seed=42)
+        assert [first.title() for _ in range(10)] == [
+            second.title() for _ in range(10)
+        ], "the same seed should generate the same titles"
+
+    def test_objects(self, session):
+        data = DataGenerator(session, platforms=2)
+        data.setup()
+
+        objects = data.objects(10)
+        assert len(objects) == 10
+        assert all(len(obj.links) == 1 for obj in objects)
+        assert all(obj.values for obj in objects)
+
+
+class TestSuite(object):
+    def test_run(self, session, tmp_path):
+        only = ["insert_dict", "process_row", "export"]
+        report = run(session, scale=1, only=only)
+
+        assert [result["name"] for result in report["results"]] == only
+        for result in report["results"]:
+            assert result["unit"] == BENCHMARKS[result["name"]][1]
+            assert result["count"] > 0
+            assert result["seconds"] > 0
+
+        path = tmp_path / "results" / "bench.json"
+        write_report(report, str(path))
+        assert path.exists()
@@ -1,5 +1,4 @@
 from datetime import datetime
-from operator import attrgetter
 from pathlib import Path
 
 import click
@@ -133,6 +132,33 @@ def worker(celery_options):
     celery.worker_main(["matcher worker"] + list(celery_options))
 
 
+@click.command()
+@with_appcontext
+@click.option("--host", default="0.0.0.0", show_default=True)
+@click.option("--port", "-p", type=int, default=8080, show_default=True)
+@click.option("--batch-size", "-b", type=int)
+@click.option("--max-pending", "-m", type=int)
+def gateway(host, port, batch_size, max_pending):
+    """Stream the objects of the scrapers to the workers"""
+    from flask import current_app
+
+    from matcher import celery
+    from matcher.gateway import serve
+
+    from .app import db
+
+    config = current_app.config
+    serve(
+        engine=db.engine,
+        celery=celery,
+        host=host,
+        port=port,
+        scrap_ttl=config["GATEWAY_SCRAP_TTL"],
+        batch_size=batch_size or config["GATEWAY_BATCH_SIZE"],
+        max_pending=max_pending or config["GATEWAY_MAX_PENDING"],
+    )
+
+
 @click.command()
 @with_appcontext
 @click.confirmation_option(
@@ -153,6 +179,7 @@ def nuke():
         "scrap",
         "object_link",
         "external_object",
+        "merge_candidate",
     ]:
         sql = "TRUNCATE TABLE {} RESTART IDENTITY CASCADE".format(table)
         click.echo(sql)
@@ -171,6 +198,14 @@ def nuke():
 @click.option("--offset", "-o", type=int)
 @click.option("--limit", "-l", type=int)
 @click.option("--all/--not-all", "-a/-A", default=False)
+@click.option(
+    "--store/--no-store",
+    default=True,
+    show_default=True,
+    help="Save the candidates for the merge command",
+)
+@click.option("--echo", is_flag=True, help="Print the candidates as TSV")
+@click.option("--stats", is_flag=True, help="Print the time spent in each criteria")
 def match(
     scrap=None,
     platform=None,
@@ -179,6 +214,9 @@ def match(
     type=None,
     limit=None,
     all=False,
+    store=True,
+    echo=False,
+    stats=False,
 ):
     """Try to match ExternalObjects with each other"""
     from .scheme.platform import Scrap
@@ -228,7 +266,19 @@ def match(
     q = q.options(lazyload(ExternalObject.values).undefer(Value.cached_score))
 
     objs = q[offset:limit]
-    ExternalObject.match_objects(objs)
+    found = ExternalObject.match_objects(objs, store=store, echo=echo, stats=stats)
+    click.echo("Found {} candidates".format(found), err=True)
+
+    if stats:
+        from .utils import trace_stats
+
+        for (name, entry) in sorted(trace_stats.items()):
+            click.echo(
+                "{}: {} calls, {:.3f}s total, {:.3f}ms mean, {:.3f}ms max".format(
+                    name, entry.calls, entry.total, entry.mean * 1000, entry.max * 1000
+                ),
+                err=True,
+            )
 
 
 @click.command()
@@ -236,31 +286,49 @@ def match(
 @click.option("--threshold", "-t", prompt=True, type=float)
 @click.option("--invert", "-v", is_flag=True)
 @click.option("--interactive/--non-interactive", "-i/-I", default=True)
-@click.argument("input", type=click.File("r"))
-def merge(threshold, invert, interactive, input):
-    """Merge candidates above a given threshold"""
-    from .scheme.object import MergeCandidate, ExternalObject
+@click.option("--batch-size", "-b", type=int, default=100, show_default=True)
+@click.option("--limit", "-l", type=int)
+@click.argument("input", type=click.File("r"), required=False)
+def merge(threshold, invert, interactive, batch_size, limit, input):
+    """Merge candidates above a given threshold
 
-    lines = input.readlines()
+    Candidates are read from the ones saved by the match command. A TSV file
+    of candidates can also be given, it will be saved before merging.
+    """
+    from .app import db
+    from .scheme.merge import MergeCandidate
+    from .scheme.object import ScoredCandidate
 
-    candidates = []
+    if input is not None:
+        candidates = []
 
-    for line in lines:
-        src, dest, score = line.split("\t")
-        if invert:
-            src, dest = dest, src
+        for line in input:
+            src, dest, score = line.split("\t")
+            if invert:
+                src, dest = dest, src
 
-        candidate = MergeCandidate(obj=int(src), into=int(dest), score=float(score))
-        if candidate.score >= threshold:
-            candidates.append(candidate)
+            candidates.append(
+                ScoredCandidate(obj=int(src), into=int(dest), score=float(score))
+            )
 
-    candidates = sorted(candidates, key=attrgetter("score"), reverse=True)
+        MergeCandidate.bulk_insert(candidates, session=db.session)
+        db.session.commit()
 
     if interactive:
-        click.echo_via_pager("\n".join([repr(c) for c in candidates]))
+        queue = MergeCandidate.queue(db.session, threshold=threshold)
+        if limit is not None:
+            queue = queue.limit(limit)
+        click.echo_via_pager("\n".join([repr(c) for c in queue]))
 
     if not interactive or click.confirm("Merge?"):
-        ExternalObject.merge_candidates(candidates)
+        counts = MergeCandidate.process(
+            db.session, threshold=threshold, batch_size=batch_size, limit=limit
+        )
+        click.echo(
+            "Merged {merged}, failed {failed}".format(
+                merged=counts["merged"], failed=counts["failed"]
+            )
+        )
 
 
 @click.command("import")
@@ -270,10 +338,26 @@ def merge(threshold, invert, interactive, input):
 )
 @click.option("--attribute", "-a", "attributes", multiple=True, type=(int, VALUE_TYPE))
 @click.option("--platform", "-p", "attr_platform", prompt=True, type=PLATFORM)
+@click.option(
+    "--chunk-size",
+    "-c",
+    type=int,
+    default=500,
+    show_default=True,
+    help="How many rows are commited at once",
+)
+@click.option(
+    "--checkpoint",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Save the progress in this file, and resume from it if it exists",
+)
 @click.argument("input", type=click.File("r"))
-def import_csv(external_ids, attributes, attr_platform, input):
+def import_csv(external_ids, attributes, attr_platform, chunk_size, checkpoint, input):
     """Import data from a CSV file"""
     import csv
+    import itertools
+    from sqlalchemy import or_, tuple_
+    from sqlalchemy.orm import selectinload
     from .app import db
     from .scheme.object import ExternalObject, ObjectLink
     from .scheme.value import ValueSource, Value
@@ -291,200 +375,298 @@ def import_csv(external_ids, attributes, attr_platform, input):
         print("SKIPPING HEADER")
         rows.__next__()
 
-    it = tqdm(rows)
-    for row in it:
-        id = row[0]
-        obj = db.session.query(ExternalObject).get(id)
+    # The checkpoint holds the number of rows already commited
+    done = 0
+    if checkpoint is not None and Path(checkpoint).exists():
+        done = int(Path(checkpoint).read_text().strip() or 0)
+        print("RESUMING AFTER ROW {}".format(done))
+        rows = itertools.islice(rows, done, None)
+
+    platform_ids = [platform.id for _, platform in external_ids]
+
+    def prefetch(chunk):
+        """Fetch the objects and links used by a chunk in two queries"""
+        ids = {row[0] for row in chunk}
+        objects = {
+            str(obj.id): obj
+            for obj in db.session.query(ExternalObject)
+            .filter(ExternalObject.id.in_(ids))
+            .options(selectinload(ExternalObject.values).selectinload(Value.sources))
+        }
+
+        pairs = {
+            (platform.id, row[index])
+            for row in chunk
+            for index, platform in external_ids
+            if row[index]
+        }
+        conditions = [
+            (ObjectLink.external_object_id.in_(ids))
+            & (ObjectLink.platform_id.in_(platform_ids))
+        ]
+        if pairs:
+            conditions.append(
+                tuple_(ObjectLink.platform_id, ObjectLink.external_id).in_(pairs)
+            )
 
-        if not obj:
-            it.write("SKIP " + id)
-            continue
+        by_id, by_object = {}, {}
+        for link in db.session.query(ObjectLink).filter(or_(*conditions)):
+            by_id.setdefault((link.platform_id, link.external_id), link)
+            by_object.setdefault((link.external_object_id, link.platform_id), link)
 
-        for index, type in attributes:
-            values = [t for t in row[index].split(",") if t]
-            for value in values:
-                obj.add_attribute({"type": type, "text": value}, attr_platform)
+        return objects, by_id, by_object
 
-        db.session.commit()
+    it = tqdm(rows, initial=done)
+    while True:
+        chunk = list(itertools.islice(it, chunk_size))
+        if not chunk:
+            break
+
+        objects, by_id, by_object = prefetch(chunk)
 
-        for index, platform in external_ids:
-            external_id = row[index]
+        for row in chunk:
+            id = row[0]
+            obj = objects.get(id)
 
-            if not external_id:
-                it.write("> SKIP {} ({})".format(id, platform.slug))
+            if not obj:
+                it.write("SKIP " + id)
                 continue
 
-            if not platform.allow_links_overlap:
-                existing = (
-                    db.session.query(ObjectLink)
-                    .filter(ObjectLink.external_object == obj)
-                    .filter(ObjectLink.platform == platform)
-                    .first()
-                )
+            for index, type in attributes:
+                values = [t for t in row[index].split(",") if t]
+                for value in values:
+                    obj.add_attribute({"type": type, "text": value}, attr_platform)
 
-                if existing is not None and existing.external_id != external_id:
-                    it.write("> DEL old link {}".format(existing.external_id))
+            for index, platform in external_ids:
+                external_id = row[index]
 
-                    # Lookup for old attributes from this source and delete them
-                    db.session.query(ValueSource).filter(
-                        ValueSource.platform_id == platform.id
-                    ).filter(
-                        ValueSource.value_id.in_(
-                            db.session.query(Value.id).filter(
-                                Value.external_object_id == obj.id
-                            )
-                        )
-                    ).delete(
-                        synchronize_session=False
-                    )
+                if not external_id:
+                    it.write("> SKIP {} ({})".format(id, platform.slug))
+                    continue
 
-                    # Remove attributes with no sources
-                    db.session.query(Value).filter(
-                        Value.external_object_id == obj.id
-                    ).filter(~Value.sources.any()).delete(synchronize_session=False)
+                if not platform.allow_links_overlap:
+                    existing = by_object.get((obj.id, platform.id))
 
-                    db.session.delete(existing)
-                    db.session.commit()
+                    if existing is not None and existing.external_id != external_id:
+                        it.write("> DEL old link {}".format(existing.external_id))
 
-            link = (
-                db.session.query(ObjectLink)
-                .filter(ObjectLink.external_id == external_id)
-                .filter(ObjectLink.platform == platform)
-                .first()
-            )
+                        # Lookup for old attributes from this source and delete them
+                        db.session.query(ValueSource).filter(
+                            ValueSource.platform_id == platform.id
+                        ).filter(
+                            ValueSource.value_id.in_(
+                                db.session.query(Value.id).filter(
+                                    Value.external_object_id == obj.id
+                                )
+                            )
+                        ).delete(
+                            synchronize_session=False
+                        )
 
-            if link is None:
-                it.write("> LINK {} {} ({})".format(id, external_id, platform.slug))
-                obj.links.append(
-                    ObjectLink(
+                        # Remove attributes with no sources
+                        db.session.query(Value).filter(
+                            Value.external_object_id == obj.id
+                        ).filter(~Value.sources.any()).delete(synchronize_session=False)
+
+                        db.session.delete(existing)
+                        db.session.flush()
+                        # The values were deleted behind the session's back,
+                        # only reload them for this object
+                        for value in obj.values:
+                            db.session.expire(value, ["sources"])
+                        db.session.expire(obj, ["values", "links"])
+                        del by_object[(obj.id, platform.id)]
+                        by_id.pop((platform.id, existing.external_id), None)
+
+                link = by_id.get((platform.id, external_id))
+
+                if link is None:
+                    it.write("> LINK {} {} ({})".format(id, external_id, platform.slug))
+                    link = ObjectLink(
                         external_object=obj, platform=platform, external_id=external_id
                     )
-                )
-            elif link.external_object != obj:
-                it.write("> MERGE {} {}".format(id, external_id))
-
-                try:
-                    link.external_object.merge_and_delete(obj, db.session)
-                except Exception as e:
-                    it.write(str(e))
-            else:
-                it.write(
-                    "> ALREADY MERGED {} {} ({})".format(id, external_id, platform.slug)
-                )
+                    obj.links.append(link)
+                    by_id[(platform.id, external_id)] = link
+                    by_object.setdefault((obj.id, platform.id), link)
+                elif link.external_object_id != obj.id:
+                    it.write("> MERGE {} {}".format(id, external_id))
+
+                    try:
+                        with db.session.begin_nested():
+                            link.external_object.merge_and_delete(obj, db.session)
+                    except Exception as e:
+                        it.write(str(e))
+
+                    # The merge moved links around and deleted an object
+                    objects, by_id, by_object = prefetch(chunk)
+                    obj = objects[id]
+                else:
+                    it.write(
+                        "> ALREADY MERGED {} {} ({})".format(
+                            id, external_id, platform.slug
+                        )
+                    )
 
         db.session.commit()
+        done += len(chunk)
 
+        if checkpoint is not None:
+            Path(checkpoint).write_text(str(done))
 
-@click.command("merge-episodes")
-@with_appcontext
-def merge_episodes():
-    """Merge episodes that are in the same series"""
-    from sqlalchemy import and_
-    from sqlalchemy.orm import aliased
-    from .scheme.object import Episode
-    from .app import db
+    if checkpoint is not None and Path(checkpoint).exists():
+        Path(checkpoint).unlink()
 
-    candidates = set()
-    other = aliased(Episode)
-
-    query = (
-        db.session.query(Episode.external_object_id, other.external_object_id)
-        .join(
-            (
-                other,
-                and_(
-                    Episode.episode == other.episode,
-                    Episode.season == other.season,
-                    Episode.series_id == other.series_id,
-                    Episode.external_object_id != other.external_object_id,
-                ),
-            )
-        )
-        .filter(Episode.episode is not None and Episode.season is not None)
-    )
 
-    candidates = frozenset([frozenset([q[0], q[1]]) for q in query])
+def _database_of(uri):
+    """The server and database a database URI points to"""
+    from sqlalchemy.engine.url import make_url
 
-    for (i, j) in candidates:
-        print("{}\t{}\t5.0".format(i, j))
+    url = make_url(uri)
+    return (url.host or "localhost", url.port or 5432, url.database)
 
 
-@click.command("fix-links")
+@click.command()
 @with_appcontext
-def fix_links():
-    """Fix duplicate object links"""
-    from sqlalchemy.orm import aliased
-    from .scheme.object import ObjectLink
+@click.confirmation_option(
+    prompt="This will empty every table of the bench database. Are you sure?"
+)
+@click.option("--scale", "-s", type=int, default=1, show_default=True)
+@click.option("--seed", type=int, default=0, show_default=True)
+@click.option("--only", multiple=True, help="Only run this benchmark")
+@click.option(
+    "--output",
+    "-o",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Where to save the results  [default: benchmarks/<commit>.json]",
+)
+def bench(scale, seed, only, output):
+    """Benchmark the hot paths on a scratch database
+
+    The database is given by BENCH_DATABASE_URI, and can't be the one of the
+    app.
+    """
+    from flask import current_app
+
     from .app import db
+    from .bench import run, write_report
+    from .scheme import Base
 
-    l1 = aliased(ObjectLink)
-    l2 = aliased(ObjectLink)
+    uri = current_app.config.get("BENCH_DATABASE_URI")
+    if not uri:
+        raise click.UsageError(
+            "Set BENCH_DATABASE_URI to a scratch database, it is emptied on each run"
+        )
+    if _database_of(uri) == _database_of(current_app.config["SQLALCHEMY_DATABASE_URI"]):
+        raise click.UsageError(
+            "BENCH_DATABASE_URI is the database of the app, refusing to empty it"
+        )
 
-    links = list(
-        db.session.query(l1, l2)
-        .filter(l1.external_object_id == l2.external_object_id)
-        .filter(l1.platform_id == l2.platform_id)
-        .filter(l1.external_id == l2.external_id)
-        .filter(l1.id != l2.id)
-        .order_by(l1.id.asc())
+    # Everything, including the code being measured, now uses the scratch
+    # database
+    db.session.remove()
+    current_app.config["SQLALCHEMY_DATABASE_URI"] = uri
+    for extension in ["tablefunc", "pg_trgm", "unaccent"]:
+        db.engine.execute("CREATE EXTENSION IF NOT EXISTS {}".format(extension))
+    Base.metadata.create_all(bind=db.engine, checkfirst=True)
+
+    tables = [
+        table.name
+        for table in reversed(Base.metadata.sorted_tables)
+        if not table.name.startswith("vw_")
+    ]
+    db.session.execute(
+        "TRUNCATE TABLE {} RESTART IDENTITY CASCADE".format(",".join(tables))
     )
+    db.session.commit()
+
+    report = run(db.session, scale=scale, seed=seed, only=list(only))
+    db.session.close()
 
-    done = set()
+    for result in report["results"]:
+        click.echo(
+            "{name:<16} {count:>8} {unit:<8} {seconds:>8.2f}s {rate:>10.1f}/s".format(
+                **dict(result, rate=result["rate"] or 0)
+            )
+        )
 
-    for (l1, l2) in tqdm(links):
-        if l1.id in done or l2.id in done:
-            continue
+    if output is None:
+        output = "benchmarks/{}.json".format((report["commit"] or "unknown")[:8])
+    write_report(report, output)
+    click.echo("Saved to {}".format(output))
 
-        diff = set(l2.scraps) - set(l1.scraps)
-        for scrap in diff:
-            l1.scraps.append(scrap)
 
-        diff = set(l2.imports) - set(l1.imports)
-        for import_file in diff:
-            l1.imports.append(import_file)
+@click.command("merge-episodes")
+@with_appcontext
+@click.option("--scrap", "-s", type=SCRAP, help="Only the series found by this scrap")
+@click.option(
+    "--import-file", "-i", type=int, help="Only the series found by this import"
+)
+@click.option("--batch-size", "-b", type=int, default=100, show_default=True)
+def merge_episodes(scrap, import_file, batch_size):
+    """Merge episodes that are in the same series"""
+    from .scheme.import_ import ImportFile
+    from .scheme.object import Episode
+    from .app import db
 
-        done.add(l2.id)
+    if import_file is not None:
+        import_file = db.session.query(ImportFile).get(import_file)
+        if import_file is None:
+            raise click.BadParameter("import file not found", param_hint="import-file")
 
-        db.session.delete(l2)
-        db.session.commit()
+    counts = Episode.consolidate(
+        db.session, scrap=scrap, import_file=import_file, batch_size=batch_size
+    )
+    click.echo(
+        "Merged {merged}, failed {failed}".format(
+            merged=counts["merged"], failed=counts["failed"]
+        )
+    )
 
 
-@click.command("fix-attributes")
+@click.command("fix-links")
 @with_appcontext
-def fix_attributes():
-    """Fix duplicate attributes"""
-    from sqlalchemy.orm import aliased
-    from .scheme.value import Value, ValueSource
+@click.option("--dry-run", "-n", is_flag=True, help="Only count the duplicates")
+def fix_links(dry_run):
+    """Fix duplicate object links"""
+    from .scheme.object import ObjectLink
     from .app import db
 
-    v1 = aliased(Value)
-    v2 = aliased(Value)
+    counts = ObjectLink.deduplicate(db.session, dry_run=dry_run)
 
-    values = list(
-        db.session.query(v1, v2)
-        .filter(v1.external_object_id == v2.external_object_id)
-        .filter(v1.type == v2.type)
-        .filter(v1.text == v2.text)
-        .filter(v1.id != v2.id)
+    if dry_run:
+        db.session.rollback()
+    else:
+        db.session.commit()
+
+    click.echo(
+        "{verb} {links} links, moved {scraps} scraps, {imports} imports "
+        "and {sessions} sessions".format(
+            verb="Would delete" if dry_run else "Deleted", **counts
+        )
     )
 
-    done = set()
 
-    for (v1, v2) in tqdm(values):
-        if v1.id in done or v2.id in done:
-            continue
+@click.command("fix-attributes")
+@with_appcontext
+@click.option("--dry-run", "-n", is_flag=True, help="Only count the duplicates")
+def fix_attributes(dry_run):
+    """Fix duplicate attributes"""
+    from .scheme.value import Value
+    from .app import db
 
-        for s2 in v2.sources:
-            if not any(s1.platform == s2.platform for s1 in v1.sources):
-                v1.sources.append(
-                    ValueSource(platform=s2.platform, score_factor=s2.score_factor)
-                )
-            db.session.delete(s2)
-        done.add(v2.id)
+    counts = Value.deduplicate(db.session, dry_run=dry_run)
 
-        db.session.delete(v2)
+    if dry_run:
+        db.session.rollback()
+    else:
         db.session.commit()
 
+    click.echo(
+        "{verb} {values} values, moved {sources} sources".format(
+            verb="Would delete" if dry_run else "Deleted", **counts
+        )
+    )
+
 
 @click.command("download-countries")
 @with_appcontext
@@ -543,12 +725,25 @@ def download_countries():
 def attach_session(platform, before, after, session, type, limit, status):
     """Attach scraps to a session"""
     from .app import db
-    from .scheme.object import ExternalObject, scrap_link
+    from .scheme.object import ExternalObject, ObjectLink, scrap_link
     from .scheme.platform import Scrap
-    from sqlalchemy import func
-    from sqlalchemy.exc import InvalidRequestError
+    from sqlalchemy import and_, func
 
-    query = db.session.query(Scrap).filter(Scrap.date <= before, Scrap.date >= after)
+    # Count the objects of every scrap at once
+    objects = ExternalObject.__table__
+    join_condition = objects.c.id == ObjectLink.external_object_id
+    if type is not None:
+        join_condition = and_(join_condition, objects.c.type == type)
+
+    query = (
+        db.session.query(Scrap.id)
+        .outerjoin(scrap_link, scrap_link.c.scrap_id == Scrap.id)
+        .outerjoin(ObjectLink, ObjectLink.id == scrap_link.c.object_link_id)
+        .outerjoin(objects, join_condition)
+        .filter(Scrap.date <= before, Scrap.date >= after)
+        .group_by(Scrap.id)
+        .having(func.count(objects.c.id) >= limit)
+    )
 
     if status:
         query = query.filter(Scrap.status.in_(status))
@@ -556,142 +751,78 @@ def attach_session(platform, before, after, session, type, limit, status):
     if platform is not None:
         query = query.filter(Scrap.platform == platform)
 
-    if type is not None:
-        query = query.filter(
-            db.session.query(func.count(ExternalObject.id))
-            .join(ExternalObject.links)
-            .join(scrap_link)
-            .correlate(Scrap)
-            .filter(ExternalObject.type == type)
-            .filter(scrap_link.columns.scrap_id == Scrap.id)
-            .as_scalar()
-            >= limit
-        )
-    else:
-        query = query.filter(
-            db.session.query(func.count(ExternalObject.id))
-            .join(ExternalObject.links)
-            .join(scrap_link)
-            .correlate(Scrap)
-            .filter(scrap_link.columns.scrap_id == Scrap.id)
-            .as_scalar()
-            >= limit
-        )
+    scrap_ids = [id for (id,) in query]
+    attached = session.attach_scraps(scrap_ids, session=db.session)
+    db.session.commit()
 
-    for scrap in query:
-        try:
-            scrap.sessions.append(session)
-            print("Attaching {} to {}".format(scrap, session))
-        except InvalidRequestError:
-            print("{} is already attached".format(scrap))
-        db.session.add(scrap)
+    for id in attached:
+        print("Attached scrap {} to {}".format(id, session))
 
-    db.session.commit()
+    print(
+        "Attached {} scraps, {} were already attached".format(
+            len(attached), len(scrap_ids) - len(attached)
+        )
+    )
 
 
 @click.command("fix-titles")
 @with_appcontext
-def fix_titles():
-    """Fix countries attributes with no ISO codes"""
+@click.option("--chunk-size", "-c", type=int, default=1000, show_default=True)
+def fix_titles(chunk_size):
+    """Add titles without their bracketed part"""
     import re
-    from .scheme.value import Value, ValueSource
+    from .scheme.value import Value
     from .app import db
 
-    values = list(
-        db.session.query(Value)
-        .filter(Value.text.like("%[%]"))
-        .filter(Value.type == ValueType.TITLE)
-        .all()
+    added, read = Value.normalize(
+        db.session,
+        type=ValueType.TITLE,
+        transform=lambda text: re.sub(r"\[.*\]", "", text).strip(),
+        where=Value.text.like("%[%]"),
+        chunk_size=chunk_size,
     )
-
-    added = 0
-
-    for v in tqdm(values):
-        new = re.sub(r"\[.*\]", "", v.text).strip()
-
-        existing = (
-            db.session.query(Value)
-            .filter(
-                Value.type == ValueType.TITLE,
-                Value.text == new,
-                Value.external_object_id == v.external_object_id,
-            )
-            .first()
-        )
-
-        if existing is None:
-            added += 1
-            value = Value(
-                type=ValueType.TITLE, text=new, external_object_id=v.external_object_id
-            )
-
-            db.session.add(value)
-
-            for source in v.sources:
-                value.sources.append(
-                    ValueSource(
-                        platform=source.platform, score_factor=source.score_factor
-                    )
-                )
-
-    db.session.commit()
-    print("Fixed {} titles out of {}".format(added, len(values)))
+    print("Fixed {} titles out of {}".format(added, read))
 
 
 @click.command("fix-countries")
 @with_appcontext
-def fix_countries():
+@click.option("--chunk-size", "-c", type=int, default=1000, show_default=True)
+def fix_countries(chunk_size):
     """Fix countries attributes with no ISO codes"""
+    from sqlalchemy import select
     from sqlalchemy.sql.expression import func
-    from .scheme.value import Value, ValueSource
+    from .scheme.value import Value
     from .app import db
     from .countries import lookup
 
-    values = list(
-        db.session.query(Value)
-        .filter(
-            ~Value.external_object_id.in_(
-                db.session.query(Value.external_object_id)
-                .filter(Value.type == ValueType.COUNTRY)
-                .filter(func.length(Value.text) == 2)
-            )
-        )
-        .filter(Value.type == ValueType.COUNTRY)
-        .all()
+    # Only for objects which don't have an ISO code yet. The chunks commit the
+    # codes they add, only the ones that existed before the first chunk count
+    max_id = db.session.query(func.max(Value.id)).scalar()
+    with_code = select([Value.external_object_id]).where(
+        (Value.type == ValueType.COUNTRY)
+        & (func.length(Value.text) == 2)
+        & (Value.id <= max_id)
     )
 
-    added = 0
-
-    for v in tqdm(values):
-        new = lookup(v.text)
-        if new is not None:
-            added += 1
-
-            value = Value(
-                type=ValueType.COUNTRY,
-                text=new,
-                external_object_id=v.external_object_id,
-            )
-
-            db.session.add(value)
-
-            for source in v.sources:
-                value.sources.append(
-                    ValueSource(
-                        platform=source.platform, score_factor=source.score_factor
-                    )
-                )
-    db.session.commit()
-    print("Fixed {} countries out of {}".format(added, len(values)))
+    added, read = Value.normalize(
+        db.session,
+        type=ValueType.COUNTRY,
+        transform=lookup,
+        where=~Value.external_object_id.in_(with_code),
+        chunk_size=chunk_size,
+    )
+    print("Fixed {} countries out of {}".format(added, read))
 
 
 def setup_cli(app):
     app.cli.add_command(attach_session)
+    app.cli.add_command(bench)
     app.cli.add_command(download_countries)
     app.cli.add_command(fix_attributes)
     app.cli.add_command(fix_countries)
     app.cli.add_command(fix_titles)
     app.cli.add_command(fix_links)
+    app.cli.add_command(gateway)
     app.cli.add_command(import_csv)
     app.cli.add_command(match)
     app.cli.add_command(merge)
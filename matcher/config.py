@@ -73,8 +73,49 @@ class Config(object):
 
     DATA_DIR = Path(env_var("DATA_DIR", BASE_DIR + "/data"))
     BYPASS_LOCKS = env_var("BYPASS_LOCKS", False)
+    # Record ambiguous links as merge candidates instead of merging on insert
+    DEFER_MERGES = env_var("DEFER_MERGES", False)
+
+    # Celery queues for the export files, as (name, max expected rows, max
+    # concurrent files). Files go to the first queue they fit in, so that
+    # small files don't wait behind huge ones.
+    EXPORT_QUEUES = [("exports.small", 100_000, 4), ("exports.large", None, 1)]
+    # Hold back exports while the database runs that many queries
+    EXPORT_MAX_ACTIVE_QUERIES = int(env_var("EXPORT_MAX_ACTIVE_QUERIES", 20))
+    EXPORT_THROTTLE_DELAY = int(env_var("EXPORT_THROTTLE_DELAY", 30))
+
+    # Forward the metrics to this statsd daemon, if set
+    STATSD_HOST = env_var("STATSD_HOST")
+    STATSD_PORT = int(env_var("STATSD_PORT", 8125))
+    STATSD_PREFIX = env_var("STATSD_PREFIX", "matcher")
+
+    # Record the queries of each request and task, and warn when a statement
+    # is repeated that many times, which is usually a lazy load in a loop
+    QUERY_PROFILER = env_var("QUERY_PROFILER", True)
+    QUERY_PROFILER_THRESHOLD = int(env_var("QUERY_PROFILER_THRESHOLD", 10))
+    # List the last profiles on /_profiler, only for development
+    QUERY_PROFILER_REPORT = env_var("QUERY_PROFILER_REPORT", DEBUG)
+
+    # Count the calls of the matching criteria, and the time spent in them
+    TRACE_STATS = env_var("TRACE_STATS", False)
+
+    # How long the totals of the paginated listings are cached, in seconds
+    PAGINATION_COUNT_TTL = int(env_var("PAGINATION_COUNT_TTL", 300))
+
+    # Objects per batch sent by the gateway to the workers, batches that can
+    # wait for the broker before it slows the scrapers down, and how long it
+    # remembers that a scrap exists, in seconds
+    GATEWAY_BATCH_SIZE = int(env_var("GATEWAY_BATCH_SIZE", 100))
+    GATEWAY_MAX_PENDING = int(env_var("GATEWAY_MAX_PENDING", 10))
+    GATEWAY_SCRAP_TTL = int(env_var("GATEWAY_SCRAP_TTL", 60))
+
+    # Scratch database of `matcher bench`, emptied on each run. It has to be
+    # another database than the app's one
+    BENCH_DATABASE_URI = env_var("BENCH_DATABASE_URI")
 
 
 class TestConfig(Config):
     SQLALCHEMY_DATABASE_URI = env_var("SQLALCHEMY_TEST_DATABASE_URI", postgres_test_url)
     TESTING = True
+    # Tests run in a single process, and the app has no instance folder
+    BYPASS_LOCKS = True
@@ -30,6 +30,8 @@ def app():
 
     with app.app_context():
         _db.engine.execute(text("CREATE EXTENSION IF NOT EXISTS tablefunc"))
+        _db.engine.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        _db.engine.execute(text("CREATE EXTENSION IF NOT EXISTS unaccent"))
         Base.metadata.create_all(bind=_db.engine, checkfirst=True)
 
         yield app
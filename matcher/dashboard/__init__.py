@@ -52,6 +52,14 @@ blueprint.add_url_rule(
 blueprint.add_url_rule(
     "/objects/<int:id>", view_func=views.objects.ShowObjectView.as_view("show_object")
 )
+blueprint.add_url_rule(
+    "/objects/<int:id>/links",
+    view_func=views.objects.ObjectLinksView.as_view("object_links"),
+)
+blueprint.add_url_rule(
+    "/objects/<int:id>/values",
+    view_func=views.objects.ObjectValuesView.as_view("object_values"),
+)
 
 blueprint.add_url_rule(
     "/exports/", view_func=views.exports.ExportIndexView.as_view("exports")
@@ -6,10 +6,11 @@ from sqlalchemy import func, or_
 from sqlalchemy.orm import joinedload, undefer
 
 from matcher.mixins import InjectedView
+from matcher.pagination import ordering_keys, paginate_request
 from matcher.scheme.enums import PlatformType
 from matcher.scheme.export import ExportFactory, ExportFile, ExportTemplate
 from matcher.scheme.platform import Platform, PlatformGroup, Session
-from matcher.utils import apply_ordering, parse_ordering
+from matcher.utils import parse_ordering
 
 from ..forms.exports import ExportFactoryListFilter, ExportFileFilter, NewExportFileForm
 
@@ -83,13 +84,13 @@ class ExportFileListView(InjectedView):
         ordering_key, ordering_direction = (
             ordering if ordering != (None, None) else ("date", "desc")
         )
-        query = apply_ordering(
+        keys = ordering_keys(
             {
-                "date": ExportFile.last_activity,
+                "date": (ExportFile.last_activity, True),
                 "filename": ExportFile.path,
                 None: ExportFile.id,
             },
-            query,
+            ExportFile.id,
             key=ordering_key,
             direction=ordering_direction,
         )
@@ -125,7 +126,7 @@ class ExportFileListView(InjectedView):
 
         ctx = {}
         ctx["ordering"] = request.args.get("ordering", None, str)
-        ctx["page"] = query.paginate()
+        ctx["page"] = paginate_request(query, keys)
         ctx["filter_form"] = form
         ctx["export_file_filter_cache"] = build_filter_cache(
             ctx["page"].items, self.session
@@ -138,14 +139,27 @@ class DownloadExportFileView(InjectedView):
     def dispatch_request(self, id):
         export_file = self.query(ExportFile).get_or_404(id)
 
-        # FIXME: not every client supports gzip, we should look at the Accept-Encoding header
+        coding = export_file.content_coding
+
+        # The file is sent as it is stored. Clients that can't decode it on the
+        # fly download the compressed file instead.
+        if coding is not None and request.accept_encodings[coding]:
+            filename = export_file.download_name(decoded=True)
+            mimetype = "text/csv"
+        else:
+            coding = None
+            filename = export_file.download_name()
+            mimetype = export_file.mimetype
+
         response = send_file(
             export_file.open(mode="rb"),
-            mimetype="text/csv",
+            mimetype=mimetype,
             as_attachment=True,
-            attachment_filename=export_file.path.split("/")[-1],
+            attachment_filename=filename,
         )
-        response.headers["Content-Encoding"] = "gzip"
+        if coding is not None:
+            response.headers["Content-Encoding"] = coding
+        response.vary.add("Accept-Encoding")
         return response
 
 
@@ -3,13 +3,11 @@ import logging
 from collections import defaultdict
 
 from flask import flash, render_template, request
-from sqlalchemy import func
-from sqlalchemy.orm import joinedload, undefer
+from sqlalchemy.orm import joinedload
 
 from matcher.mixins import InjectedView
-from matcher.scheme.enums import ScrapStatus
-from matcher.scheme.object import ExternalObject, ObjectLink
-from matcher.scheme.platform import Platform, Scrap
+from matcher.scheme.platform import Scrap
+from matcher.scheme.stats import CountStats
 
 __all__ = ["HomeView"]
 
@@ -25,44 +23,28 @@ class HomeView(InjectedView):
                 flash("Attributes are being refreshed")
 
         ctx = {}
-        ctx["external_object_stats"] = defaultdict(
-            int,
-            {
-                key.name: value
-                for (key, value) in self.query(
-                    ExternalObject.type, func.count(ExternalObject.id)
-                ).group_by(ExternalObject.type)
-            },
+        today = datetime.date.today()
+        totals = CountStats.totals(
+            self.session, since=today - datetime.timedelta(days=364)
         )
-        ctx["platforms_stats"] = defaultdict(
-            int,
-            {
-                key.name: value
-                for (key, value) in self.query(
-                    Platform.type, func.count(Platform.id)
-                ).group_by(Platform.type)
-            },
-        )
-        ctx["object_link_count"] = self.query(ObjectLink).count()
-
-        now = datetime.datetime.utcnow()
-
-        def successful_scrap(timedelta):
-            return (
-                self.query(Scrap)
-                .filter(Scrap.date >= (now - timedelta))
-                .filter(Scrap.status == ScrapStatus.SUCCESS)
-                .count()
+        ctx["external_object_stats"] = defaultdict(int, totals["external_object"])
+        ctx["platforms_stats"] = defaultdict(int, totals["platform"])
+        ctx["object_link_count"] = totals["object_link"].get("", 0)
+
+        def successful_scrap(days):
+            since = (today - datetime.timedelta(days=days)).isoformat()
+            return sum(
+                value
+                for (day, value) in totals["scrap_success"].items()
+                if day >= since
             )
 
         ctx["recent_scraps_count"] = {
-            "day": successful_scrap(datetime.timedelta(days=1)),
-            "week": successful_scrap(datetime.timedelta(weeks=1)),
-            "month": successful_scrap(datetime.timedelta(days=30)),
-            "year": successful_scrap(datetime.timedelta(days=365)),
+            "day": successful_scrap(0),
+            "week": successful_scrap(6),
+            "month": successful_scrap(29),
+            "year": successful_scrap(364),
         }
 
-        ctx["last_scraps"] = self.query(Scrap).options(
-            joinedload(Scrap.platform), undefer(Scrap.links_count)
-        )[-9:]
+        ctx["last_scraps"] = self.query(Scrap).options(joinedload(Scrap.platform))[-9:]
         return render_template("home.html", **ctx)
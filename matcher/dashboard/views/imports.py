@@ -6,11 +6,12 @@ from sqlalchemy.orm import undefer
 from sqlalchemy.orm.attributes import flag_modified
 
 from matcher.mixins import InjectedView
+from matcher.pagination import ordering_keys, paginate_request
 from matcher.scheme.enums import ImportFileStatus
 from matcher.scheme.import_ import ImportFile
 from matcher.scheme.platform import Platform, Session
 from matcher.scheme.provider import Provider
-from matcher.utils import apply_ordering, parse_ordering
+from matcher.utils import parse_ordering
 
 from ..forms.imports import EditImport, UploadImport
 
@@ -51,20 +52,20 @@ class ImportFileListView(InjectedView):
         ordering_key, ordering_direction = (
             ordering if ordering != (None, None) else ("date", "desc")
         )
-        query = apply_ordering(
+        keys = ordering_keys(
             {
-                "date": ImportFile.last_activity,
+                "date": (ImportFile.last_activity, True),
                 "filename": ImportFile.filename,
                 None: ImportFile.id,
             },
-            query,
+            ImportFile.id,
             key=ordering_key,
             direction=ordering_direction,
         )
 
         ctx = {}
         ctx["ordering"] = request.args.get("ordering", None, str)
-        ctx["page"] = query.paginate()
+        ctx["page"] = paginate_request(query, keys)
         ctx["upload_form"] = form
 
         return render_template("imports/list.html", **ctx)
@@ -91,11 +92,16 @@ class ShowImportFileView(InjectedView):
             if file.status != ImportFileStatus.UPLOADED:
                 flash("Can't edit processed file")
             else:
+                sessions = set(file.sessions)
                 form.populate_obj(file)
                 flag_modified(file, "fields")
                 self.session.add(file)
                 self.session.commit()
 
+                for session in sessions | set(file.sessions):
+                    session.refresh_links(session=self.session)
+                self.session.commit()
+
                 if form.save_and_import.data:
                     self.celery.send_task(
                         "matcher.tasks.import_.process_file", [file.id]
@@ -1,19 +1,27 @@
 from flask import render_template, request
-from sqlalchemy import func, or_
-from sqlalchemy.orm import aliased, contains_eager, joinedload, lazyload, undefer
+from sqlalchemy import or_
+from sqlalchemy.orm import aliased, contains_eager, joinedload, undefer
 
 from matcher.mixins import InjectedView
+from matcher.pagination import Key, cached_count, keyset_paginate, paginate_request
 from matcher.scheme.enums import ExternalObjectType
 from matcher.scheme.export import AttributesWrapper
 from matcher.scheme.import_ import ImportFile
 from matcher.scheme.object import Episode, ExternalObject, ObjectLink
 from matcher.scheme.platform import Platform, Scrap, Session
-from matcher.scheme.value import Value, ValueSource
+from matcher.scheme.search import ObjectSearch
+from matcher.scheme.stats import SeriesStats
+from matcher.scheme.value import Value
 from matcher.scheme.views import AttributesView
 
 from ..forms.objects import ObjectListFilter
 
-__all__ = ["ObjectListView", "ShowObjectView"]
+__all__ = [
+    "ObjectLinksView",
+    "ObjectListView",
+    "ObjectValuesView",
+    "ShowObjectView",
+]
 
 
 class ObjectListView(InjectedView):
@@ -23,11 +31,7 @@ class ObjectListView(InjectedView):
         form.session.query = self.query(Session)
         form.object_link.platform.query = self.query(Platform)
 
-        query = (
-            self.query(ExternalObject)
-            .options(undefer(ExternalObject.links_count))
-            .order_by(ExternalObject.id)
-        )
+        query = self.query(ExternalObject)
 
         # Join the needed columns for filtering
         if (
@@ -45,23 +49,15 @@ class ObjectListView(InjectedView):
         if form.session.data or form.import_file.data:
             query = query.outerjoin(ObjectLink.imports)
 
-        if form.search.data or form.country.data:
-            query = query.join(ExternalObject.attributes).options(
-                contains_eager(ExternalObject.attributes)
-            )
-        else:
-            # If we are not filtering using the attributes we need to join-load them
-            query = query.options(joinedload(ExternalObject.attributes))
-
-        # Apply the filters
         if form.search.data:
-            q = func.plainto_tsquery(form.search.data)
-            query = query.filter(AttributesView.search_vector.op("@@")(q)).order_by(
-                func.ts_rank(AttributesView.search_vector, q)
-            )
-        else:
-            query = query.order_by(ExternalObject.id)
+            query = query.join(
+                ObjectSearch, ObjectSearch.external_object_id == ExternalObject.id
+            ).filter(ObjectSearch.matches(form.search.data))
 
+        if form.country.data:
+            query = query.join(ExternalObject.attributes)
+
+        # Apply the filters
         if form.country.data:
             query = query.filter(
                 AttributesView.countries[1].in_(
@@ -110,26 +106,54 @@ class ObjectListView(InjectedView):
             )
 
         ctx = {}
-        ctx["page"] = query.paginate()
+        if form.search.data:
+            # Page through the IDs of the best matches first, and only load
+            # the objects shown
+            ids = query.with_entities(ExternalObject.id, ObjectSearch.score).distinct()
+            page = paginate_request(
+                ids,
+                [
+                    Key(ObjectSearch.score, descending=True),
+                    Key(ExternalObject.id, descending=True),
+                ],
+            )
+            page.items = ObjectSearch.hydrate(
+                self.query(ExternalObject).options(
+                    undefer(ExternalObject.links_count),
+                    joinedload(ExternalObject.attributes),
+                ),
+                [row.id for row in page.items],
+            )
+        else:
+            if form.country.data:
+                query = query.options(contains_eager(ExternalObject.attributes))
+            else:
+                query = query.options(joinedload(ExternalObject.attributes))
+            page = paginate_request(
+                query.options(undefer(ExternalObject.links_count)),
+                [Key(ExternalObject.id)],
+            )
+
+        ctx["page"] = page
         ctx["filter_form"] = form
 
         return render_template("objects/list.html", **ctx)
 
 
+# The links and values are shown in batches, the next ones are fetched when asked
+DETAIL_PER_PAGE = 50
+
+LINK_KEYS = [Key(ObjectLink.id)]
+VALUE_KEYS = [Key(Value.id)]
+
+
 class ShowObjectView(InjectedView):
     def dispatch_request(self, id):
         external_object = (
             self.query(ExternalObject)
             .options(
                 joinedload(ExternalObject.attributes),
-                lazyload(ExternalObject.values)
-                .joinedload(Value.sources)
-                .joinedload(ValueSource.platform),
-                lazyload(ExternalObject.links).joinedload(ObjectLink.platform),
-                lazyload(ExternalObject.links).joinedload(ObjectLink.scraps),
-                lazyload(ExternalObject.links)
-                .joinedload(ObjectLink.imports)
-                .undefer(ImportFile.last_activity),
+                undefer(ExternalObject.links_count),
             )
             .get_or_404(id)
         )
@@ -137,17 +161,29 @@ class ShowObjectView(InjectedView):
         ctx = {}
         ctx["object"] = external_object
         ctx["attributes"] = AttributesWrapper(external_object.attributes)
+        ctx["values_count"] = cached_count(
+            self.query(Value).filter(Value.external_object_id == external_object.id)
+        )
+        ctx["links"] = keyset_paginate(
+            ObjectLink.of_object(self.session, external_object.id, origins=True),
+            LINK_KEYS,
+            per_page=DETAIL_PER_PAGE,
+        )
+        ctx["values"] = keyset_paginate(
+            Value.of_object(self.session, external_object.id),
+            VALUE_KEYS,
+            per_page=DETAIL_PER_PAGE,
+        )
 
         if external_object.type == ExternalObjectType.SERIES:
-            ctx["episodes"] = (
-                self.query(Episode)
-                .filter(Episode.series_id == external_object.id)
-                .options(
-                    joinedload(Episode.external_object).joinedload(
-                        ExternalObject.attributes
-                    )
+            # Counted ahead of time instead of loading every episode
+            ctx["series_stats"] = (
+                self.query(SeriesStats)
+                .filter(
+                    SeriesStats.series_id == external_object.id,
+                    SeriesStats.platform_id.is_(None),
                 )
-                .all()
+                .first()
             )
         elif external_object.type == ExternalObjectType.EPISODE:
             res = (
@@ -166,3 +202,28 @@ class ShowObjectView(InjectedView):
                 ctx["episode"] = None
 
         return render_template("objects/show.html", **ctx)
+
+
+class ObjectLinksView(InjectedView):
+    """The next batch of links of an object, as table rows"""
+
+    def dispatch_request(self, id):
+        external_object = self.query(ExternalObject).get_or_404(id)
+        links = paginate_request(
+            ObjectLink.of_object(self.session, external_object.id, origins=True),
+            LINK_KEYS,
+        )
+        return render_template("objects/_links.html", object=external_object, links=links)
+
+
+class ObjectValuesView(InjectedView):
+    """The next batch of values of an object, as table rows"""
+
+    def dispatch_request(self, id):
+        external_object = self.query(ExternalObject).get_or_404(id)
+        values = paginate_request(
+            Value.of_object(self.session, external_object.id), VALUE_KEYS
+        )
+        return render_template(
+            "objects/_values.html", object=external_object, values=values
+        )
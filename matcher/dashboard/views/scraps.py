@@ -2,10 +2,11 @@ from flask import render_template, request
 from sqlalchemy.orm import joinedload, undefer
 
 from matcher.mixins import InjectedView
+from matcher.pagination import ordering_keys, paginate_request
 from matcher.scheme.enums import ExternalObjectType
 from matcher.scheme.object import ExternalObject, ObjectLink
 from matcher.scheme.platform import Platform, Scrap, Session, session_scrap
-from matcher.utils import apply_ordering, parse_ordering
+from matcher.utils import parse_ordering
 
 from ..forms.scraps import EditScrapForm, ScrapListFilter
 
@@ -24,9 +25,9 @@ class ScrapListView(InjectedView):
         ordering_key, ordering_direction = (
             ordering if ordering != (None, None) else ("date", "desc")
         )
-        query = apply_ordering(
-            {"date": Scrap.date, None: Scrap.id},
-            query,
+        keys = ordering_keys(
+            {"date": (Scrap.date, True), None: Scrap.id},
+            Scrap.id,
             key=ordering_key,
             direction=ordering_direction,
         )
@@ -50,7 +51,7 @@ class ScrapListView(InjectedView):
         ctx = {}
         ctx["filter_form"] = form
         ctx["ordering"] = request.args.get("ordering", None, str)
-        ctx["page"] = query.paginate()
+        ctx["page"] = paginate_request(query, keys)
 
         return render_template("scraps/list.html", **ctx)
 
@@ -68,10 +69,15 @@ class ShowScrapView(InjectedView):
         form.sessions.query = self.query(Session)
 
         if form.validate():
+            sessions = set(scrap.sessions)
             form.populate_obj(scrap)
             self.session.add(scrap)
             self.session.commit()
 
+            for session in sessions | set(scrap.sessions):
+                session.refresh_links(session=self.session)
+            self.session.commit()
+
         ctx = {}
         ctx["scrap"] = scrap
         ctx["form"] = form
@@ -7,6 +7,7 @@ Each exception defines a `status` attribute which is used to set the HTTP
 status the server should respond with when the exception is raised.
 
 """
+from operator import attrgetter
 
 
 class AmbiguousLinkError(Exception):
@@ -29,6 +30,27 @@ class AmbiguousLinkError(Exception):
             obj = obj.merge_and_delete(their, session)
         return obj
 
+    def defer(self, session):
+        """Record the conflict to resolve it later, and pick one of the objects.
+
+        The other objects are stored as accepted merge candidates, which are
+        merged in bulk by :func:`.scheme.merge.MergeCandidate.process`. Until
+        then, the object with the lowest ID is used.
+
+        :session: The DB session
+        """
+        from .scheme.enums import MergeCandidateStatus
+        from .scheme.merge import MergeCandidate
+        from .scheme.object import ScoredCandidate
+
+        (obj, *others) = sorted(self.objects, key=attrgetter("id"))
+        MergeCandidate.bulk_insert(
+            [ScoredCandidate(obj=their.id, into=obj.id, score=1.0) for their in others],
+            session=session,
+            status=MergeCandidateStatus.ACCEPTED,
+        )
+        return obj
+
     def __init__(self, objects):
         """Raise with the objects that should be merged."""
         self.objects = objects
@@ -77,9 +77,10 @@ def chained_object_links_by_date(links):
 
 
 def query():
-    """Inject the query args without the page and per_page parameters"""
+    """Inject the query args without the page, cursor and per_page parameters"""
     query = request.args.copy()
     query.pop("page", "")
+    query.pop("cursor", "")
     query.pop("per_page", "")
     return dict(query=query)
 
@@ -101,6 +102,7 @@ def badge_color(type_: CustomEnum) -> str:
         ScrapStatus.ABORTED: "warning",
         ScrapStatus.FAILED: "danger",
         ExportFileStatus.SCHEDULED: "secondary",
+        ExportFileStatus.DISPATCHED: "secondary",
         ExportFileStatus.QUERYING: "info",
         ExportFileStatus.PROCESSING: "primary",
         ExportFileStatus.DONE: "success",
@@ -127,6 +129,7 @@ def badge_color(type_: CustomEnum) -> str:
 def badge_display(type_: CustomEnum) -> str:
     mapping = {
         ExportFileStatus.SCHEDULED: "Queued",
+        ExportFileStatus.DISPATCHED: "Dispatched",
         ExportFileStatus.QUERYING: "Starting",
         ExportFileStatus.PROCESSING: "Running",
         ExportFileStatus.DONE: "Done",
@@ -0,0 +1,339 @@
+"""Streaming ingestion gateway for the scrapers.
+
+Posting the objects one by one to ``/api/queue/`` costs an HTTP round-trip
+and a query checking that the scrap exists for each of them. The gateway
+instead takes a whole stream of objects, as newline delimited JSON::
+
+    POST /ingest HTTP/1.1
+    X-Scrap-Id: 42
+    Transfer-Encoding: chunked
+
+    {"type": "movie", "attributes": [...], "links": [...]}
+    {"type": "movie", "attributes": [...], "links": [...]}
+
+The scrap is checked once, against a cache, and the objects are sent to the
+workers in batches. Only a few batches can wait for the broker: when it is
+slower than the scraper, the gateway stops reading the request, which slows
+the scraper down instead of buffering the stream in memory.
+
+The response is sent once every batch of the stream reached the broker. It
+runs with ``matcher gateway``.
+
+"""
+import asyncio
+import json
+import logging
+import time
+from typing import Dict, Tuple
+
+from matcher.metrics import count
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["Gateway", "ScrapCache", "serve"]
+
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    411: "Length Required",
+    500: "Internal Server Error",
+}
+
+# Longest object accepted, in bytes
+MAX_LINE = 16 * 1024 * 1024
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class ScrapCache(object):
+    """Remember which scraps exist.
+
+    Parameters
+    ----------
+    lookup : callable
+        tells if a scrap exists, from its ID. It blocks, so it runs in a
+        thread
+    ttl : int
+        how long an answer is remembered, in seconds. Missing scraps are
+        checked again sooner, they might just not be created yet
+
+    """
+
+    def __init__(self, lookup, ttl=60):
+        self.lookup = lookup
+        self.ttl = ttl
+        self._entries: Dict[int, Tuple[float, bool]] = {}
+
+    async def exists(self, scrap_id: int) -> bool:
+        now = time.monotonic()
+        entry = self._entries.get(scrap_id)
+        if entry is not None and entry[0] > now:
+            return entry[1]
+
+        loop = asyncio.get_event_loop()
+        exists = await loop.run_in_executor(None, self.lookup, scrap_id)
+        ttl = self.ttl if exists else min(self.ttl, 5)
+        self._entries[scrap_id] = (now + ttl, exists)
+        return exists
+
+
+class Gateway(object):
+    """Receive streams of objects and send them to the workers in batches.
+
+    Parameters
+    ----------
+    scraps : :obj:`ScrapCache`
+    publish : callable
+        sends a batch to the broker, as ``publish(objects, scrap_id)``. It
+        blocks, so it runs in a thread
+    batch_size : int
+        number of objects per batch
+    max_pending : int
+        number of batches that can wait for the broker before the requests
+        stop being read
+    publishers : int
+        number of batches sent to the broker at the same time
+
+    """
+
+    def __init__(self, scraps, publish, batch_size=100, max_pending=10, publishers=4):
+        self.scraps = scraps
+        self.publish = publish
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.publishers = publishers
+        self.server = None
+
+    async def start(self, host="0.0.0.0", port=8080):
+        """Start listening, and sending the batches"""
+        self.queue = asyncio.Queue(maxsize=self.max_pending)
+        self._tasks = [
+            asyncio.ensure_future(self._publish_batches())
+            for _ in range(self.publishers)
+        ]
+        self.server = await asyncio.start_server(self.handle, host, port)
+        return self.server
+
+    async def close(self):
+        """Stop listening, once the pending batches are sent"""
+        self.server.close()
+        await self.server.wait_closed()
+        await self.queue.join()
+        for task in self._tasks:
+            task.cancel()
+
+    async def _publish_batches(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            (objects, scrap_id, future) = await self.queue.get()
+            try:
+                await loop.run_in_executor(None, self.publish, objects, scrap_id)
+            except Exception as e:
+                logger.exception(
+                    "Could not send %d objects of scrap %d", len(objects), scrap_id
+                )
+                future.set_exception(e)
+            else:
+                count("gateway.objects", len(objects))
+                future.set_result(len(objects))
+            finally:
+                self.queue.task_done()
+
+    async def _enqueue(self, objects, scrap_id):
+        future = asyncio.get_event_loop().create_future()
+        # This waits while too many batches are pending, and the request is
+        # not read meanwhile
+        await self.queue.put((objects, scrap_id, future))
+        return future
+
+    async def handle(self, reader, writer):
+        """Answer one request, then close the connection"""
+        try:
+            (status, body) = await self._respond(reader)
+        except HTTPError as e:
+            (status, body) = (e.status, {"message": e.message})
+        except asyncio.IncompleteReadError:
+            (status, body) = (400, {"message": "Incomplete request"})
+        except Exception:
+            logger.exception("Could not handle a request")
+            (status, body) = (500, {"message": "Internal error"})
+
+        data = json.dumps(body).encode("utf-8")
+        head = (
+            "HTTP/1.1 {} {}\r\n"
+            "Content-Type: application/json\r\n"
+            "Content-Length: {}\r\n"
+            "Connection: close\r\n\r\n"
+        ).format(status, REASONS[status], len(data))
+        writer.write(head.encode("latin-1") + data)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
+
+    async def _respond(self, reader):
+        (method, path, headers) = await read_head(reader)
+
+        if path == "/health":
+            return (200, {"status": "ok", "pending": self.queue.qsize()})
+        if path != "/ingest":
+            raise HTTPError(404, "Not found")
+        if method != "POST":
+            raise HTTPError(405, "Only POST is allowed")
+
+        try:
+            scrap_id = int(headers["x-scrap-id"])
+        except (KeyError, ValueError):
+            raise HTTPError(400, "Missing x-scrap-id header")
+        if not await self.scraps.exists(scrap_id):
+            raise HTTPError(404, "Scrap not found")
+
+        futures = []
+        batch = []
+        invalid = 0
+        async for line in read_lines(reader, headers):
+            if not line.strip():
+                continue
+            try:
+                obj = json.loads(line.decode("utf-8"))
+            except ValueError:
+                obj = None
+            if not isinstance(obj, dict):
+                invalid += 1
+                continue
+
+            batch.append(obj)
+            if len(batch) >= self.batch_size:
+                futures.append(await self._enqueue(batch, scrap_id))
+                batch = []
+
+        if batch:
+            futures.append(await self._enqueue(batch, scrap_id))
+
+        results = await asyncio.gather(*futures, return_exceptions=True)
+        queued = sum(result for result in results if isinstance(result, int))
+        failed = any(isinstance(result, Exception) for result in results)
+        return (
+            500 if failed else 200,
+            {
+                "status": "failed" if failed else "queued",
+                "queued": queued,
+                "invalid": invalid,
+            },
+        )
+
+
+async def read_head(reader):
+    """Read the request line and the headers of a request"""
+    line = await reader.readline()
+    try:
+        (method, target, _) = line.decode("latin-1").split(" ", 2)
+    except ValueError:
+        raise HTTPError(400, "Malformed request line")
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        (name, _, value) = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    return (method.upper(), target.split("?", 1)[0], headers)
+
+
+async def read_body(reader, headers):
+    """Iterate over the blocks of a request body, as they arrive"""
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        while True:
+            line = await reader.readline()
+            try:
+                size = int(line.split(b";", 1)[0].strip(), 16)
+            except ValueError:
+                raise HTTPError(400, "Malformed chunk")
+            if size == 0:
+                # Skip the trailers
+                while await reader.readline() not in (b"\r\n", b"\n", b""):
+                    pass
+                return
+            yield await reader.readexactly(size)
+            await reader.readexactly(2)
+
+    elif "content-length" in headers:
+        try:
+            remaining = int(headers["content-length"])
+        except ValueError:
+            raise HTTPError(400, "Malformed content-length header")
+        while remaining > 0:
+            block = await reader.read(min(remaining, 64 * 1024))
+            if not block:
+                raise asyncio.IncompleteReadError(block, remaining)
+            remaining -= len(block)
+            yield block
+
+    else:
+        raise HTTPError(411, "The request needs a length, or to be chunked")
+
+
+async def read_lines(reader, headers):
+    """Iterate over the lines of a request body, as they arrive"""
+    buffer = b""
+    async for block in read_body(reader, headers):
+        buffer += block
+        (*lines, buffer) = buffer.split(b"\n")
+        for line in lines:
+            yield line
+        if len(buffer) > MAX_LINE:
+            raise HTTPError(400, "Line too long")
+    if buffer:
+        yield buffer
+
+
+def serve(engine, celery, host="0.0.0.0", port=8080, scrap_ttl=60, **options):
+    """Run the gateway until interrupted.
+
+    Parameters
+    ----------
+    engine : sqlalchemy.engine.Engine
+        to check the scraps
+    celery : celery.Celery
+        to send the batches to the ``insert_batch`` task
+    host : str
+    port : int
+    scrap_ttl : int
+        see :obj:`ScrapCache`
+    **options
+        see :obj:`Gateway`
+
+    """
+    from sqlalchemy import select
+
+    from matcher.scheme.platform import Scrap
+
+    def lookup(scrap_id):
+        with engine.connect() as connection:
+            query = select([Scrap.id]).where(Scrap.id == scrap_id)
+            return connection.execute(query).first() is not None
+
+    def publish(objects, scrap_id):
+        celery.send_task("matcher.tasks.object.insert_batch", [objects, scrap_id])
+
+    gateway = Gateway(ScrapCache(lookup, ttl=scrap_ttl), publish, **options)
+
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(gateway.start(host, port))
+    logger.info("Listening on %s:%d", host, port)
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        loop.run_until_complete(gateway.close())
@@ -0,0 +1,324 @@
+"""Lightweight instrumentation of the slow paths.
+
+The code wraps its stages in :func:`stage` and counts what it processed with
+:func:`count`. Everything lands in an in-process :obj:`Registry`, which is
+exposed on ``/metrics`` in the Prometheus text format, and optionally
+forwarded to a statsd daemon.
+
+Each Celery worker process has its own registry, so the workers should be
+monitored through statsd (set ``STATSD_HOST``), which aggregates across
+processes. The time and number of database queries of every task are also
+logged when it ends.
+
+"""
+import bisect
+import functools
+import logging
+import socket
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+__all__ = [
+    "Registry",
+    "StatsdSink",
+    "count",
+    "on_query",
+    "on_task",
+    "registry",
+    "setup_metrics",
+    "stage",
+    "timed",
+]
+
+# Upper bounds of the histogram buckets, in seconds…
+TIME_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 60, 300)
+# …and in number of queries
+COUNT_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000, 10000)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram(object):
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class StatsdSink(object):
+    """Send the metrics to a statsd daemon, over UDP.
+
+    Labels are appended to the metric name, as statsd has none. Packets are
+    sent without waiting, and lost ones are ignored.
+    """
+
+    def __init__(self, host, port=8125, prefix="matcher"):
+        self.address = (host, int(port))
+        self.prefix = prefix
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def name(self, name: str, labels: Labels) -> str:
+        parts = [self.prefix, name] + [value for (_, value) in labels]
+        return ".".join(part.replace(".", "_") for part in parts if part)
+
+    def send(self, line: str):
+        try:
+            self.socket.sendto(line.encode("utf-8"), self.address)
+        except OSError:
+            pass
+
+    def inc(self, name: str, labels: Labels, value):
+        self.send("{}:{}|c".format(self.name(name, labels), value))
+
+    def observe(self, name: str, labels: Labels, value):
+        if name.endswith("_seconds"):
+            self.send("{}:{:.3f}|ms".format(self.name(name, labels), value * 1000))
+        else:
+            self.send("{}:{}|h".format(self.name(name, labels), value))
+
+
+class Registry(object):
+    """Counters and histograms, by name and labels."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters: Dict[Tuple[str, Labels], float] = {}
+        self.histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self.sinks: List[StatsdSink] = []
+
+    def inc(self, name: str, value=1, **labels):
+        """Increment a counter"""
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+        for sink in self.sinks:
+            sink.inc(name, key[1], value)
+
+    def observe(self, name: str, value, buckets=TIME_BUCKETS, **labels):
+        """Add a value to a histogram"""
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+        for sink in self.sinks:
+            sink.observe(name, key[1], value)
+
+    def clear(self):
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def render(self) -> str:
+        """Render the metrics in the Prometheus text format"""
+
+        def fmt(labels, **extra):
+            labels = list(labels) + list(extra.items())
+            if not labels:
+                return ""
+            return "{{{}}}".format(
+                ",".join('{}="{}"'.format(key, value) for (key, value) in labels)
+            )
+
+        lines = []
+        with self.lock:
+            declared = set()
+            for ((name, labels), value) in sorted(self.counters.items()):
+                if name not in declared:
+                    lines.append("# TYPE {} counter".format(name))
+                    declared.add(name)
+                lines.append("{}{} {}".format(name, fmt(labels), value))
+
+            for ((name, labels), histogram) in sorted(self.histograms.items()):
+                if name not in declared:
+                    lines.append("# TYPE {} histogram".format(name))
+                    declared.add(name)
+                cumulative = 0
+                bounds = [str(bound) for bound in histogram.buckets] + ["+Inf"]
+                for (bound, bucket) in zip(bounds, histogram.counts):
+                    cumulative += bucket
+                    lines.append(
+                        "{}_bucket{} {}".format(name, fmt(labels, le=bound), cumulative)
+                    )
+                lines.append("{}_sum{} {}".format(name, fmt(labels), histogram.sum))
+                lines.append("{}_count{} {}".format(name, fmt(labels), histogram.count))
+
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+"""The registry of this process"""
+
+# What the current task did so far. Greenlet-local when gevent patched the
+# threading module, like in the workers.
+_task = threading.local()
+
+
+def _current_task() -> Optional[str]:
+    return getattr(_task, "name", None)
+
+
+@contextmanager
+def stage(name: str):
+    """Time a stage of a process.
+
+    Example
+    -------
+    >>> with stage("import.merge"):
+    ...     obj = reduce_or_create_ids(ids)
+
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        registry.observe("matcher_stage_seconds", elapsed, stage=name)
+        stages = getattr(_task, "stages", None)
+        if stages is not None:
+            stages[name] += elapsed
+
+
+def timed(name: str):
+    """Decorator version of :func:`stage`"""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapped(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+
+        return wrapped
+
+    return decorator
+
+
+def count(kind: str, value=1):
+    """Count processed items, like rows or objects"""
+    registry.inc("matcher_items_total", value, kind=kind)
+
+
+# Other instrumentation built on the same listeners, see :func:`on_query` and
+# :func:`on_task`
+_query_hooks: List[Callable[[str, float], None]] = []
+_task_hooks: List[Tuple[Callable, Callable]] = []
+
+
+def on_query(hook: Callable[[str, float], None]):
+    """Call ``hook(statement, elapsed)`` after each database query"""
+    _listen()
+    if hook not in _query_hooks:
+        _query_hooks.append(hook)
+
+
+def on_task(prerun: Callable, postrun: Callable):
+    """Call ``prerun(task)`` before and ``postrun(task)`` after each task"""
+    _listen()
+    if (prerun, postrun) not in _task_hooks:
+        _task_hooks.append((prerun, postrun))
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._query_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._query_start
+    task = _current_task() or "none"
+    registry.inc("matcher_db_queries_total", task=task)
+    registry.inc("matcher_db_query_seconds_total", elapsed, task=task)
+
+    if _current_task() is not None:
+        _task.queries += 1
+        _task.query_time += elapsed
+
+    for hook in _query_hooks:
+        hook(statement, elapsed)
+
+
+def _task_prerun(task=None, **_):
+    _task.name = task.name
+    _task.start = time.perf_counter()
+    _task.queries = 0
+    _task.query_time = 0.0
+    _task.stages = Counter()
+
+    for (prerun, _) in _task_hooks:
+        prerun(task)
+
+
+def _task_postrun(task=None, state=None, **_):
+    for (_, postrun) in _task_hooks:
+        postrun(task)
+
+    if _current_task() is None:
+        return
+
+    elapsed = time.perf_counter() - _task.start
+    registry.observe("matcher_task_seconds", elapsed, task=task.name, state=state)
+    registry.observe(
+        "matcher_task_queries", _task.queries, buckets=COUNT_BUCKETS, task=task.name
+    )
+
+    logger.info(
+        "%s: %.3fs, %d queries in %.3fs%s",
+        task.name,
+        elapsed,
+        _task.queries,
+        _task.query_time,
+        "".join(
+            ", {} {:.3f}s".format(name, seconds)
+            for (name, seconds) in _task.stages.most_common()
+        ),
+    )
+    _task.name = None
+    _task.stages = None
+
+
+def _listen():
+    """Listen to the queries and the Celery tasks"""
+    from celery.signals import task_postrun, task_prerun
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    # The listeners are global, and the app might be created more than once
+    if not event.contains(Engine, "after_cursor_execute", _after_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+        task_prerun.connect(_task_prerun, weak=False)
+        task_postrun.connect(_task_postrun, weak=False)
+
+
+def setup_metrics(app):
+    """Hook the metrics to the database, Celery, and the ``/metrics`` route"""
+    from flask import Response
+
+    _listen()
+
+    host = app.config.get("STATSD_HOST")
+    if host and not registry.sinks:
+        registry.sinks.append(
+            StatsdSink(
+                host,
+                port=app.config.get("STATSD_PORT", 8125),
+                prefix=app.config.get("STATSD_PREFIX", "matcher"),
+            )
+        )
+
+    @app.route("/metrics")
+    def metrics():
+        return Response(
+            registry.render(), mimetype="text/plain; version=0.0.4; charset=utf-8"
+        )
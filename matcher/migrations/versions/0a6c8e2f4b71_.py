@@ -0,0 +1,54 @@
+"""Schedule export files by size
+
+Revision ID: 0a6c8e2f4b71
+Revises: f7b3d2a61c09
+Create Date: 2026-10-19 17:48:30.552816
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "0a6c8e2f4b71"
+down_revision = "f7b3d2a61c09"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "export_file", sa.Column("expected_rows", sa.Integer(), nullable=True)
+    )
+    op.sync_enum_values(
+        "public",
+        "exportfilestatus",
+        ["ABSENT", "DONE", "FAILED", "PROCESSING", "QUERYING", "SCHEDULED"],
+        [
+            "ABSENT",
+            "DISPATCHED",
+            "DONE",
+            "FAILED",
+            "PROCESSING",
+            "QUERYING",
+            "SCHEDULED",
+        ],
+    )
+
+
+def downgrade():
+    # FIXME: downgrade probably does not work
+    op.sync_enum_values(
+        "public",
+        "exportfilestatus",
+        [
+            "ABSENT",
+            "DISPATCHED",
+            "DONE",
+            "FAILED",
+            "PROCESSING",
+            "QUERYING",
+            "SCHEDULED",
+        ],
+        ["ABSENT", "DONE", "FAILED", "PROCESSING", "QUERYING", "SCHEDULED"],
+    )
+    op.drop_column("export_file", "expected_rows")
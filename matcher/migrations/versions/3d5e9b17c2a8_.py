@@ -0,0 +1,57 @@
+"""Keep the home totals in count_stats
+
+Revision ID: 3d5e9b17c2a8
+Revises: 0a6c8e2f4b71
+Create Date: 2026-10-19 19:02:11.417305
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "3d5e9b17c2a8"
+down_revision = "0a6c8e2f4b71"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(sa.schema.CreateSequence(sa.Sequence("count_stats_id_seq")))
+    op.create_table(
+        "count_stats",
+        sa.Column(
+            "id",
+            sa.Integer(),
+            server_default=sa.text("nextval('count_stats_id_seq'::regclass)"),
+            nullable=False,
+        ),
+        sa.Column("name", sa.String(), nullable=False),
+        sa.Column("key", sa.String(), server_default="", nullable=False),
+        sa.Column("value", sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint("id", name=op.f("pk_count_stats")),
+    )
+    op.create_index(
+        "ix_count_stats_name_key", "count_stats", ["name", "key"], unique=False
+    )
+
+    op.execute(
+        """
+        INSERT INTO count_stats (name, key, value)
+        SELECT 'external_object', type::text, count(*)
+        FROM external_object WHERE type IS NOT NULL GROUP BY type
+        UNION ALL
+        SELECT 'platform', type::text, count(*) FROM platform GROUP BY type
+        UNION ALL
+        SELECT 'object_link', '', count(*) FROM object_link
+        UNION ALL
+        SELECT 'scrap_success', date::date::text, count(*)
+        FROM scrap WHERE status = 'SUCCESS' AND date IS NOT NULL
+        GROUP BY date::date
+        """
+    )
+
+
+def downgrade():
+    op.drop_index("ix_count_stats_name_key", table_name="count_stats")
+    op.drop_table("count_stats")
+    op.execute(sa.schema.DropSequence(sa.Sequence("count_stats_id_seq")))
@@ -0,0 +1,60 @@
+"""Add the merge_candidate table
+
+Revision ID: 5d1c0a7e93b2
+Revises: 3e39f93ee858
+Create Date: 2026-10-19 10:12:31.418226
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "5d1c0a7e93b2"
+down_revision = "3e39f93ee858"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(sa.schema.CreateSequence(sa.Sequence("merge_candidate_id_seq")))
+    op.create_table(
+        "merge_candidate",
+        sa.Column(
+            "id",
+            sa.Integer(),
+            server_default=sa.text("nextval('merge_candidate_id_seq'::regclass)"),
+            nullable=False,
+        ),
+        sa.Column("obj_id", sa.Integer(), nullable=False),
+        sa.Column("into_id", sa.Integer(), nullable=False),
+        sa.Column("score", sa.Float(), nullable=False),
+        sa.Column(
+            "status",
+            sa.Enum(
+                "PENDING",
+                "ACCEPTED",
+                "REJECTED",
+                "MERGED",
+                "FAILED",
+                name="mergecandidatestatus",
+            ),
+            server_default="PENDING",
+            nullable=False,
+        ),
+        sa.Column("message", sa.Text(), nullable=True),
+        sa.PrimaryKeyConstraint("id", name="pk_merge_candidate"),
+        sa.UniqueConstraint("obj_id", "into_id", name="uq_merge_candidate_obj_id"),
+    )
+    op.create_index(
+        "ix_merge_candidate_status_score",
+        "merge_candidate",
+        ["status", "score"],
+        unique=False,
+    )
+
+
+def downgrade():
+    op.drop_index("ix_merge_candidate_status_score", table_name="merge_candidate")
+    op.drop_table("merge_candidate")
+    op.execute("DROP TYPE mergecandidatestatus")
+    op.execute(sa.schema.DropSequence(sa.Sequence("merge_candidate_id_seq")))
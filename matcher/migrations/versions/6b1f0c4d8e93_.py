@@ -0,0 +1,94 @@
+"""Store the counts of the scraps and roll them up by day
+
+Revision ID: 6b1f0c4d8e93
+Revises: 3d5e9b17c2a8
+Create Date: 2026-10-19 19:41:52.208164
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "6b1f0c4d8e93"
+down_revision = "3d5e9b17c2a8"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "scrap",
+        sa.Column("links_count", sa.Integer(), server_default="0", nullable=False),
+    )
+    op.add_column(
+        "scrap",
+        sa.Column("objects_count", sa.Integer(), server_default="0", nullable=False),
+    )
+    # The objects sent by past scraps are lost, count the ones they linked
+    op.execute(
+        """
+        UPDATE scrap
+        SET links_count = counts.links, objects_count = counts.objects
+        FROM (
+            SELECT scrap_link.scrap_id,
+                count(*) AS links,
+                count(DISTINCT object_link.external_object_id) AS objects
+            FROM scrap_link
+            JOIN object_link ON object_link.id = scrap_link.object_link_id
+            GROUP BY scrap_link.scrap_id
+        ) AS counts
+        WHERE counts.scrap_id = scrap.id
+        """
+    )
+
+    op.execute(sa.schema.CreateSequence(sa.Sequence("scrap_rollup_id_seq")))
+    op.create_table(
+        "scrap_rollup",
+        sa.Column(
+            "id",
+            sa.Integer(),
+            server_default=sa.text("nextval('scrap_rollup_id_seq'::regclass)"),
+            nullable=False,
+        ),
+        sa.Column("day", sa.DATE(), nullable=False),
+        sa.Column("platform_id", sa.Integer(), nullable=False),
+        sa.Column("scraps_count", sa.Integer(), server_default="0", nullable=False),
+        sa.Column("links_count", sa.BigInteger(), server_default="0", nullable=False),
+        sa.Column(
+            "objects_count", sa.BigInteger(), server_default="0", nullable=False
+        ),
+        sa.ForeignKeyConstraint(
+            ["platform_id"],
+            ["platform.id"],
+            name="fk_scrap_rollup_platform_id_platform",
+            onupdate="CASCADE",
+            ondelete="CASCADE",
+        ),
+        sa.PrimaryKeyConstraint("id", name="pk_scrap_rollup"),
+    )
+    op.create_index(
+        "uq_scrap_rollup_day_platform_id",
+        "scrap_rollup",
+        ["day", "platform_id"],
+        unique=True,
+    )
+
+    op.execute(
+        """
+        INSERT INTO scrap_rollup
+            (day, platform_id, scraps_count, links_count, objects_count)
+        SELECT date::date, platform_id, count(*), sum(links_count),
+            sum(objects_count)
+        FROM scrap
+        WHERE status IN ('SUCCESS', 'FAILED') AND date IS NOT NULL
+        GROUP BY date::date, platform_id
+        """
+    )
+
+
+def downgrade():
+    op.drop_index("uq_scrap_rollup_day_platform_id", table_name="scrap_rollup")
+    op.drop_table("scrap_rollup")
+    op.execute(sa.schema.DropSequence(sa.Sequence("scrap_rollup_id_seq")))
+    op.drop_column("scrap", "objects_count")
+    op.drop_column("scrap", "links_count")
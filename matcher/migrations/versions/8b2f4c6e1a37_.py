@@ -0,0 +1,57 @@
+"""Add the session_link table
+
+Revision ID: 8b2f4c6e1a37
+Revises: 5d1c0a7e93b2
+Create Date: 2026-10-19 14:02:47.903114
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "8b2f4c6e1a37"
+down_revision = "5d1c0a7e93b2"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "session_link",
+        sa.Column("session_id", sa.Integer(), nullable=False),
+        sa.Column("object_link_id", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["object_link_id"],
+            ["object_link.id"],
+            name="fk_session_link_object_link_id_object_link",
+            onupdate="CASCADE",
+            ondelete="CASCADE",
+        ),
+        sa.ForeignKeyConstraint(
+            ["session_id"],
+            ["session.id"],
+            name="fk_session_link_session_id_session",
+            onupdate="CASCADE",
+            ondelete="CASCADE",
+        ),
+        sa.PrimaryKeyConstraint("session_id", "object_link_id", name="pk_session_link"),
+    )
+
+    # Fill it for the existing sessions
+    op.execute(
+        """
+        INSERT INTO session_link (session_id, object_link_id)
+        SELECT session_scrap.session_id, scrap_link.object_link_id
+        FROM scrap_link
+        JOIN session_scrap ON session_scrap.scrap_id = scrap_link.scrap_id
+        UNION
+        SELECT session_import_file.session_id, import_link.object_link_id
+        FROM import_link
+        JOIN session_import_file
+        ON session_import_file.import_file_id = import_link.import_file_id
+        """
+    )
+
+
+def downgrade():
+    op.drop_table("session_link")
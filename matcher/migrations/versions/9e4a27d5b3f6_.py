@@ -0,0 +1,87 @@
+"""Search the objects with an index of all their titles
+
+Revision ID: 9e4a27d5b3f6
+Revises: 6b1f0c4d8e93
+Create Date: 2026-10-19 20:24:37.640512
+
+"""
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "9e4a27d5b3f6"
+down_revision = "6b1f0c4d8e93"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.execute("CREATE EXTENSION IF NOT EXISTS unaccent")
+
+    op.create_table(
+        "object_search",
+        sa.Column("external_object_id", sa.Integer(), nullable=False),
+        sa.Column("document", sa.Text(), nullable=False),
+        sa.Column("search_vector", postgresql.TSVECTOR(), nullable=False),
+        sa.Column("score", sa.Float(), server_default="0", nullable=False),
+        sa.ForeignKeyConstraint(
+            ["external_object_id"],
+            ["external_object.id"],
+            name="fk_object_search_external_object_id_external_object",
+            onupdate="CASCADE",
+            ondelete="CASCADE",
+        ),
+        sa.PrimaryKeyConstraint("external_object_id", name="pk_object_search"),
+    )
+
+    op.execute(
+        """
+        INSERT INTO object_search
+            (external_object_id, document, search_vector, score)
+        SELECT documents.external_object_id, documents.document,
+            to_tsvector('simple', documents.document),
+            (
+                SELECT count(*) FROM object_link
+                WHERE object_link.external_object_id = documents.external_object_id
+            )
+        FROM (
+            SELECT external_object_id,
+                lower(unaccent(string_agg(text, ' '))) AS document
+            FROM value
+            WHERE type IN ('TITLE', 'NAME')
+            GROUP BY external_object_id
+        ) AS documents
+        """
+    )
+
+    # The indexes are quicker to build once the table is filled
+    op.create_index(
+        "ix_object_search_search_vector",
+        "object_search",
+        ["search_vector"],
+        unique=False,
+        postgresql_using="gin",
+    )
+    op.create_index(
+        "ix_object_search_document",
+        "object_search",
+        ["document"],
+        unique=False,
+        postgresql_using="gin",
+        postgresql_ops={"document": "gin_trgm_ops"},
+    )
+    op.create_index(
+        "ix_object_search_score",
+        "object_search",
+        ["score", "external_object_id"],
+        unique=False,
+    )
+
+
+def downgrade():
+    op.drop_index("ix_object_search_score", table_name="object_search")
+    op.drop_index("ix_object_search_document", table_name="object_search")
+    op.drop_index("ix_object_search_search_vector", table_name="object_search")
+    op.drop_table("object_search")
@@ -0,0 +1,84 @@
+"""Add the series_stats table
+
+Revision ID: c41e7a9d2b58
+Revises: 8b2f4c6e1a37
+Create Date: 2026-10-19 15:37:12.284519
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "c41e7a9d2b58"
+down_revision = "8b2f4c6e1a37"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(sa.schema.CreateSequence(sa.Sequence("series_stats_id_seq")))
+    op.create_table(
+        "series_stats",
+        sa.Column(
+            "id",
+            sa.Integer(),
+            server_default=sa.text("nextval('series_stats_id_seq'::regclass)"),
+            nullable=False,
+        ),
+        sa.Column("series_id", sa.Integer(), nullable=False),
+        sa.Column("platform_id", sa.Integer(), nullable=True),
+        sa.Column("seasons_count", sa.Integer(), server_default="0", nullable=False),
+        sa.Column("episodes_count", sa.Integer(), server_default="0", nullable=False),
+        sa.ForeignKeyConstraint(
+            ["platform_id"],
+            ["platform.id"],
+            name="fk_series_stats_platform_id_platform",
+            onupdate="CASCADE",
+            ondelete="CASCADE",
+        ),
+        sa.ForeignKeyConstraint(
+            ["series_id"],
+            ["external_object.id"],
+            name="fk_series_stats_series_id_external_object",
+            onupdate="CASCADE",
+            ondelete="CASCADE",
+        ),
+        sa.PrimaryKeyConstraint("id", name="pk_series_stats"),
+    )
+    op.create_index(
+        "uq_series_stats_series_id_platform_id",
+        "series_stats",
+        ["series_id", sa.text("coalesce(platform_id, 0)")],
+        unique=True,
+    )
+
+    # Fill it for the existing series
+    op.execute(
+        """
+        INSERT INTO series_stats
+            (series_id, platform_id, seasons_count, episodes_count)
+        SELECT
+            episode.series_id,
+            object_link.platform_id,
+            count(DISTINCT episode.season),
+            count(DISTINCT (episode.season, episode.episode))
+        FROM episode
+        LEFT JOIN object_link
+        ON object_link.external_object_id = episode.external_object_id
+        WHERE episode.series_id IS NOT NULL
+        GROUP BY GROUPING SETS (
+            (episode.series_id, object_link.platform_id),
+            (episode.series_id)
+        )
+        HAVING NOT (
+            grouping(object_link.platform_id) = 0
+            AND object_link.platform_id IS NULL
+        )
+        """
+    )
+
+
+def downgrade():
+    op.drop_index("uq_series_stats_series_id_platform_id", table_name="series_stats")
+    op.drop_table("series_stats")
+    op.execute(sa.schema.DropSequence(sa.Sequence("series_stats_id_seq")))
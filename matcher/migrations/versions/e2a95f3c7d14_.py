@@ -0,0 +1,60 @@
+"""Add output settings to export factories and files
+
+Revision ID: e2a95f3c7d14
+Revises: c41e7a9d2b58
+Create Date: 2026-10-19 16:21:05.730192
+
+"""
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "e2a95f3c7d14"
+down_revision = "c41e7a9d2b58"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    exportcodec = postgresql.ENUM("UTF_8", "UTF_16", name="exportcodec")
+    exportcodec.create(op.get_bind())
+    exportcompression = postgresql.ENUM(
+        "NONE", "GZIP", "ZSTD", name="exportcompression"
+    )
+    exportcompression.create(op.get_bind())
+
+    for table in ["export_factory", "export_file"]:
+        op.add_column(
+            table,
+            sa.Column(
+                "codec",
+                sa.Enum("UTF_8", "UTF_16", name="exportcodec"),
+                server_default="UTF_16",
+                nullable=False,
+            ),
+        )
+        op.add_column(
+            table,
+            sa.Column(
+                "compression",
+                sa.Enum("NONE", "GZIP", "ZSTD", name="exportcompression"),
+                server_default="GZIP",
+                nullable=False,
+            ),
+        )
+        op.add_column(
+            table, sa.Column("compression_level", sa.Integer(), nullable=True)
+        )
+        op.add_column(table, sa.Column("buffer_size", sa.Integer(), nullable=True))
+
+
+def downgrade():
+    for table in ["export_factory", "export_file"]:
+        op.drop_column(table, "buffer_size")
+        op.drop_column(table, "compression_level")
+        op.drop_column(table, "compression")
+        op.drop_column(table, "codec")
+
+    op.execute("DROP TYPE exportcompression")
+    op.execute("DROP TYPE exportcodec")
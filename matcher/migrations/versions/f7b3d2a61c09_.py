@@ -0,0 +1,36 @@
+"""Add the export template format
+
+Revision ID: f7b3d2a61c09
+Revises: e2a95f3c7d14
+Create Date: 2026-10-19 17:04:48.119503
+
+"""
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "f7b3d2a61c09"
+down_revision = "e2a95f3c7d14"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    exportformat = postgresql.ENUM("CSV", "PARQUET", "ARROW", name="exportformat")
+    exportformat.create(op.get_bind())
+
+    op.add_column(
+        "export_template",
+        sa.Column(
+            "format",
+            sa.Enum("CSV", "PARQUET", "ARROW", name="exportformat"),
+            server_default="CSV",
+            nullable=False,
+        ),
+    )
+
+
+def downgrade():
+    op.drop_column("export_template", "format")
+    op.execute("DROP TYPE exportformat")
@@ -0,0 +1,228 @@
+"""Keyset pagination.
+
+``query.paginate()`` skips the previous pages with ``OFFSET`` and counts the
+whole result, both of which get slow deep into big tables. Keyset pagination
+instead remembers the ordering keys of the last row of a page in a cursor,
+and fetches the rows that come after it, which an index on the keys makes
+as fast for the last page as for the first one.
+
+The exact total is only counted when asked for, and cached for a while.
+
+"""
+import base64
+import binascii
+import json
+import time
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from flask import abort, current_app, request
+from sqlalchemy import and_, false, or_, true
+from sqlalchemy.orm.attributes import QueryableAttribute
+
+__all__ = [
+    "InvalidCursor",
+    "Key",
+    "KeysetPage",
+    "keyset_paginate",
+    "ordering_keys",
+    "paginate_request",
+]
+
+
+class Key(NamedTuple):
+    """An ordering key of a keyset pagination"""
+
+    attribute: QueryableAttribute
+    descending: bool = False
+    nullable: bool = False
+
+    def reverse(self) -> "Key":
+        return self._replace(descending=not self.descending)
+
+    @property
+    def order_by(self):
+        return self.attribute.desc() if self.descending else self.attribute.asc()
+
+    def after(self, value):
+        """Rows strictly after a value, with NULLs sorted last in ascending
+        order and first in descending order, like PostgreSQL does."""
+        column = self.attribute
+        if value is None:
+            return column.isnot(None) if self.descending else false()
+        if self.descending:
+            return column < value
+        if self.nullable:
+            return or_(column > value, column.is_(None))
+        return column > value
+
+    def equals(self, value):
+        return self.attribute.is_(None) if value is None else self.attribute == value
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(values: List[Any], backwards: bool = False) -> str:
+    data = json.dumps({"v": values, "b": backwards}, default=str).encode("utf-8")
+    return base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[List[Any], bool]:
+    try:
+        data = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        decoded = json.loads(data.decode("utf-8"))
+        return (list(decoded["v"]), bool(decoded["b"]))
+    except (binascii.Error, ValueError, KeyError, TypeError) as e:
+        raise InvalidCursor(cursor) from e
+
+
+def _after(keys: List[Key], values: List[Any]):
+    """The condition for the rows after a row, in the order of the keys"""
+    clauses = []
+    for (index, (key, value)) in enumerate(zip(keys, values)):
+        previous = [k.equals(v) for (k, v) in zip(keys[:index], values[:index])]
+        clauses.append(and_(*previous, key.after(value)))
+    return or_(*clauses) if clauses else true()
+
+
+_count_cache: Dict[str, Tuple[float, int]] = {}
+
+
+def cached_count(query, ttl: Optional[int] = None) -> int:
+    """Count the rows of a query, reusing the count of the same query for a
+    while"""
+    if ttl is None:
+        ttl = current_app.config.get("PAGINATION_COUNT_TTL", 300)
+
+    statement = query.order_by(None).statement.compile()
+    cache_key = repr((str(statement), sorted(statement.params.items())))
+
+    now = time.monotonic()
+    cached = _count_cache.get(cache_key)
+    if cached is not None and cached[0] > now:
+        return cached[1]
+
+    total = query.order_by(None).count()
+    if len(_count_cache) >= 1000:
+        _count_cache.clear()
+    _count_cache[cache_key] = (now + ttl, total)
+    return total
+
+
+class KeysetPage(object):
+    """A page of results, and the cursors to the pages around it.
+
+    It has the same ``items``, ``per_page``, ``total``, ``has_next`` and
+    ``has_prev`` attributes as the Flask-SQLAlchemy pagination.
+    """
+
+    def __init__(self, items, per_page, next_cursor, prev_cursor, total=None):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = total
+
+    @property
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self) -> bool:
+        return self.prev_cursor is not None
+
+
+def keyset_paginate(
+    query,
+    keys: List[Key],
+    cursor: Optional[str] = None,
+    per_page: int = 20,
+    total: bool = False,
+) -> KeysetPage:
+    """Fetch a page of a query.
+
+    Parameters
+    ----------
+    query : sqlalchemy.orm.query.Query
+        its ordering is replaced by the keys
+    keys : list of :obj:`Key`
+        the ordering keys. The last one must be unique, like the primary key
+    cursor : str, optional
+        the ``next_cursor`` or ``prev_cursor`` of another page, the first page
+        if omitted
+    per_page : int
+    total : bool
+        also count the rows of the query, see :func:`cached_count`
+
+    Raises
+    ------
+    InvalidCursor
+        if the cursor could not be decoded
+
+    """
+    (values, backwards) = decode_cursor(cursor) if cursor else (None, False)
+    if values is not None and len(values) != len(keys):
+        raise InvalidCursor(cursor)
+
+    count = cached_count(query) if total else None
+
+    ordering = [key.reverse() for key in keys] if backwards else keys
+    paged = query.order_by(None).order_by(*(key.order_by for key in ordering))
+    if values is not None:
+        paged = paged.filter(_after(ordering, values))
+
+    # One more row tells if there is a page after this one
+    items = paged.limit(per_page + 1).all()
+    more = len(items) > per_page
+    items = items[:per_page]
+    if backwards:
+        items.reverse()
+
+    def cursor_of(item, backwards):
+        return encode_cursor(
+            [getattr(item, key.attribute.key) for key in keys], backwards
+        )
+
+    has_next = more if not backwards else values is not None
+    has_prev = more if backwards else values is not None
+
+    return KeysetPage(
+        items=items,
+        per_page=per_page,
+        next_cursor=cursor_of(items[-1], False) if items and has_next else None,
+        prev_cursor=cursor_of(items[0], True) if items and has_prev else None,
+        total=count,
+    )
+
+
+def paginate_request(query, keys: List[Key]) -> KeysetPage:
+    """Paginate with the ``cursor``, ``per_page`` and ``total`` arguments of the
+    current request"""
+    try:
+        return keyset_paginate(
+            query,
+            keys,
+            cursor=request.args.get("cursor", None, str),
+            per_page=min(request.args.get("per_page", 20, int), 100),
+            total=request.args.get("total", False, lambda value: value == "1"),
+        )
+    except InvalidCursor:
+        abort(400)
+
+
+def ordering_keys(order_map, unique, key=None, direction="asc") -> List[Key]:
+    """Build the keys for an ordering like :func:`matcher.utils.apply_ordering`
+    does, with a unique key to break the ties.
+
+    The columns of the map can be given as (column, nullable) tuples.
+    """
+    descending = direction == "desc"
+    column = order_map.get(key, None)
+    keys = []
+    if column is not None:
+        (column, nullable) = column if isinstance(column, tuple) else (column, False)
+        if column is not unique:
+            keys.append(Key(column, descending, nullable))
+    keys.append(Key(unique, descending))
+    return keys
@@ -0,0 +1,195 @@
+"""Record the SQL queries of each request and task.
+
+Lazy loads in a loop, like reading ``link.scraps`` for every row of a list,
+show up as the same statement being run over and over. The recorder groups
+the statements by shape (the SQL without its literal values) and flags the
+shapes repeated at least ``QUERY_PROFILER_THRESHOLD`` times as likely N+1
+queries.
+
+The totals are sent in the ``X-Query-*`` and ``Server-Timing`` headers of
+every response, and the suspects are logged as warnings. When
+``QUERY_PROFILER_REPORT`` is set (the default in debug mode), the profiles of
+the last requests and tasks are listed on ``/_profiler``.
+
+"""
+import logging
+import re
+import threading
+from collections import Counter, deque
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["QueryProfile", "current_profile", "setup_profiler", "statement_shape"]
+
+_patterns = [
+    # Bound parameters and literals
+    (re.compile(r"%\(\w+\)s|%s|\?|\$\d+"), "?"),
+    (re.compile(r"'(?:[^']|'')*'"), "?"),
+    (re.compile(r"\b\d+(?:\.\d+)?\b"), "?"),
+    # Expanded IN lists, of any length
+    (re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)"), "(?)"),
+    (re.compile(r"\s+"), " "),
+]
+
+
+def statement_shape(statement: str) -> str:
+    """Strip the values from a SQL statement.
+
+    Example
+    -------
+    >>> statement_shape("SELECT * FROM value WHERE id IN (%(id_1)s, %(id_2)s)")
+    'SELECT * FROM value WHERE id IN (?)'
+
+    """
+    for (pattern, replacement) in _patterns:
+        statement = pattern.sub(replacement, statement)
+    return statement.strip()
+
+
+class QueryProfile(object):
+    """The queries run by one request or task.
+
+    Parameters
+    ----------
+    name : str
+        what ran the queries, like ``GET /api/platforms/``
+
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.count = 0
+        self.time = 0.0
+        # Counting the raw statements is cheap, they are only shaped at the end
+        self._statements: Counter = Counter()
+        self._durations: Dict[str, float] = Counter()
+
+    def record(self, statement: str, elapsed: float):
+        self.count += 1
+        self.time += elapsed
+        self._statements[statement] += 1
+        self._durations[statement] += elapsed
+
+    def shapes(self) -> List[dict]:
+        """The statements grouped by shape, the most frequent first"""
+        shapes: Dict[str, dict] = {}
+        for (statement, count) in self._statements.items():
+            shape = statement_shape(statement)
+            entry = shapes.setdefault(shape, {"shape": shape, "count": 0, "time": 0.0})
+            entry["count"] += count
+            entry["time"] += self._durations[statement]
+
+        return sorted(shapes.values(), key=lambda entry: -entry["count"])
+
+    def suspects(self, threshold: int) -> List[dict]:
+        """The shapes repeated often enough to be N+1 queries"""
+        return [entry for entry in self.shapes() if entry["count"] >= threshold]
+
+    def to_dict(self, threshold: int) -> dict:
+        return {
+            "name": self.name,
+            "count": self.count,
+            "time": self.time,
+            "suspects": self.suspects(threshold),
+            "shapes": self.shapes(),
+        }
+
+
+_local = threading.local()
+
+recent_profiles: deque = deque(maxlen=50)
+"""The last finished profiles, for the report"""
+
+
+def current_profile() -> Optional[QueryProfile]:
+    """The profile of the current request or task, if any"""
+    return getattr(_local, "profile", None)
+
+
+def _start(name: str):
+    _local.profile = QueryProfile(name)
+
+
+def _finish(threshold: int, keep: bool):
+    profile = current_profile()
+    _local.profile = None
+    if profile is None:
+        return (None, [])
+
+    suspects = profile.suspects(threshold)
+    for entry in suspects:
+        logger.warning(
+            "%s: possible N+1, %d times (%.3fs) %s",
+            profile.name,
+            entry["count"],
+            entry["time"],
+            entry["shape"],
+        )
+
+    if keep:
+        recent_profiles.appendleft(profile)
+
+    return (profile, suspects)
+
+
+# Settings of the task profiles, from the last app set up
+_task_settings = {"threshold": 10, "keep": False}
+
+
+def _record(statement: str, elapsed: float):
+    profile = current_profile()
+    if profile is not None:
+        profile.record(statement, elapsed)
+
+
+def _start_task(task):
+    _start(task.name)
+
+
+def _finish_task(task):
+    _finish(**_task_settings)
+
+
+def setup_profiler(app):
+    """Record the queries of the requests and the Celery tasks.
+
+    The queries are timed by the listeners of :mod:`matcher.metrics`.
+    """
+    from flask import jsonify, request
+
+    from matcher.metrics import on_query, on_task
+
+    if not app.config.get("QUERY_PROFILER", True):
+        return
+
+    threshold = app.config.get("QUERY_PROFILER_THRESHOLD", 10)
+    keep = app.config.get("QUERY_PROFILER_REPORT", app.debug)
+
+    _task_settings.update(threshold=threshold, keep=keep)
+    on_query(_record)
+    on_task(_start_task, _finish_task)
+
+    @app.before_request
+    def start_request():
+        _start("{} {}".format(request.method, request.path))
+
+    @app.after_request
+    def finish_request(response):
+        # Do not fill the report with the requests reading it
+        kept = keep and request.endpoint != "profiler"
+        (profile, suspects) = _finish(threshold, kept)
+        if profile is not None:
+            duration = profile.time * 1000
+            timing = 'db;dur={:.1f};desc="{} queries"'.format(duration, profile.count)
+            response.headers["X-Query-Count"] = str(profile.count)
+            response.headers["X-Query-Time"] = "{:.1f}".format(duration)
+            response.headers["X-Query-Repeated"] = str(len(suspects))
+            response.headers["Server-Timing"] = timing
+        return response
+
+    if keep:
+
+        @app.route("/_profiler")
+        def profiler():
+            return jsonify([profile.to_dict(threshold) for profile in recent_profiles])
@@ -1,24 +1,32 @@
 from .base import Base, metadata
 from .export import ExportFactory, ExportFile, ExportTemplate
 from .import_ import ImportFile
+from .merge import MergeCandidate
 from .object import Episode, ExternalObject, ObjectLink, Person, Role
 from .platform import Platform, PlatformGroup, Scrap, Session
 from .provider import Provider, ProviderPlatform
+from .search import ObjectSearch
+from .stats import CountStats, ScrapRollup, SeriesStats
 from .utils import ensure_extension
 from .value import Value, ValueSource
 
 ensure_extension("tablefunc", metadata)
 ensure_extension("hstore", metadata)
+ensure_extension("pg_trgm", metadata)
+ensure_extension("unaccent", metadata)
 
 __all__ = [
     "Base",
+    "CountStats",
     "Episode",
     "ExportFactory",
     "ExportFile",
     "ExportTemplate",
     "ExternalObject",
     "ImportFile",
+    "MergeCandidate",
     "ObjectLink",
+    "ObjectSearch",
     "Person",
     "Platform",
     "PlatformGroup",
@@ -26,6 +34,8 @@ __all__ = [
     "ProviderPlatform",
     "Role",
     "Scrap",
+    "ScrapRollup",
+    "SeriesStats",
     "Session",
     "Value",
     "ValueSource",
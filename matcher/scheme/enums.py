@@ -61,6 +61,9 @@ class ExportFileStatus(CustomEnum):
     ABSENT = 6
     """The file was empty or was deleted"""
 
+    DISPATCHED = 7
+    """The job was sent to a worker queue by the scheduler"""
+
     __transitions__ = [
         Transition(
             "schedule",
@@ -68,10 +71,15 @@ class ExportFileStatus(CustomEnum):
             SCHEDULED,
             doc="Process this file",
         ),
-        Transition("start", [SCHEDULED, FAILED, ABSENT], QUERYING),
+        Transition("dispatch", [SCHEDULED], DISPATCHED),
+        Transition("start", [SCHEDULED, DISPATCHED, FAILED, ABSENT], QUERYING),
         Transition("processing", [QUERYING], PROCESSING),
         Transition("done", [PROCESSING, QUERYING], DONE),
-        Transition("failed", [SCHEDULED, QUERYING, PROCESSING, FAILED, DONE], FAILED),
+        Transition(
+            "failed",
+            [SCHEDULED, DISPATCHED, QUERYING, PROCESSING, FAILED, DONE],
+            FAILED,
+        ),
         Transition("delete", [DONE, PROCESSING], ABSENT, doc="Delete this file"),
     ]
 
@@ -87,6 +95,23 @@ class ExportRowType(CustomEnum):
     OBJECT_LINK = 2
 
 
+class ExportFormat(CustomEnum):
+    CSV = 1
+    PARQUET = 2
+    ARROW = 3
+
+
+class ExportCodec(CustomEnum):
+    UTF_8 = 1
+    UTF_16 = 2
+
+
+class ExportCompression(CustomEnum):
+    NONE = 1
+    GZIP = 2
+    ZSTD = 3
+
+
 class ImportFileStatus(CustomEnum):
     UPLOADED = 1
     PROCESSING = 2
@@ -101,6 +126,25 @@ class ImportFileStatus(CustomEnum):
     ]
 
 
+class MergeCandidateStatus(CustomEnum):
+    """Review status of a stored merge candidate"""
+
+    PENDING = 1
+    """The candidate was scored but not reviewed yet"""
+
+    ACCEPTED = 2
+    """The candidate was accepted and will be merged regardless of its score"""
+
+    REJECTED = 3
+    """The candidate was rejected and will never be merged"""
+
+    MERGED = 4
+    """The two objects were merged"""
+
+    FAILED = 5
+    """The merge failed, see the candidate message"""
+
+
 class ExternalObjectType(CustomEnum):
     """A type of object in database."""
 
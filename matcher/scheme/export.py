@@ -3,10 +3,14 @@
 import codecs
 import csv
 import gzip
+import io
+import os
 import re
-from collections import OrderedDict
-from functools import partial
-from typing import Any, Callable, Dict, Iterator, List, Set
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from functools import partial, reduce
+from itertools import islice
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
 
 from celery import Celery
 from jinja2 import Environment, StrictUndefined, meta, nodes
@@ -19,22 +23,33 @@ from sqlalchemy import (
     Integer,
     Sequence,
     String,
-    any_,
+    and_,
     column,
     func,
     or_,
     select,
     table,
+    true,
 )
 from sqlalchemy.dialects.postgresql import HSTORE, JSONB
-from sqlalchemy.orm import column_property, contains_eager, relationship, subqueryload
+from sqlalchemy.orm import (
+    column_property,
+    contains_eager,
+    joinedload,
+    relationship,
+    subqueryload,
+)
 
+from matcher.metrics import count, stage
 from matcher.utils import export_path
 
 from .base import Base
 from .enums import (
+    ExportCodec,
+    ExportCompression,
     ExportFactoryIterator,
     ExportFileStatus,
+    ExportFormat,
     ExportRowType,
     ExternalObjectType,
     PlatformType,
@@ -45,6 +60,39 @@ __all__ = ["ExportTemplate", "ExportFactory", "ExportFile"]
 
 csv_dialect = csv.excel_tab
 
+# Python codec and byte order mark written for each `ExportCodec`. The BOM is
+# what makes Excel pick the right encoding.
+_codecs = {
+    ExportCodec.UTF_8: ("utf-8", codecs.BOM_UTF8),
+    ExportCodec.UTF_16: ("utf-16-le", codecs.BOM_UTF16_LE),
+}
+
+# HTTP content-coding and file extension for each `ExportCompression`
+_compressions = {
+    ExportCompression.NONE: (None, ""),
+    ExportCompression.GZIP: ("gzip", ".gz"),
+    ExportCompression.ZSTD: ("zstd", ".zst"),
+}
+
+# File extension and MIME type of the columnar formats
+_columnar_formats = {
+    ExportFormat.PARQUET: (".parquet", "application/vnd.apache.parquet"),
+    ExportFormat.ARROW: (".arrow", "application/vnd.apache.arrow.file"),
+}
+
+# Extensions replaced by the real one when a file is downloaded
+_known_extensions = (
+    {".csv"}
+    | {ext for (ext, _) in _columnar_formats.values()}
+    | {ext for (_, ext) in _compressions.values() if ext}
+)
+
+# How many rows are written at once in columnar files
+COLUMNAR_BATCH_SIZE = 10000
+
+# Key of the PostgreSQL advisory lock held while dispatching export files
+_dispatch_lock_id = 0x6578706F
+
 ExportFactoryTemplateContext = Dict[str, Any]
 ExportFileFilters = Dict[str, str]
 ExportFileContext = Dict[str, Any]
@@ -82,6 +130,66 @@ def _quote(field: Any) -> str:
     return field
 
 
+def _value_kind(value: Any) -> Optional[str]:
+    """Guess the kind of column that can hold a value"""
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return "boolean"
+    if isinstance(value, int):
+        return "integer"
+    if isinstance(value, float):
+        return "float"
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return "list"
+    return "string"
+
+
+_numeric_kinds = ["boolean", "integer", "float"]
+
+
+def _widen(kind: Optional[str], other: Optional[str]) -> Optional[str]:
+    """The narrowest kind of column that can hold the values of both kinds"""
+    if kind is None or kind == other:
+        return other
+    if other is None:
+        return kind
+    if "list" in (kind, other):
+        return "list"
+    if kind in _numeric_kinds and other in _numeric_kinds:
+        return max(kind, other, key=_numeric_kinds.index)
+    return "string"
+
+
+def _coerce(kind: str, value: Any) -> Any:
+    """Convert a value so that it fits in a column of the given kind"""
+    if value is None:
+        return None
+    if kind == "list":
+        if not isinstance(value, (list, tuple, set, frozenset)):
+            value = [value]
+        return [str(item) for item in value if item is not None]
+    if kind == "boolean":
+        return bool(value)
+    if kind == "integer":
+        return int(value)
+    if kind == "float":
+        return float(value)
+    return str(value)
+
+
+def _arrow_type(kind: str):
+    import pyarrow as pa
+
+    return {
+        "string": pa.string(),
+        "integer": pa.int64(),
+        "float": pa.float64(),
+        "boolean": pa.bool_(),
+        "list": pa.list_(pa.string()),
+    }[kind]
+
+
 _jinja_env = Environment()
 _jinja_env.filters["quote"] = _quote
 _jinja_env.filters["slugify"] = slugify
@@ -244,6 +352,12 @@ class ExportTemplate(Base):
 
     row_type = Column(Enum(ExportRowType), nullable=False)
     external_object_type = Column(Enum(ExternalObjectType), nullable=False)
+    format = Column(
+        Enum(ExportFormat),
+        nullable=False,
+        default=ExportFormat.CSV,
+        server_default="CSV",
+    )
     fields = Column(JSONB, nullable=False)  # FIXME: how do we store fields?
 
     factories = relationship("ExportFactory", back_populates="template")
@@ -349,8 +463,9 @@ class ExportTemplate(Base):
 
     @inject_session
     def get_row_query(self, session=None):
-        from .object import ObjectLink, ExternalObject, Episode
+        from .object import ObjectLink, ExternalObject
         from .platform import Platform
+        from .stats import SeriesStats
 
         needs = self.needs
 
@@ -359,23 +474,27 @@ class ExportTemplate(Base):
                 "Platform can't be queried when the row_type is EXTERNAL_OBJECT"
             )
 
+        # All the link columns are pivoted from a single lateral subquery, so
+        # the links of each object are scanned once whatever their number
         platforms = [Platform.lookup(session, slug) for slug in self.links]
-        links_select = [
-            select([ObjectLink.external_id])
-            .where(ObjectLink.platform == platform)
-            .where(ObjectLink.external_object_id == ExternalObject.id)
-            .limit(1)
-            .correlate(ExternalObject)
-            .label(platform.slug)
-            for platform in platforms
-        ]
-
-        def filter_platform(q, platform_id):
-            # misc function to filter on a platform, depending on the row_type
-            if self.row_type == ExportRowType.EXTERNAL_OBJECT:
-                return q.filter(platform_id == any_(func.array_agg(Platform.id)))
-            elif self.row_type == ExportRowType.OBJECT_LINK:
-                return q.filter(platform_id == Platform.id)
+        links_lateral = None
+        links_select = []
+        if platforms:
+            links_lateral = (
+                select(
+                    [
+                        func.min(ObjectLink.external_id)
+                        .filter(ObjectLink.platform_id == platform.id)
+                        .label(platform.slug)
+                        for platform in platforms
+                    ]
+                )
+                .where(ObjectLink.external_object_id == ExternalObject.id)
+                .where(ObjectLink.platform_id.in_([p.id for p in platforms]))
+                .correlate(ExternalObject)
+                .lateral("links")
+            )
+            links_select = list(links_lateral.c)
 
         # WARN: this needs to be an ordered dict, because python3.5 does not
         # keep the order on defaultdict while python3.6 does.
@@ -383,32 +502,8 @@ class ExportTemplate(Base):
             [
                 ("platform_countries", func.array_agg(func.distinct(Platform.country))),
                 ("platform_names", func.array_agg(Platform.name)),
-                (
-                    "seasons_count",
-                    filter_platform(
-                        session.query(func.count(func.distinct(Episode.season)))
-                        .join(
-                            ObjectLink,
-                            Episode.external_object_id == ObjectLink.external_object_id,
-                        )
-                        .filter(Episode.series_id == ExternalObject.id),
-                        ObjectLink.platform_id,
-                    ),
-                ),
-                (
-                    "episodes_count",
-                    filter_platform(
-                        session.query(
-                            func.count(func.distinct(Episode.season, Episode.episode))
-                        )
-                        .join(
-                            ObjectLink,
-                            Episode.external_object_id == ObjectLink.external_object_id,
-                        )
-                        .filter(Episode.series_id == ExternalObject.id),
-                        ObjectLink.platform_id,
-                    ),
-                ),
+                ("seasons_count", func.coalesce(SeriesStats.seasons_count, 0)),
+                ("episodes_count", func.coalesce(SeriesStats.episodes_count, 0)),
             ]
         )
 
@@ -433,6 +528,33 @@ class ExportTemplate(Base):
                 .options(contains_eager(ObjectLink.platform).joinedload(Platform.group))
             )
 
+        # Episodes and seasons are counted ahead of time, see `SeriesStats`
+        if "seasons_count" in needs or "episodes_count" in needs:
+            if self.row_type == ExportRowType.EXTERNAL_OBJECT:
+                # Rows span multiple platforms, take the overall counts
+                query = query.outerjoin(
+                    SeriesStats,
+                    and_(
+                        SeriesStats.series_id == ExternalObject.id,
+                        SeriesStats.platform_id.is_(None),
+                    ),
+                ).group_by(SeriesStats.id)
+            elif self.row_type == ExportRowType.OBJECT_LINK:
+                # There is at most one row per series and platform
+                query = query.outerjoin(
+                    SeriesStats,
+                    and_(
+                        SeriesStats.series_id == ExternalObject.id,
+                        SeriesStats.platform_id == Platform.id,
+                    ),
+                )
+
+        if links_lateral is not None:
+            # The subquery always returns one row, even without any link
+            query = query.join(links_lateral, true())
+            if self.row_type == ExportRowType.EXTERNAL_OBJECT:
+                query = query.group_by(*links_select)
+
         if "attributes" in needs:
             query = query.options(subqueryload(ExternalObject.attributes))
 
@@ -444,6 +566,23 @@ class ExportTemplate(Base):
         template = _jinja_env.from_string(self.template)
         return lambda context: template.render(**context)
 
+    def compile_columns(self) -> List[Tuple[str, Optional[str], Callable]]:
+        """Compile each field to a column of a columnar export.
+
+        Each field becomes a (name, kind, expression) tuple. The kind comes
+        from the optional ``type`` key of the field, and the expression
+        evaluates the ``value`` of the field without rendering it to a string,
+        so lists are kept as such.
+        """
+        return [
+            (
+                field.get("name") or "column_{}".format(index),
+                field.get("type"),
+                _jinja_env.compile_expression(field.get("value", '""')),
+            )
+            for (index, field) in enumerate(self.fields)
+        ]
+
     @property
     def template(self) -> str:
         return csv_dialect.delimiter.join(
@@ -458,7 +597,43 @@ class ExportTemplate(Base):
         )
 
 
-class ExportFactory(Base):
+class ExportOutputMixin(object):
+    """How an export is encoded and compressed on disk."""
+
+    codec = Column(
+        Enum(ExportCodec),
+        nullable=False,
+        default=ExportCodec.UTF_16,
+        server_default="UTF_16",
+    )
+    """:obj:`ExportCodec` : text encoding of the CSV"""
+
+    compression = Column(
+        Enum(ExportCompression),
+        nullable=False,
+        default=ExportCompression.GZIP,
+        server_default="GZIP",
+    )
+    """:obj:`ExportCompression` : how the CSV is compressed"""
+
+    compression_level = Column(Integer)
+    """:obj:`int` : compression level, the compressor's default if NULL"""
+
+    buffer_size = Column(Integer)
+    """:obj:`int` : how many bytes are buffered before being compressed"""
+
+    @property
+    def output_settings(self):
+        """:obj:`dict` : the output settings, to be copied to another object"""
+        return {
+            "codec": self.codec,
+            "compression": self.compression,
+            "compression_level": self.compression_level,
+            "buffer_size": self.buffer_size,
+        }
+
+
+class ExportFactory(Base, ExportOutputMixin):
     __tablename__ = "export_factory"
 
     export_factory_id_seq = Sequence("export_factory_id_seq", metadata=Base.metadata)
@@ -558,11 +733,12 @@ class ExportFactory(Base):
                 session=scrap_session,
                 path=path_template(context),
                 filters=filters_template(context),
+                **self.output_settings,
             )
 
 
 @ExportFileStatus.act_as_statemachine("status")
-class ExportFile(Base):
+class ExportFile(Base, ExportOutputMixin):
     __tablename__ = "export_file"
 
     export_file_id_seq = Sequence("export_file_id_seq", metadata=Base.metadata)
@@ -585,6 +761,9 @@ class ExportFile(Base):
 
     session_id = Column(Integer, ForeignKey("session.id"), nullable=False)
 
+    expected_rows = Column(Integer)
+    """:obj:`int` : rough size of the file, used to schedule it"""
+
     session = relationship("Session", back_populates="files")
     logs = relationship("ExportFileLog", back_populates="file")
 
@@ -607,31 +786,20 @@ class ExportFile(Base):
     def filter_query(self, query):
         from .object import ObjectLink
 
-        # FIXME: THIS DOES NOT TAKE THE scrap_session INTO ACCOUNT
-        from .platform import Platform, Scrap, Session
-        from .import_ import ImportFile
-
-        session = query.session  # i guess this works
+        from .platform import Platform, session_link
 
         # FIXME: way to override this?
         query = query.filter(Platform.ignore_in_exports.is_(False))
 
-        import_file_query = (
-            session.query(ObjectLink.id)
-            .join(ObjectLink.imports)
-            .join(ImportFile.sessions)
-            .filter(Session.id == self.session.id)
-        )
-
-        session_query = (
-            session.query(ObjectLink.id)
-            .join(ObjectLink.scraps)
-            .join(Scrap.sessions)
-            .filter(Session.id == self.session.id)
+        # The links of the session are kept up to date in `session_link`
+        query = query.join(
+            session_link,
+            and_(
+                session_link.c.object_link_id == ObjectLink.id,
+                session_link.c.session_id == self.session.id,
+            ),
         )
 
-        query = query.filter(ObjectLink.id.in_(session_query.union(import_file_query)))
-
         for (key, values) in self.filters.items():
             # A filter might look like `platform.id => 19, 51`
             context, attribute = key.split(".")
@@ -696,9 +864,51 @@ class ExportFile(Base):
         yield self.template.header
         yield from self.render_rows(session=session)
 
+    @property
+    def columnar(self) -> bool:
+        """Whether the file is written in a columnar format"""
+        return self.template is not None and self.template.format in _columnar_formats
+
+    @property
+    def content_coding(self) -> Optional[str]:
+        """The HTTP content-coding of the file, if compressed as a whole"""
+        if self.columnar:
+            # Columnar files compress their data internally
+            return None
+        return _compressions[self.compression][0]
+
+    @property
+    def extension(self) -> str:
+        if self.columnar:
+            return _columnar_formats[self.template.format][0]
+        return ".csv" + _compressions[self.compression][1]
+
+    @property
+    def mimetype(self) -> str:
+        if self.columnar:
+            return _columnar_formats[self.template.format][1]
+        if self.content_coding is not None:
+            return "application/{}".format(self.content_coding)
+        return "text/csv"
+
     @property
     def real_name(self):
-        return "{id}.csv.gz".format(id=self.id)
+        return "{id}{ext}".format(id=self.id, ext=self.extension)
+
+    def download_name(self, decoded: bool = False) -> str:
+        """Name of the file when downloaded.
+
+        The extensions the path already ends with are replaced by the real
+        one. ``decoded`` tells if the client removes the content-coding of the
+        file, and gets the plain CSV.
+        """
+        name = self.path.split("/")[-1]
+        while True:
+            (stem, ext) = os.path.splitext(name)
+            if not stem or ext.lower() not in _known_extensions:
+                break
+            name = stem
+        return name + (".csv" if decoded else self.extension)
 
     def open(self, *args, **kwargs):
         return (export_path() / self.real_name).open(*args, **kwargs)
@@ -710,24 +920,256 @@ class ExportFile(Base):
     @after_save("schedule")
     def schedule_task(self, celery, *_, **__):
         assert isinstance(celery, Celery)
-        celery.send_task("matcher.tasks.export.process_file", [self.id], countdown=3)
+        if self.expected_rows is None:
+            # Counting can take a while, it is not done by the dispatch
+            celery.send_task("matcher.tasks.export.count_rows", [self.id])
+        else:
+            celery.send_task("matcher.tasks.export.dispatch_files", countdown=3)
+
+    @classmethod
+    def dispatch_scheduled(cls, session, queues, max_active_queries=None):
+        """Pick the scheduled files that can be processed now.
+
+        Smaller files are picked first, and each file goes to the first queue
+        it fits in. A queue never has more files dispatched or running than its
+        concurrency cap.
+
+        Parameters
+        ----------
+        session : sqlalchemy.orm.session.Session
+        queues : list of (str, int, int)
+            the name, maximum expected rows (or None) and concurrency cap of
+            each queue
+        max_active_queries : int, optional
+            dispatch nothing while the database runs that many queries
+
+        Returns
+        -------
+        list of (ExportFile, str)
+            the dispatched files with their queue, or None if throttled
+
+        Notes
+        -----
+        The dispatched files are not committed. Committing also releases the
+        lock that prevents two dispatches from running at once.
+
+        """
+        # Dispatches are serialized, otherwise both would see free slots
+        session.execute(select([func.pg_advisory_xact_lock(_dispatch_lock_id)]))
+
+        if max_active_queries is not None:
+            activity = table("pg_stat_activity", column("state"), column("datname"))
+            active = session.execute(
+                select([func.count()])
+                .select_from(activity)
+                .where(activity.c.state == "active")
+                .where(activity.c.datname == func.current_database())
+            ).scalar()
+            if active >= max_active_queries:
+                return None
+
+        scheduled = (
+            session.query(cls)
+            .filter(cls.status == ExportFileStatus.SCHEDULED)
+            .options(joinedload(cls.template), joinedload(cls.session))
+            .all()
+        )
+
+        def queue_of(rows):
+            for (name, max_rows, _) in queues:
+                if max_rows is None or (rows is not None and rows <= max_rows):
+                    return name
+            return queues[-1][0]
+
+        running = Counter(
+            queue_of(rows)
+            for (rows,) in session.query(cls.expected_rows).filter(
+                cls.status.in_(
+                    [
+                        ExportFileStatus.DISPATCHED,
+                        ExportFileStatus.QUERYING,
+                        ExportFileStatus.PROCESSING,
+                    ]
+                )
+            )
+        )
+        caps = {name: concurrency for (name, _, concurrency) in queues}
+
+        dispatched = []
+        # The files not counted yet go last, to the queue of the largest files
+        for file in sorted(
+            scheduled, key=lambda f: (f.expected_rows is None, f.expected_rows, f.id)
+        ):
+            name = queue_of(file.expected_rows)
+            if running[name] >= caps[name]:
+                continue
+
+            running[name] += 1
+            file.dispatch()
+            dispatched.append((file, name))
+
+        return dispatched
 
     @after
     def log_status(self, message=None, *_, **__):
         self.logs.append(ExportFileLog(status=self.status, message=message))
 
+    @contextmanager
+    def compressor(self, file):
+        """Wrap a binary file to compress what is written to it."""
+        level = self.compression_level
+
+        if self.compression is ExportCompression.GZIP:
+            with gzip.GzipFile(
+                fileobj=file, mode="wb", compresslevel=9 if level is None else level
+            ) as compressed:
+                yield compressed
+
+        elif self.compression is ExportCompression.ZSTD:
+            # Optional dependency, only needed when a factory asks for it
+            import zstandard
+
+            compressor = zstandard.ZstdCompressor(level=3 if level is None else level)
+            with compressor.stream_writer(file, closefd=False) as compressed:
+                yield compressed
+
+        else:
+            yield file
+
+    def columnar_writer(self, file, schema):
+        """Open a columnar writer on a binary file.
+
+        The compression settings are passed to the writer, since columnar
+        files are compressed by chunks rather than as a whole.
+        """
+        import pyarrow as pa
+
+        codec = {
+            ExportCompression.NONE: None,
+            ExportCompression.GZIP: "gzip",
+            ExportCompression.ZSTD: "zstd",
+        }[self.compression]
+
+        if self.template.format is ExportFormat.PARQUET:
+            import pyarrow.parquet as pq
+
+            return pq.ParquetWriter(
+                file,
+                schema,
+                compression=codec or "none",
+                compression_level=self.compression_level,
+            )
+
+        # Arrow IPC files only support LZ4 and ZSTD
+        options = pa.ipc.IpcWriteOptions(
+            compression="zstd" if codec == "zstd" else None
+        )
+        return pa.ipc.new_file(file, schema, options=options)
+
+    @inject_session
+    def process_columnar(self, session=None):
+        columns = self.template.compile_columns()
+        kinds = [kind for (_, kind, _) in columns]
+        guessed = [index for (index, kind) in enumerate(kinds) if kind is None]
+        while kinds is not None:
+            kinds = self._write_columnar(columns, kinds, guessed, session=session)
+
+    def _write_columnar(self, columns, kinds, guessed, session):
+        """Write the columnar file with the given column kinds.
+
+        The kinds not given by the template (the ``guessed`` indexes) are
+        guessed from the first batch. The schema of the file can't change
+        afterwards, so when a later batch does not fit, the wider kinds are
+        returned for the file to be written again. ``None`` is returned once
+        the file is written.
+        """
+        import pyarrow as pa
+
+        kinds = list(kinds)
+        contexts = self.row_contexts(session=session)
+        schema = None
+        writer = None
+        rows = 0
+        with self.open(mode="wb") as file:
+            try:
+                while True:
+                    values = [
+                        [expression(**context) for (_, _, expression) in columns]
+                        for context in islice(contexts, COLUMNAR_BATCH_SIZE)
+                    ]
+
+                    widened = list(kinds)
+                    for index in guessed:
+                        found = (_value_kind(row[index]) for row in values)
+                        widened[index] = reduce(_widen, found, kinds[index])
+
+                    if schema is None:
+                        kinds = [kind or "string" for kind in widened]
+                        schema = pa.schema(
+                            [
+                                (name, _arrow_type(kind))
+                                for ((name, _, _), kind) in zip(columns, kinds)
+                            ]
+                        )
+                        writer = self.columnar_writer(file, schema)
+                    elif widened != kinds:
+                        count("export.columnar.widened")
+                        return widened
+
+                    if not values:
+                        break
+
+                    arrays = [
+                        pa.array(
+                            [_coerce(kind, row[index]) for row in values],
+                            type=_arrow_type(kind),
+                        )
+                        for (index, kind) in enumerate(kinds)
+                    ]
+                    with stage("export.write"):
+                        writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+                    rows += len(values)
+
+                    if self.status is ExportFileStatus.QUERYING:
+                        self.processing()
+                        session.add(self)
+                        session.commit()
+            finally:
+                if writer is not None:
+                    writer.close()
+
+        count("export.rows", rows)
+        return None
+
     @after("start")
     @inject_session
     def process(self, session=None):
         # FIXME: this supposes that the object is already in the session
         # FIXME: move this to a task
-        # FIXME: should we gzip on the fly? where do we store everything?
-        with gzip.open(self.open(mode="wb"), "wb") as file:
-            # Write UTF16-LE BOM because Excel.
-            file.write(codecs.BOM_UTF16_LE)
+        if self.columnar:
+            return self.process_columnar(session=session)
+
+        (encoding, bom) = _codecs[self.codec]
+        buffer_size = self.buffer_size or io.DEFAULT_BUFFER_SIZE
+
+        rows = 0
+        with self.open(mode="wb") as raw, self.compressor(raw) as file:
+            # Rows are small, so they are written in chunks to keep the
+            # compressor busy with big enough blocks
+            buffer = [bom]
+            buffered = len(bom)
 
             for index, row in enumerate(self.render(session=session)):
-                file.write((row + csv_dialect.lineterminator).encode("utf-16-le"))
+                data = (row + csv_dialect.lineterminator).encode(encoding)
+                buffer.append(data)
+                buffered += len(data)
+                rows = index  # The first one is the header
+
+                if buffered >= buffer_size:
+                    with stage("export.write"):
+                        file.write(b"".join(buffer))
+                    buffer = []
+                    buffered = 0
 
                 # FIXME: quite ugly but it works
                 if index == 1:  # We passed the header row
@@ -735,6 +1177,11 @@ class ExportFile(Base):
                     session.add(self)
                     session.commit()
 
+            with stage("export.write"):
+                file.write(b"".join(buffer))
+
+        count("export.rows", rows)
+
 
 class ExportFileLog(Base):
     __tablename__ = "export_file_log"
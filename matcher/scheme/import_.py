@@ -31,6 +31,7 @@ from sqlalchemy.dialects.postgresql import HSTORE
 from sqlalchemy.orm import column_property, relationship
 
 from matcher.exceptions import LinksOverlap, ObjectTypeMismatchError
+from matcher.metrics import count, stage
 from matcher.utils import import_path
 
 from .base import Base
@@ -255,6 +256,19 @@ class ImportFile(Base):
 
         return external_object_ids, attributes, links
 
+    @after("done")
+    @inject_session
+    def refresh_sessions(self, *_, session=None, **__):
+        for s in self.sessions:
+            s.refresh_links(session=session)
+
+    @after("done")
+    @inject_session
+    def refresh_search(self, *_, session=None, **__):
+        from .search import ObjectSearch
+
+        ObjectSearch.refresh(session, ObjectSearch.touched(import_file=self))
+
     @after("process")
     @inject_session
     def process_import(self, session=None):
@@ -262,7 +276,7 @@ class ImportFile(Base):
 
         tasks = []
 
-        with self.csv_reader() as reader:
+        with stage("import.parse"), self.csv_reader() as reader:
             # Fetch the header and map to fields
             header = next(reader)
             fields = self.map_fields(header)
@@ -368,73 +382,81 @@ class ImportFile(Base):
 
         if len(external_object_ids) > 0:
             # We are about to add new links, remove the old one and clear the attributes set by it
-            for (platform, external_ids) in links:
-                if len(external_ids) == 0:
-                    continue
-
-                logger.info("Deleting links (%d, %r)", platform.id, external_ids)
-                existing_links = (
-                    session.query(ObjectLink)
-                    .filter(
-                        ObjectLink.platform == platform,
-                        ObjectLink.external_object_id.in_(external_object_ids),
-                        ~ObjectLink.external_id.in_(external_ids),
+            with stage("import.unlink"):
+                for (platform, external_ids) in links:
+                    if len(external_ids) == 0:
+                        continue
+
+                    logger.info("Deleting links (%d, %r)", platform.id, external_ids)
+                    existing_links = (
+                        session.query(ObjectLink)
+                        .filter(
+                            ObjectLink.platform == platform,
+                            ObjectLink.external_object_id.in_(external_object_ids),
+                            ~ObjectLink.external_id.in_(external_ids),
+                        )
+                        .delete(synchronize_session=False)
                     )
-                    .delete(synchronize_session=False)
-                )
-
-                if existing_links:
-                    logger.info("A link was removed, deleting values")
-                    # Delete the values that were associated with this platform
-                    session.query(ValueSource).filter(
-                        ValueSource.platform == platform
-                    ).filter(
-                        ValueSource.value_id.in_(
-                            session.query(Value.id).filter(
-                                Value.external_object_id.in_(external_object_ids)
+
+                    if existing_links:
+                        logger.info("A link was removed, deleting values")
+                        # Delete the values that were associated with this platform
+                        session.query(ValueSource).filter(
+                            ValueSource.platform == platform
+                        ).filter(
+                            ValueSource.value_id.in_(
+                                session.query(Value.id).filter(
+                                    Value.external_object_id.in_(external_object_ids)
+                                )
                             )
+                        ).delete(
+                            synchronize_session=False
                         )
-                    ).delete(
-                        synchronize_session=False
-                    )
 
-            session.commit()
+                session.commit()
 
         # Fetch other existing external_object_ids from the links
-        external_object_ids += self.find_additional_links(links=links, session=session)
+        with stage("import.lookup"):
+            external_object_ids += self.find_additional_links(
+                links=links, session=session
+            )
 
         if len(external_object_ids) <= 1 and not attributes and not links:
             return
 
         # Get one merged ExternalObject
-        obj = self.reduce_or_create_ids(external_object_ids, session=session)
+        with stage("import.merge"):
+            obj = self.reduce_or_create_ids(external_object_ids, session=session)
 
         if obj is None:
             logger.error("External object not found %r", external_object_ids)
             return
 
         # Add the new links
-        for (platform, external_ids) in links:
-            for external_id in external_ids:
-                link = (
-                    session.query(ObjectLink)
-                    .filter(
-                        ObjectLink.external_id == external_id,
-                        ObjectLink.platform == platform,
-                        ObjectLink.external_object == obj,
+        with stage("import.link"):
+            for (platform, external_ids) in links:
+                for external_id in external_ids:
+                    link = (
+                        session.query(ObjectLink)
+                        .filter(
+                            ObjectLink.external_id == external_id,
+                            ObjectLink.platform == platform,
+                            ObjectLink.external_object == obj,
+                        )
+                        .first()
                     )
-                    .first()
-                )
 
-                if not link:
-                    link = ObjectLink(
-                        external_object=obj, platform=platform, external_id=external_id
-                    )
+                    if not link:
+                        link = ObjectLink(
+                            external_object=obj,
+                            platform=platform,
+                            external_id=external_id,
+                        )
 
-                if platform == self.platform:
-                    self.links.append(link)
+                    if platform == self.platform:
+                        self.links.append(link)
 
-        session.commit()
+            session.commit()
 
         attributes_list = set()
 
@@ -449,15 +471,17 @@ class ImportFile(Base):
                 if fmt and fmt != value:
                     attributes_list.add(attr_type(type_, fmt, 1.2 * scale))
 
-        for attribute in attributes_list:
-            obj.add_attribute(dict(attribute._asdict()), self.platform)
+        with stage("import.attributes"):
+            for attribute in attributes_list:
+                obj.add_attribute(dict(attribute._asdict()), self.platform)
 
-        # Cleanup attributes with no sources
-        session.query(Value).filter(Value.external_object_id == obj.id).filter(
-            ~Value.sources.any()
-        ).delete(synchronize_session=False)
-        session.commit()
+            # Cleanup attributes with no sources
+            session.query(Value).filter(Value.external_object_id == obj.id).filter(
+                ~Value.sources.any()
+            ).delete(synchronize_session=False)
+            session.commit()
 
+        count("import.rows")
         logger.info("Imported %d", obj.id)
 
     @after
@@ -0,0 +1,384 @@
+# -*- coding: utf-8 -*-
+"""Persisted merge candidates.
+
+The matcher scores pairs of similar :obj:`.object.ExternalObject` and stores
+them in the ``merge_candidate`` table using :func:`MergeCandidate.bulk_insert`.
+Stored candidates can be reviewed, and are then consumed best scores first by
+:func:`MergeCandidate.process`, which avoids re-scoring objects between runs.
+
+"""
+import logging
+
+from sqlalchemy import (
+    Column,
+    Enum,
+    Float,
+    Index,
+    Integer,
+    Sequence,
+    Text,
+    UniqueConstraint,
+    and_,
+    literal,
+    or_,
+    select,
+)
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import relationship
+
+from .base import Base
+from .enums import MergeCandidateStatus
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["DisjointSet", "MergeCandidate"]
+
+
+class DisjointSet(object):
+    """Union-find over object IDs, used to group merge candidates in chains."""
+
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, item):
+        """Find the representative of the set ``item`` belongs to."""
+        root = self.parent.setdefault(item, item)
+        while root != self.parent[root]:
+            root = self.parent[root]
+
+        # Path compression, so next lookups are quicker
+        while item != root:
+            self.parent[item], item = root, self.parent[item]
+
+        return root
+
+    def union(self, a, b):
+        """Merge the sets of ``a`` and ``b``."""
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            self.parent[max(root_a, root_b)] = min(root_a, root_b)
+
+    def groups(self):
+        """:obj:`dict` : the members of each set, by representative"""
+        groups = {}
+        for item in list(self.parent):
+            groups.setdefault(self.find(item), set()).add(item)
+        return groups
+
+
+class MergeCandidate(Base):
+    """Two objects that might be the same, with their similarity score."""
+
+    __tablename__ = "merge_candidate"
+
+    __table_args__ = (
+        UniqueConstraint("obj_id", "into_id"),
+        Index("ix_merge_candidate_status_score", "status", "score"),
+    )
+
+    merge_candidate_id_seq = Sequence("merge_candidate_id_seq", metadata=Base.metadata)
+    id = Column(
+        Integer,
+        merge_candidate_id_seq,
+        server_default=merge_candidate_id_seq.next_value(),
+        primary_key=True,
+    )
+    """:obj:`int` : primary key"""
+
+    # Those are not foreign keys on purpose: merging deletes one of the two
+    # objects, and the candidate has to outlive it to keep track of the result.
+    obj_id = Column(Integer, nullable=False)
+    """:obj:`int` : ID of the object to merge"""
+
+    into_id = Column(Integer, nullable=False)
+    """:obj:`int` : ID of the object it should be merged into"""
+
+    score = Column(Float, nullable=False)
+    """:obj:`float` : similarity score computed by the matcher"""
+
+    status = Column(
+        Enum(MergeCandidateStatus),
+        nullable=False,
+        default=MergeCandidateStatus.PENDING,
+        server_default="PENDING",
+    )
+    """:obj:`MergeCandidateStatus` : where this candidate is in the review"""
+
+    message = Column(Text)
+    """:obj:`str` : why the merge failed, if it did"""
+
+    obj = relationship(
+        "ExternalObject",
+        primaryjoin="foreign(MergeCandidate.obj_id) == ExternalObject.id",
+        viewonly=True,
+    )
+    """:obj:`.object.ExternalObject` : the object to merge, if it still exists"""
+
+    into = relationship(
+        "ExternalObject",
+        primaryjoin="foreign(MergeCandidate.into_id) == ExternalObject.id",
+        viewonly=True,
+    )
+    """:obj:`.object.ExternalObject` : the object to merge into, if it exists"""
+
+    def __repr__(self):
+        return self._repr(
+            obj=self.obj_id, into=self.into_id, score=self.score, status=self.status
+        )
+
+    @classmethod
+    def bulk_insert(cls, candidates, session, status=MergeCandidateStatus.PENDING):
+        """Store scored candidates in one statement.
+
+        Parameters
+        ----------
+        candidates : iterable of :obj:`.object.ScoredCandidate`
+            the candidates yielded by :func:`.object.ExternalObject.similar`
+        session : sqlalchemy.orm.session.Session
+        status : MergeCandidateStatus
+            the status of the new candidates
+
+        Returns
+        -------
+        int
+            the number of candidates written
+
+        Notes
+        -----
+        Pairs that are already known get their score and status updated, as
+        long as they were not reviewed or processed yet.
+
+        """
+        # Deduplicate the pairs, `ON CONFLICT` can't update a row twice
+        rows = {
+            (candidate.obj, candidate.into): {
+                "obj_id": candidate.obj,
+                "into_id": candidate.into,
+                "score": candidate.score,
+                "status": status,
+            }
+            for candidate in candidates
+            if candidate.obj != candidate.into
+        }
+
+        if not rows:
+            return 0
+
+        stmt = insert(cls.__table__).values(list(rows.values()))
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[cls.obj_id, cls.into_id],
+            set_={"score": stmt.excluded.score, "status": stmt.excluded.status},
+            where=(cls.status == MergeCandidateStatus.PENDING),
+        )
+        session.execute(stmt)
+
+        return len(rows)
+
+    @classmethod
+    def insert_from_select(
+        cls, pairs, session, score, status=MergeCandidateStatus.PENDING
+    ):
+        """Store candidates computed in the database, without fetching them.
+
+        Parameters
+        ----------
+        pairs : sqlalchemy.sql.expression.Alias
+            a subquery with an ``obj_id`` and an ``into_id`` column
+        session : sqlalchemy.orm.session.Session
+        score : float
+            the score given to all the candidates
+        status : MergeCandidateStatus
+            the status of the new candidates
+
+        Returns
+        -------
+        list of int
+            the IDs of the candidates written
+
+        See Also
+        --------
+        bulk_insert
+
+        """
+        stmt = insert(cls.__table__).from_select(
+            ["obj_id", "into_id", "score", "status"],
+            select(
+                [
+                    pairs.c.obj_id,
+                    pairs.c.into_id,
+                    literal(score, type_=cls.score.type),
+                    literal(status, type_=cls.status.type),
+                ]
+            ),
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[cls.obj_id, cls.into_id],
+            set_={"score": stmt.excluded.score, "status": stmt.excluded.status},
+            where=(cls.status == MergeCandidateStatus.PENDING),
+        )
+        return [id for (id,) in session.execute(stmt.returning(cls.id))]
+
+    @classmethod
+    def queue(cls, session, threshold=None, ids=None):
+        """Query the candidates that should be merged, best scores first.
+
+        Parameters
+        ----------
+        session : sqlalchemy.orm.session.Session
+        threshold : float, optional
+            pending candidates above this score are merged as well as the
+            accepted ones
+        ids : list of int, optional
+            only look at those candidates
+
+        """
+        condition = cls.status == MergeCandidateStatus.ACCEPTED
+        if threshold is not None:
+            condition = or_(
+                condition,
+                and_(
+                    cls.status == MergeCandidateStatus.PENDING, cls.score >= threshold
+                ),
+            )
+
+        if ids is not None:
+            condition = and_(condition, cls.id.in_(ids))
+
+        return (
+            session.query(cls)
+            .filter(condition)
+            .order_by(cls.score.desc(), cls.id.asc())
+        )
+
+    @classmethod
+    def resolve_merged(cls, session, ids):
+        """Find in which objects already merged objects ended up.
+
+        Objects are deleted once merged, so candidates written before a merge
+        can reference objects that no longer exist. The ``MERGED`` candidates
+        are followed to find the surviving object.
+
+        Parameters
+        ----------
+        session : sqlalchemy.orm.session.Session
+        ids : iterable of int
+            the IDs of the objects that do not exist anymore
+
+        Returns
+        -------
+        dict
+            the surviving object ID for each of ``ids`` that could be resolved
+
+        """
+        from .object import ExternalObject
+
+        ds = DisjointSet()
+        seen = set(ids)
+        frontier = set(ids)
+
+        while frontier:
+            edges = session.query(cls.obj_id, cls.into_id).filter(
+                and_(
+                    cls.status == MergeCandidateStatus.MERGED,
+                    or_(cls.obj_id.in_(frontier), cls.into_id.in_(frontier)),
+                )
+            )
+
+            frontier = set()
+            for (obj_id, into_id) in edges:
+                ds.union(obj_id, into_id)
+                frontier |= {obj_id, into_id} - seen
+
+            seen |= frontier
+
+        existing = [
+            id
+            for (id,) in session.query(ExternalObject.id).filter(
+                ExternalObject.id.in_(seen)
+            )
+        ]
+        survivors = {}
+        for id in existing:
+            survivors.setdefault(ds.find(id), []).append(id)
+
+        resolved = {}
+        for id in ids:
+            found = survivors.get(ds.find(id), [])
+            # More than one survivor means the history is inconsistent
+            if len(found) == 1:
+                resolved[id] = found[0]
+
+        return resolved
+
+    @classmethod
+    def process(cls, session, threshold=None, batch_size=100, limit=None, ids=None):
+        """Merge the queued candidates, committing after each batch.
+
+        Candidates are grouped in chains (``A → B``, ``B → C``…), and each chain
+        is merged at once. Chains are never split between two batches.
+
+        Parameters
+        ----------
+        session : sqlalchemy.orm.session.Session
+        threshold : float, optional
+            see :func:`queue`
+        batch_size : int
+            roughly how many candidates are merged per transaction
+        limit : int, optional
+            stop after this many candidates
+        ids : list of int, optional
+            only merge those candidates, see :func:`queue`
+
+        Returns
+        -------
+        dict
+            the number of candidates per resulting status
+
+        """
+        from .object import ExternalObject
+
+        queue = (
+            cls.queue(session, threshold=threshold, ids=ids)
+            .with_entities(cls.id, cls.obj_id, cls.into_id)
+            .limit(limit)
+            .all()
+        )
+
+        ds = DisjointSet()
+        for (_, obj_id, into_id) in queue:
+            ds.union(obj_id, into_id)
+
+        # Group the candidates by chain, best scores first
+        chains = {}
+        for (id, obj_id, _) in queue:
+            chains.setdefault(ds.find(obj_id), []).append(id)
+
+        batches = []
+        for chain in chains.values():
+            if not batches or (
+                batches[-1] and len(batches[-1]) + len(chain) > batch_size
+            ):
+                batches.append([])
+            batches[-1].extend(chain)
+
+        counts = {str(status): 0 for status in MergeCandidateStatus}
+        done = 0
+
+        for ids in batches:
+            batch = (
+                session.query(cls)
+                .filter(cls.id.in_(ids))
+                .order_by(cls.score.desc(), cls.id.asc())
+                .all()
+            )
+
+            ExternalObject.merge_candidates(batch, session=session)
+
+            for candidate in batch:
+                counts[str(candidate.status)] += 1
+
+            session.commit()
+            done += len(batch)
+            logger.info("Processed %d merge candidates", done)
+
+        return counts
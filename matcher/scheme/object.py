@@ -16,6 +16,7 @@ import math
 import re
 from operator import attrgetter, itemgetter
 
+from flask import current_app
 from sqlalchemy import (
     Column,
     Enum,
@@ -27,13 +28,25 @@ from sqlalchemy import (
     Text,
     and_,
     column,
+    exists,
     func,
+    literal,
     select,
     table,
     tuple_,
+    union,
 )
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import ResourceClosedError
 from sqlalchemy.ext.declarative import declared_attr
-from sqlalchemy.orm import aliased, column_property, foreign, joinedload, relationship
+from sqlalchemy.orm import (
+    aliased,
+    column_property,
+    foreign,
+    joinedload,
+    relationship,
+    selectinload,
+)
 from sqlalchemy.orm.session import object_session
 from tqdm import tqdm
 from unidecode import unidecode
@@ -50,10 +63,18 @@ from matcher.exceptions import (
     UnknownAttribute,
     UnknownRelation,
 )
+from matcher.metrics import count, stage
 from matcher.utils import Lock, trace
 
 from .base import Base
-from .enums import ExternalObjectType, Gender, PlatformType, RoleType, ValueType
+from .enums import (
+    ExternalObjectType,
+    Gender,
+    MergeCandidateStatus,
+    PlatformType,
+    RoleType,
+    ValueType,
+)
 
 # FIXME: this is an ugly wrapper to lazy-load the session. This file should
 # *not* depend on the session therefore it should be passed as an parameter of
@@ -193,7 +214,8 @@ def _normalize_link(link):
     return (int(platform_id), str(external_id))
 
 
-MergeCandidate = collections.namedtuple("MergeCandidate", "obj into score")
+ScoredCandidate = collections.namedtuple("ScoredCandidate", "obj into score")
+"""A pair of similar objects found by :func:`ExternalObject.similar`."""
 
 
 class ExternalObject(Base):
@@ -412,7 +434,9 @@ class ExternalObject(Base):
                 raise ExternalIDMismatchError(existing_link, external_id)
 
     @staticmethod
-    def lookup_or_create(obj_type, links, session, external_object_id=None):
+    def lookup_or_create(
+        obj_type, links, session, external_object_id=None, defer_merges=None
+    ):
         """Lookup for an object from its links.
 
         Parameters
@@ -421,18 +445,38 @@ class ExternalObject(Base):
             the type of object to search for.
         links : :obj:`list` of :obj:`tuple` of :obj:`int`
             list of links to use, see :func:`lookup_from_links`
+        defer_merges : bool, optional
+            record the objects the links resolve to as merge candidates instead
+            of merging them right away. Defaults to the ``DEFER_MERGES`` config
 
         Notes
         -----
         If no object matches any of the links, it will be created.
         Non-existent links will be added to the object.
 
+        When merges are deferred and the links resolve to multiple objects, the
+        one with the lowest ID is used until the merge candidates are processed.
+
         """
+        if defer_merges is None:
+            defer_merges = current_app.config["DEFER_MERGES"]
+
         with lookup_lock, session.begin_nested():
             try:
                 external_object = ExternalObject.lookup_from_links(links)
             except AmbiguousLinkError as err:
-                external_object = err.resolve(session)
+                if defer_merges:
+                    external_object = err.defer(session)
+                    # The other objects keep their links until the merge, they
+                    # must not be duplicated on the chosen one meanwhile
+                    linked = {
+                        (link.platform_id, link.external_id)
+                        for obj in err.objects
+                        for link in obj.links
+                    }
+                    links = [link for link in links if tuple(link) not in linked]
+                else:
+                    external_object = err.resolve(session)
 
             if external_object_id is not None:
                 other = session.query(ExternalObject).get(external_object_id)
@@ -477,8 +521,15 @@ class ExternalObject(Base):
         matcher.exceptions.LinksOverlap
             when the two objects have linked platforms in common
 
+        Notes
+        -----
+        Everything is moved using a few set-based statements, without loading
+        the links and values of the objects. The session is flushed before, and
+        the instances that might have been moved are expired afterwards.
+
         """
-        from .value import ValueSource
+        from .platform import Platform
+        from .value import Value, ValueSource
 
         logger.info("Merging %d into %d", self.id, their.id)
 
@@ -488,83 +539,48 @@ class ExternalObject(Base):
         assert self != their, "trying to merge an object into itself"
 
         session = object_session(self)
+        session.flush()
+
+        our_id, their_id = self.id, their.id
 
         with session.begin_nested():
             if self.type is not their.type:
                 raise ObjectTypeMismatchError(is_type=self.type, should_be=their.type)
 
-            to_delete = []
-            for our_link in self.links:
-                same_links = [
-                    link
-                    for link in their.links
-                    if link.platform == our_link.platform
-                    and our_link.external_id == link.external_id
-                ]
-                to_delete += same_links
-
-                if our_link.platform.allow_links_overlap:
-                    continue
-
-                overlapping_links = [
-                    link
-                    for link in their.links
-                    if link.platform == our_link.platform
-                    and our_link.external_id != link.external_id
-                ]
-                if overlapping_links:
-                    raise LinksOverlap(self, their)
-
-            for d in to_delete:
-                session.delete(d)
-
-            # First merge the links
-            for link in list(self.links):
-                link.external_object_id = their.id
-                session.add(link)
-
-        # Then merge the attributes
-        for our_attr in list(self.values):
-            # Lookup for a matching attribute
-            their_attr = next(
-                (
-                    attr
-                    for attr in their.values
-                    if our_attr.text == attr.text and our_attr.type == attr.type
-                ),
-                None,
+            our_link = aliased(ObjectLink)
+            their_link = aliased(ObjectLink)
+            overlap = (
+                session.query(our_link)
+                .join(
+                    their_link,
+                    and_(
+                        our_link.platform_id == their_link.platform_id,
+                        our_link.external_id != their_link.external_id,
+                    ),
+                )
+                .join(Platform, our_link.platform_id == Platform.id)
+                .filter(our_link.external_object_id == our_id)
+                .filter(their_link.external_object_id == their_id)
+                .filter(Platform.allow_links_overlap.is_(False))
+                .exists()
             )
+            if session.query(overlap).scalar():
+                raise LinksOverlap(self, their)
 
-            if their_attr is None:
-                # Move attribute if it was not present on their side
-                our_attr.external_object = their
-                session.add(our_attr)
-            else:
-                # Else move only the value sources.
-                # FIXME: *In theory*, we should not have any trouble merging by
-                # moving because the platforms on their side are *in theory*
-                # not the same as ours.
-                # We might wanna check for this.
-                for our_source in list(our_attr.sources):
-                    session.merge(
-                        ValueSource(
-                            score_factor=our_source.score_factor,
-                            platform_id=our_source.platform_id,
-                            value_id=their_attr.id,
-                        )
-                    )
-
-        session.query(Role).filter(Role.external_object_id == self.id).update(
-            {Role.external_object_id: their.id}
-        )
+            _merge_links(session, our_id, their_id)
+            _merge_values(session, our_id, their_id)
+            _merge_roles(session, our_id, their_id)
+            _merge_episodes(session, our_id, their_id)
 
-        session.query(Episode).filter(Episode.external_object_id == self.id).update(
-            {Episode.external_object_id: their.id}
-        )
+            if their.type in (ExternalObjectType.SERIES, ExternalObjectType.EPISODE):
+                _merge_series_stats(session, their_id)
 
-        session.query(Episode).filter(Episode.series_id == self.id).update(
-            {Episode.series_id: their.id}
-        )
+        # The statements above bypassed the session, expire what they touched
+        for instance in list(session.identity_map.values()):
+            if instance is self or instance is their or isinstance(
+                instance, (ObjectLink, Value, ValueSource, Role, Episode)
+            ):
+                session.expire(instance)
 
     def merge_and_delete(self, their, session):
         """Merge into another ExternalObject, and delete the old one.
@@ -582,61 +598,163 @@ class ExternalObject(Base):
             the merged object
 
         """
+        from .stats import CountStats
+
         self.merge(their)
 
         # It is safer to delete like this (and not `session.delete(self)`)
         # because the session might not be in sync with the database and might
         # delete object that we want to keep.
         session.query(ExternalObject).filter(ExternalObject.id == self.id).delete()
+        if self.type is not None:
+            # The bulk delete is not seen by the session
+            counts = {("external_object", self.type.name): -1}
+            CountStats.add(session.connection(), counts)
 
         return their
 
     @classmethod
-    def match_objects(cls, objects):
-        it = tqdm(map(lambda o: o.similar(), objects))
-        for similar in it:
-            s = list(similar)
-            for (obj, into, score) in s:
-                it.write("{}\t{}\t{}".format(obj, into, score))
+    def match_objects(cls, objects, store=True, echo=False, batch_size=500, stats=None):
+        """Find similar objects and store them as merge candidates.
+
+        Parameters
+        ----------
+        objects : iterable of :obj:`ExternalObject`
+            the objects to find similar objects for
+        store : bool
+            save the candidates in the `merge_candidate` table
+        echo : bool
+            also print the candidates as tab-separated values
+        batch_size : int
+            how many candidates are written at once
+        stats : bool, optional
+            see :func:`similar`
 
-        # candidates = sorted(candidates, key=attrgetter('score'), reverse=True)
+        Returns
+        -------
+        int
+            the number of candidates found
 
-        # for candidate in candidates:
-        #     print('{score:6.2f}: {obj:6d} -> {into:6d}'
-        #           .format(**candidate._asdict()))
+        """
+        from .merge import MergeCandidate
+
+        session = db.session
+        found = 0
+        batch = []
+
+        def flush():
+            if store and batch:
+                MergeCandidate.bulk_insert(batch, session=session)
+                session.commit()
+            batch.clear()
+
+        it = tqdm(objects)
+        for obj in it:
+            for candidate in obj.similar(stats=stats):
+                found += 1
+                batch.append(candidate)
+                if echo:
+                    it.write("{}\t{}\t{}".format(*candidate))
+
+            if len(batch) >= batch_size:
+                flush()
+
+        flush()
+        return found
 
     @classmethod
-    def merge_candidates(cls, candidates):
-        merged = set()
-        excluded = set()
+    def merge_candidates(cls, candidates, session):
+        """Merge a batch of stored candidates.
 
-        it = tqdm(candidates)
-        for candidate in it:
-            if candidate.obj in merged or candidate.into in excluded:
-                continue
+        Parameters
+        ----------
+        candidates : list of :obj:`.merge.MergeCandidate`
+            the candidates to merge
+        session : sqlalchemy.orm.session.Session
 
-            src = db.session.query(cls).get(candidate.obj)
-            dest = db.session.query(cls).get(candidate.into)
+        Notes
+        -----
+        Candidates are grouped in chains using a union-find, and every object
+        of a chain is merged into a single canonical object, in its own
+        savepoint. Objects that were already merged by an earlier run are
+        replaced by the object they ended up in.
 
-            # TODO: merge chains?
-            if src is None:
-                merged.add(candidate.obj)
-                continue
+        The status of each candidate is updated, but nothing is commited.
+
+        """
+        from .merge import DisjointSet, MergeCandidate
+
+        # Load all the objects of this batch at once
+        ids = set(c.obj_id for c in candidates) | set(c.into_id for c in candidates)
+        objects = {obj.id: obj for obj in session.query(cls).filter(cls.id.in_(ids))}
+
+        aliases = MergeCandidate.resolve_merged(session, ids - set(objects))
+        if aliases:
+            objects.update(
+                (obj.id, obj)
+                for obj in session.query(cls).filter(cls.id.in_(aliases.values()))
+            )
 
-            if dest is None:
-                merged.add(candidate.into)
+        def resolve(id):
+            return aliases.get(id, id)
+
+        ds = DisjointSet()
+        sources = set()
+        for candidate in candidates:
+            (src, dest) = (resolve(candidate.obj_id), resolve(candidate.into_id))
+            ds.union(src, dest)
+            if src != dest:
+                sources.add(src)
+
+        errors = {}
+        for members in ds.groups().values():
+            members = [objects[id] for id in members if id in objects]
+            if len(members) < 2:
                 continue
 
-            try:
-                src.merge_and_delete(dest, db.session)
-                db.session.commit()
-                it.write("Merged {} into {}".format(src, dest))
-            except Exception as e:
-                it.write(repr(e))
+            # Keep the object other ones were meant to be merged into
+            canonical = min(members, key=lambda obj: (obj.id in sources, obj.id))
+            canonical_id = canonical.id
+
+            # Ingest workers might be adding links to those objects
+            with lookup_lock, session.begin_nested():
+                for obj in sorted(members, key=attrgetter("id")):
+                    if obj is canonical:
+                        continue
+
+                    # Merged objects are expired then deleted, keep their ID
+                    obj_id = obj.id
+                    try:
+                        obj.merge_and_delete(canonical, session)
+                    except (LinksOverlap, ObjectTypeMismatchError) as e:
+                        errors[obj_id] = str(e)
+                        continue
+
+                    aliases[obj_id] = canonical_id
+
+        for candidate in candidates:
+            (src, dest) = (resolve(candidate.obj_id), resolve(candidate.into_id))
+
+            if src not in objects or dest not in objects:
+                candidate.status = MergeCandidateStatus.FAILED
+                candidate.message = "object not found"
+            elif src != dest:
+                candidate.status = MergeCandidateStatus.FAILED
+                candidate.message = errors.get(src) or errors.get(dest)
+            else:
+                candidate.status = MergeCandidateStatus.MERGED
+                candidate.message = None
 
-    def similar(self):
+    def similar(self, stats=None):
         """Find similar objects.
 
+        Parameters
+        ----------
+        stats : bool, optional
+            count the calls of each criteria, and the time spent in them, in
+            :data:`matcher.utils.trace_stats`. Defaults to the ``TRACE_STATS``
+            config
+
         Returns
         -------
         list of :obj:`ExternalObject`
@@ -645,6 +763,9 @@ class ExternalObject(Base):
         """
         from .value import Value
 
+        if stats is None:
+            stats = current_app.config["TRACE_STATS"]
+
         session = object_session(self)
 
         # FIXME: use other_value aliased name instead of value_1
@@ -669,7 +790,7 @@ class ExternalObject(Base):
             .group_by(other_value.external_object_id)
         )
 
-        @trace(logger)
+        @trace(logger, stats=stats)
         def links_overlap(a, b):
             platforms = set([li.platform for li in a]) & set([li.platform for li in b])
             return [
@@ -679,7 +800,7 @@ class ExternalObject(Base):
             ]
 
         objects = [
-            MergeCandidate(obj=self.id, into=v[0], score=v[1])
+            ScoredCandidate(obj=self.id, into=v[0], score=v[1])
             for v in matches
             if not links_overlap(
                 list(session.query(ObjectLink).filter(ObjectLink.external_object_id == v[0])),
@@ -716,7 +837,7 @@ class ExternalObject(Base):
                 count
             )
 
-        @trace(logger)
+        @trace(logger, stats=stats)
         def numeric_attr(mine, their, type, curve, process=into_float, count=3):
             my_attrs = set(
                 filter_and_pick(
@@ -748,7 +869,7 @@ class ExternalObject(Base):
 
             return curve(min_diff)
 
-        @trace(logger)
+        @trace(logger, stats=stats)
         def text_attr(mine, their, type, process=lambda n: n.lower(), filter_=lambda n: True, count=3):
             my_attrs = list(
                 filter_and_pick(
@@ -805,12 +926,67 @@ class ExternalObject(Base):
             ).get(candidate.into)
             for criteria in criterias:
                 factor *= criteria(self, their)
-            yield MergeCandidate(
+            yield ScoredCandidate(
                 obj=candidate.obj, into=candidate.into, score=factor
             )
 
     @staticmethod
-    def insert_dict(data, scrap):
+    def insert_raw(raw, scrap, counts=None):
+        """Normalize and insert an object sent by a scraper.
+
+        See :func:`normalize_dict` and :func:`insert_dict`
+
+        """
+        data = ExternalObject.normalize_dict(raw)
+
+        # FIXME: kinda ugly workaround
+        assert data["type"] is not None or data["any_type"]
+        assert data["relation"] is None
+        return ExternalObject.insert_dict(data, scrap, counts=counts)
+
+    @staticmethod
+    def insert_batch(batch, scrap):
+        """Insert a batch of objects sent by a scraper.
+
+        An object failing to insert is logged and skipped, the others of the
+        batch are still inserted. The totals of the scrap are updated once for
+        the whole batch.
+
+        Parameters
+        ----------
+        batch : list of dict
+            the raw objects, see :func:`insert_raw`
+        scrap : Scrap
+
+        Returns
+        -------
+        int
+            the number of objects inserted
+
+        """
+        session = db.session
+        inserted = 0
+        counts = collections.Counter()
+        for raw in batch:
+            object_counts = collections.Counter()
+            try:
+                ExternalObject.insert_raw(raw, scrap, counts=object_counts)
+            except ResourceClosedError:
+                # The connection is gone, the whole batch is retried
+                raise
+            except Exception:
+                logger.exception("Could not insert an object of scrap %d", scrap.id)
+                session.rollback()
+            else:
+                inserted += 1
+                counts.update(object_counts)
+
+        scrap.add_counts(counts)
+        session.commit()
+        return inserted
+
+    @staticmethod
+    def insert_dict(data, scrap, counts=None):
         """Insert a dict of raw data into the database.
 
         Parameters
@@ -818,6 +994,10 @@ class ExternalObject(Base):
         data : dict
         scrap : Scrap
             the objects inserted will be added to this scrap
+        counts : collections.Counter, optional
+            where the objects and links inserted are counted, for the caller
+            to add them to the scrap with :func:`.platform.Scrap.add_counts`.
+            When omitted, they are added along with the top level object
 
         Returns
         -------
@@ -826,8 +1006,11 @@ class ExternalObject(Base):
 
         """
         session = db.session
+        owned = counts is None
+        if owned:
+            counts = collections.Counter()
 
-        with session.begin_nested():
+        with stage("insert.lookup"), session.begin_nested():
             obj = ExternalObject.lookup_or_create(
                 obj_type=data["type"],
                 links=data["links"],
@@ -848,7 +1031,7 @@ class ExternalObject(Base):
         has_attributes = False
 
         if data["attributes"] is not None:
-            with attributes_lock, session.begin_nested():
+            with stage("insert.attributes"), attributes_lock, session.begin_nested():
                 for attribute in data["attributes"]:
                     has_attributes = True
                     try:
@@ -859,7 +1042,7 @@ class ExternalObject(Base):
 
         if has_attributes:
             # Find the link created for this platform and add the scrap to it
-            with links_lock, session.begin_nested():
+            with stage("insert.link"), links_lock, session.begin_nested():
                 link = (
                     session.query(ObjectLink)
                     .filter(
@@ -877,15 +1060,23 @@ class ExternalObject(Base):
         if data["related"] is not None:
             for child in data["related"]:
                 # Insert them…
-                child_obj = ExternalObject.insert_dict(child, scrap)
+                child_obj = ExternalObject.insert_dict(child, scrap, counts=counts)
 
                 # …and if a relationship is specified, use a map to bind the
                 # two objects together
                 if "relation" in child:
                     create_relationship(child["relation"], obj, child_obj)
 
-        session.commit()
+        counts["objects"] += 1
+        if has_attributes:
+            counts["links"] += 1
+        if owned:
+            scrap.add_counts(counts)
 
+        with stage("insert.commit"):
+            session.commit()
+
+        count("insert.objects")
         return obj
 
     @staticmethod
@@ -1018,6 +1209,112 @@ class ObjectLink(Base):
         format = self.platform.url.get(str(self.external_object.type), None)
         return None if format is None else format.format(self.external_id)
 
+    @classmethod
+    def of_object(cls, session, external_object_id, origins=False):
+        """Query the links of an object, with their platform.
+
+        Parameters
+        ----------
+        session : sqlalchemy.orm.session.Session
+        external_object_id : int
+        origins : bool
+            also load the scraps and imports the links were found in, in one
+            batch for all the links fetched
+
+        """
+        from .import_ import ImportFile
+
+        query = (
+            session.query(cls)
+            .filter(cls.external_object_id == external_object_id)
+            .options(joinedload(cls.platform))
+        )
+        if origins:
+            query = query.options(
+                selectinload(cls.scraps),
+                selectinload(cls.imports).undefer(ImportFile.last_activity),
+            )
+        return query
+
+    @classmethod
+    def deduplicate(cls, session, dry_run=False):
+        """Fold links that point to the same ID on the same object.
+
+        The scraps, imports and sessions of the duplicates are attached to the
+        first link of each group, then the duplicates are deleted in bulk.
+
+        Parameters
+        ----------
+        session : sqlalchemy.orm.session.Session
+        dry_run : bool
+            only count what would be changed. Rows already attached to the
+            kept link are counted as moved
+
+        Returns
+        -------
+        dict
+            how many links were deleted, and scraps, imports and sessions were
+            moved
+
+        Notes
+        -----
+        Nothing is commited.
+
+        """
+        from .import_ import import_link
+        from .platform import session_link
+        from .stats import CountStats
+
+        keep_id = func.first_value(cls.id).over(
+            partition_by=(cls.external_object_id, cls.platform_id, cls.external_id),
+            order_by=cls.id,
+        )
+        groups = select([cls.id.label("id"), keep_id.label("keep_id")]).alias("groups")
+        duplicates = (
+            select([groups.c.id, groups.c.keep_id])
+            .where(groups.c.id != groups.c.keep_id)
+            .alias("duplicates")
+        )
+
+        counts = {}
+        associations = [
+            ("scraps", scrap_link, "scrap_id"),
+            ("imports", import_link, "import_file_id"),
+            ("sessions", session_link, "session_id"),
+        ]
+        for (name, association, key) in associations:
+            moved = select([association.c[key], duplicates.c.keep_id]).select_from(
+                association.join(
+                    duplicates, association.c.object_link_id == duplicates.c.id
+                )
+            )
+
+            if dry_run:
+                counts[name] = session.execute(
+                    select([func.count()]).select_from(moved.alias())
+                ).scalar()
+            else:
+                counts[name] = session.execute(
+                    insert(association)
+                    .from_select([key, "object_link_id"], moved)
+                    .on_conflict_do_nothing()
+                ).rowcount
+
+        if dry_run:
+            counts["links"] = session.execute(
+                select([func.count()]).select_from(duplicates)
+            ).scalar()
+        else:
+            counts["links"] = session.execute(
+                cls.__table__.delete().where(cls.id.in_(select([duplicates.c.id])))
+            ).rowcount
+            # The bulk delete is not seen by the session
+            CountStats.add(
+                session.connection(), {("object_link", ""): -counts["links"]}
+            )
+
+        return counts
+
 
 class Role(Base):
     """A role of a person on another object (movie/episode/series…)."""
@@ -1149,6 +1446,149 @@ class Episode(Base, ExternalObjectMetaMixin):
     series = relationship("ExternalObject", foreign_keys=[series_id])
     """:obj:`ExternalObject` : The series in which this episode is in"""
 
+    @classmethod
+    def of_series(cls, session, series_id):
+        """Query the episodes of a series, with their attributes"""
+        return (
+            session.query(cls)
+            .filter(cls.series_id == series_id)
+            .options(
+                joinedload(cls.external_object).joinedload(ExternalObject.attributes)
+            )
+        )
+
+    @classmethod
+    def duplicates(cls, series_ids=None):
+        """Find the episodes that have the same number in the same series.
+
+        Episodes are grouped by series, season and episode number with a
+        window function, and the first episode of each group is the one the
+        others should be merged into.
+
+        Parameters
+        ----------
+        series_ids : optional
+            only look into those series, as a list of IDs or a subquery
+
+        Returns
+        -------
+        sqlalchemy.sql.expression.Alias
+            a subquery of (``obj_id``, ``into_id``) pairs
+
+        """
+        into_id = func.first_value(cls.external_object_id).over(
+            partition_by=(cls.series_id, cls.season, cls.episode),
+            order_by=cls.external_object_id,
+        )
+        groups = select(
+            [cls.external_object_id.label("obj_id"), into_id.label("into_id")]
+        ).where(
+            and_(
+                cls.series_id.isnot(None),
+                cls.season.isnot(None),
+                cls.episode.isnot(None),
+            )
+        )
+
+        if series_ids is not None:
+            groups = groups.where(cls.series_id.in_(series_ids))
+
+        groups = groups.alias("groups")
+        return (
+            select([groups.c.obj_id, groups.c.into_id])
+            .where(groups.c.obj_id != groups.c.into_id)
+            .alias("duplicates")
+        )
+
+    @classmethod
+    def touched_series(cls, scrap=None, import_file=None):
+        """Query the series found by a scrap or an import.
+
+        Those are the series the scrap or import linked to, and the series of
+        the episodes it linked to.
+
+        Parameters
+        ----------
+        scrap : :obj:`.platform.Scrap`, optional
+        import_file : :obj:`.import_.ImportFile`, optional
+
+        Returns
+        -------
+        sqlalchemy.sql.expression.Select
+            a query of series IDs
+
+        """
+        from .import_ import import_link
+
+        if scrap is not None:
+            (association, condition) = (scrap_link, scrap_link.c.scrap_id == scrap.id)
+        else:
+            (association, condition) = (
+                import_link,
+                import_link.c.import_file_id == import_file.id,
+            )
+
+        linked = (
+            select([ObjectLink.external_object_id])
+            .select_from(
+                association.join(
+                    ObjectLink, association.c.object_link_id == ObjectLink.id
+                )
+            )
+            .where(condition)
+        )
+
+        return union(
+            linked, select([cls.series_id]).where(cls.external_object_id.in_(linked))
+        )
+
+    @classmethod
+    def consolidate(cls, session, scrap=None, import_file=None, batch_size=100):
+        """Merge the duplicate episodes of each series.
+
+        The duplicates are recorded as accepted merge candidates, which are
+        then merged group by group. See :func:`duplicates`.
+
+        Parameters
+        ----------
+        session : sqlalchemy.orm.session.Session
+        scrap : :obj:`.platform.Scrap`, optional
+            only look into the series touched by this scrap
+        import_file : :obj:`.import_.ImportFile`, optional
+            only look into the series touched by this import
+        batch_size : int
+            see :func:`.merge.MergeCandidate.process`
+
+        Returns
+        -------
+        dict
+            the number of candidates per resulting status
+
+        """
+        from .merge import MergeCandidate
+        from .stats import SeriesStats
+
+        series_ids = None
+        if scrap is not None or import_file is not None:
+            series_ids = cls.touched_series(scrap=scrap, import_file=import_file)
+
+        found = MergeCandidate.insert_from_select(
+            cls.duplicates(series_ids),
+            session=session,
+            score=1.0,
+            status=MergeCandidateStatus.ACCEPTED,
+        )
+        session.commit()
+        logger.info("Found %d duplicate episodes", len(found))
+
+        # The other accepted candidates are left to the merge job
+        counts = MergeCandidate.process(session, batch_size=batch_size, ids=found)
+
+        SeriesStats.refresh(session, series_ids)
+        session.commit()
+
+        return counts
+
     def set_parent(self, parent):
         """Set the parent season.
 
@@ -1233,5 +1673,240 @@ class Person(Base, ExternalObjectMetaMixin):
             raise InvalidMetadataValue(key, content)
 
 
+def _merge_links(session, our_id, their_id):
+    """Move the links of an object to another one.
+
+    Links that exist on both sides are dropped from ours, after their scraps,
+    imports and sessions were moved to the remaining link.
+
+    """
+    from .import_ import import_link
+    from .platform import session_link
+    from .stats import CountStats
+
+    link = ObjectLink.__table__
+    our_link = link.alias("our_link")
+    their_link = link.alias("their_link")
+
+    duplicates = (
+        select([our_link.c.id.label("our_id"), their_link.c.id.label("their_id")])
+        .where(
+            and_(
+                our_link.c.external_object_id == our_id,
+                their_link.c.external_object_id == their_id,
+                our_link.c.platform_id == their_link.c.platform_id,
+                our_link.c.external_id == their_link.c.external_id,
+            )
+        )
+        .alias("duplicates")
+    )
+
+    associations = [
+        (scrap_link, "scrap_id"),
+        (import_link, "import_file_id"),
+        (session_link, "session_id"),
+    ]
+    for (association, key) in associations:
+        session.execute(
+            insert(association)
+            .from_select(
+                [key, "object_link_id"],
+                select([association.c[key], duplicates.c.their_id]).select_from(
+                    association.join(
+                        duplicates, association.c.object_link_id == duplicates.c.our_id
+                    )
+                ),
+            )
+            .on_conflict_do_nothing()
+        )
+
+    deleted = session.execute(
+        link.delete().where(
+            and_(
+                link.c.external_object_id == our_id,
+                link.c.id.in_(select([duplicates.c.our_id])),
+            )
+        )
+    ).rowcount
+    # The bulk delete is not seen by the session
+    CountStats.add(session.connection(), {("object_link", ""): -deleted})
+
+    session.execute(
+        link.update()
+        .where(link.c.external_object_id == our_id)
+        .values(external_object_id=their_id)
+    )
+
+
+def _merge_values(session, our_id, their_id):
+    """Move the values of an object to another one.
+
+    When both sides have the same value, only the sources are moved.
+
+    """
+    from .value import Value, ValueSource
+
+    value = Value.__table__
+    source = ValueSource.__table__
+    our_value = value.alias("our_value")
+    their_value = value.alias("their_value")
+
+    def same_value(ours):
+        return and_(
+            their_value.c.external_object_id == their_id,
+            their_value.c.type == ours.c.type,
+            their_value.c.text == ours.c.text,
+        )
+
+    matching = (
+        select(
+            [
+                our_value.c.id.label("our_id"),
+                func.min(their_value.c.id).label("their_id"),
+            ]
+        )
+        .where(and_(our_value.c.external_object_id == our_id, same_value(our_value)))
+        .group_by(our_value.c.id)
+        .alias("matching")
+    )
+
+    # Only one row per (value, platform), ON CONFLICT can't update a row twice
+    sources = (
+        select(
+            [
+                matching.c.their_id,
+                source.c.platform_id,
+                source.c.score_factor,
+                source.c.comment,
+            ]
+        )
+        .select_from(source.join(matching, source.c.value_id == matching.c.our_id))
+        .distinct(matching.c.their_id, source.c.platform_id)
+        .order_by(
+            matching.c.their_id, source.c.platform_id, source.c.score_factor.desc()
+        )
+    )
+    stmt = insert(source).from_select(
+        ["value_id", "platform_id", "score_factor", "comment"], sources
+    )
+    session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[source.c.value_id, source.c.platform_id],
+            # Keep the better score of both sides
+            set_={
+                "score_factor": func.greatest(
+                    source.c.score_factor, stmt.excluded.score_factor
+                )
+            },
+        )
+    )
+
+    # Their sources were deleted with the values (ON DELETE CASCADE)
+    session.execute(
+        value.delete().where(
+            and_(
+                value.c.external_object_id == our_id,
+                exists(select([their_value.c.id]).where(same_value(value))),
+            )
+        )
+    )
+
+    session.execute(
+        value.update()
+        .where(value.c.external_object_id == our_id)
+        .values(external_object_id=their_id)
+    )
+
+
+def _merge_roles(session, our_id, their_id):
+    """Move the roles of an object to another one, skipping the existing ones."""
+    role = Role.__table__
+    other = role.alias("other_role")
+
+    for (key, other_key) in [
+        ("external_object_id", "person_id"),
+        ("person_id", "external_object_id"),
+    ]:
+        session.execute(
+            role.update()
+            .where(
+                and_(
+                    role.c[key] == our_id,
+                    ~exists(
+                        select([other.c[key]]).where(
+                            and_(
+                                other.c[key] == their_id,
+                                other.c[other_key] == role.c[other_key],
+                            )
+                        )
+                    ),
+                )
+            )
+            .values({key: their_id})
+        )
+        session.execute(role.delete().where(role.c[key] == our_id))
+
+
+def _merge_episodes(session, our_id, their_id):
+    """Merge the episode metadatas and move the episodes of a series."""
+    episode = Episode.__table__
+    our_episode = episode.alias("our_episode")
+
+    # Fill in what is missing on their side
+    session.execute(
+        episode.update()
+        .where(
+            and_(
+                episode.c.external_object_id == their_id,
+                our_episode.c.external_object_id == our_id,
+            )
+        )
+        .values(
+            series_id=func.coalesce(episode.c.series_id, our_episode.c.series_id),
+            season=func.coalesce(episode.c.season, our_episode.c.season),
+            episode=func.coalesce(episode.c.episode, our_episode.c.episode),
+        )
+    )
+
+    # …or move ours if they had none
+    session.execute(
+        episode.update()
+        .where(
+            and_(
+                episode.c.external_object_id == our_id,
+                ~exists(
+                    select([our_episode.c.external_object_id]).where(
+                        our_episode.c.external_object_id == their_id
+                    )
+                ),
+            )
+        )
+        .values(external_object_id=their_id)
+    )
+    session.execute(episode.delete().where(episode.c.external_object_id == our_id))
+
+    session.execute(
+        episode.update()
+        .where(episode.c.series_id == our_id)
+        .values(series_id=their_id)
+    )
+
+
+def _merge_series_stats(session, their_id):
+    """Refresh the statistics of the series a merge changed."""
+    from .stats import SeriesStats
+
+    episode = Episode.__table__
+    SeriesStats.refresh(
+        session,
+        union(
+            select([literal(their_id)]),
+            select([episode.c.series_id]).where(
+                episode.c.external_object_id == their_id
+            ),
+        ),
+    )
+
+
 Episode.register()
 Person.register()
@@ -16,15 +16,17 @@ from sqlalchemy import (
     UniqueConstraint,
     column,
     func,
+    literal,
     select,
     table,
+    union,
 )
-from sqlalchemy.dialects.postgresql import JSONB
-from sqlalchemy.orm import column_property, relationship
+from sqlalchemy.dialects.postgresql import JSONB, insert
+from sqlalchemy.orm import column_property, object_session, relationship
 
 from . import Base
 from .enums import PlatformType, ScrapStatus
-from .utils import before
+from .utils import after, after_save, before, inject_session
 
 __all__ = ["PlatformGroup", "Platform", "Scrap", "Session"]
 
@@ -204,19 +206,21 @@ class Scrap(Base):
         "Session", secondary="session_scrap", back_populates="scraps"
     )
 
-    links_count = column_property(
-        select([func.count("object_link_id")])
-        .select_from(table("scrap_link"))
-        .where(column("scrap_id") == id),
-        deferred=True,
-    )
+    links_count = Column(Integer, nullable=False, default=0, server_default="0")
+    """:obj:`int` : number of links found by this scrap, counted while it runs
+    and recounted when it finishes"""
 
-    def to_status(self, status):
+    objects_count = Column(Integer, nullable=False, default=0, server_default="0")
+    """:obj:`int` : number of objects sent by the scraper, including the
+    related ones"""
+
+    def to_status(self, status, celery=None):
         """Try to change the status of the scrap
 
         It might raise an exception if the transition is invalid
 
         :status: the state it should transition to
+        :celery: to queue the follow-up tasks of a finished scrap
         """
         if self.status is not status:
             if status is ScrapStatus.RUNNING:
@@ -224,16 +228,151 @@ class Scrap(Base):
             elif status is ScrapStatus.SCHEDULED:
                 self.reschedule()
             elif status is ScrapStatus.SUCCESS:
-                self.succeeded()
+                self.succeeded(celery=celery)
             elif status is ScrapStatus.FAILED:
-                self.failed()
+                self.failed(celery=celery)
             elif status is ScrapStatus.ABORTED:
                 self.abort()
 
+    def add_counts(self, counts):
+        """Add objects and links to the totals of the scrap.
+
+        The scrap row is updated by every worker inserting its objects, so
+        they are counted by batches, as a dict with ``objects`` and ``links``
+        keys. The totals are incremented in SQL.
+        """
+        if counts.get("objects"):
+            self.objects_count = Scrap.objects_count + counts["objects"]
+        if counts.get("links"):
+            self.links_count = Scrap.links_count + counts["links"]
+
+    @before
+    def flush_counts(self, *_, **__):
+        # The counts might still be increments, see `add_counts`
+        session = object_session(self)
+        if session is not None:
+            session.flush()
+
     @before("run")
     def before_run(self):
         self.date = datetime.now()
 
+    @before("reschedule")
+    @inject_session
+    def forget_failure(self, *_, session=None, **__):
+        # It is recorded again when it finishes
+        from .stats import ScrapRollup
+
+        if self.status is ScrapStatus.FAILED:
+            ScrapRollup.record(session, self, undo=True)
+
+    @after_save("succeeded")
+    def schedule_finish(self, *_, celery=None, **__):
+        self.send_finish(celery)
+
+    @after_save("failed")
+    def schedule_failed_finish(self, *_, celery=None, **__):
+        self.send_finish(celery)
+
+    def send_finish(self, celery=None):
+        """Queue :func:`finish`, so the scraper does not wait for it"""
+        if celery is not None:
+            celery.send_task(
+                "matcher.tasks.object.finish_scrap", kwargs={"scrap_id": self.id}
+            )
+
+    def finish(self, session):
+        """Update what depends on the links of this finished scrap.
+
+        It is run by a task once the scrap succeeded or failed.
+        """
+        from .search import ObjectSearch
+        from .stats import CountStats
+
+        self.add_session_links(session)
+        self.recount_links(session)
+        ObjectSearch.refresh(session, ObjectSearch.touched(scrap=self))
+        CountStats.compact(session)
+
+    def add_session_links(self, session):
+        """Add the links found by this scrap to its sessions.
+
+        A scrap can be attached to a session while it runs, the links it finds
+        afterwards are only added once it finishes, successfully or not.
+
+        Returns
+        -------
+        int
+            the number of links added
+
+        """
+        from .object import scrap_link
+
+        links = (
+            select([session_scrap.c.session_id, scrap_link.c.object_link_id])
+            .select_from(
+                scrap_link.join(
+                    session_scrap, session_scrap.c.scrap_id == scrap_link.c.scrap_id
+                )
+            )
+            .where(scrap_link.c.scrap_id == self.id)
+        )
+        return session.execute(
+            insert(session_link)
+            .from_select(["session_id", "object_link_id"], links)
+            .on_conflict_do_nothing()
+        ).rowcount
+
+    @after("succeeded")
+    @inject_session
+    def count_succeeded(self, *_, session=None, **__):
+        self.record_rollup(session)
+
+    @after("failed")
+    @inject_session
+    def count_failed(self, *_, session=None, **__):
+        self.record_rollup(session)
+
+    def record_rollup(self, session):
+        """Add this scrap to the rollup, with the counts of when it ran"""
+        from .stats import ScrapRollup
+
+        ScrapRollup.record(session, self)
+
+    def recount_links(self, session):
+        """Recount the links of this finished scrap, and correct its rollup.
+
+        The links counted while it ran can be off, when some were found twice.
+        Nothing is done if the scrap was rescheduled meanwhile: it is counted
+        again once it finishes.
+        """
+        from .object import scrap_link
+        from .stats import ScrapRollup
+
+        session.refresh(self, with_for_update=True)
+        if self.status not in (ScrapStatus.SUCCESS, ScrapStatus.FAILED):
+            return
+
+        links_count = session.execute(
+            select([func.count()])
+            .select_from(scrap_link)
+            .where(scrap_link.c.scrap_id == self.id)
+        ).scalar()
+        if links_count != self.links_count:
+            ScrapRollup.add(session, self, links=links_count - self.links_count)
+            self.links_count = links_count
+
+    @after_save("succeeded")
+    def schedule_consolidation(self, *_, celery=None, **__):
+        # The scrap might have brought duplicate episodes, the consolidation
+        # also refreshes the statistics of the series it touched
+        if celery is not None:
+            celery.send_task(
+                "matcher.tasks.object.consolidate_episodes",
+                kwargs={"scrap_id": self.id},
+                countdown=10,
+            )
+
     def match_objects(self):
         """Try to match objects that where found in this scrap"""
         from ..scheme.object import ExternalObject
@@ -269,6 +408,82 @@ class Session(Base):
     def __str__(self):
         return self.name
 
+    def attach_scraps(self, scrap_ids, session):
+        """Attach scraps to this session in one statement.
+
+        Parameters
+        ----------
+        scrap_ids : list of int
+            the scraps to attach
+        session : sqlalchemy.orm.session.Session
+
+        Returns
+        -------
+        list of int
+            the scraps that were attached, the others already were
+
+        """
+        if not scrap_ids:
+            return []
+
+        attached = session.execute(
+            insert(session_scrap)
+            .values([{"session_id": self.id, "scrap_id": id} for id in scrap_ids])
+            .on_conflict_do_nothing()
+            .returning(session_scrap.c.scrap_id)
+        )
+        attached = [id for (id,) in attached]
+
+        if attached:
+            self.refresh_links(session=session)
+
+        return attached
+
+    @inject_session
+    def refresh_links(self, session=None):
+        """Rebuild the set of links in this session.
+
+        The links of a session are the ones found by its scraps and imports.
+        They are stored in the ``session_link`` table so exports can join on
+        it, and have to be refreshed when scraps or imports are attached.
+        Scraps add their links to their sessions when they finish, see
+        :func:`Scrap.add_session_links`. Merges and deduplications move
+        the rows of the links they delete.
+
+        Returns
+        -------
+        int
+            the number of links in this session
+
+        """
+        from .import_ import import_link
+        from .object import scrap_link
+
+        session.execute(session_link.delete().where(session_link.c.session_id == self.id))
+
+        links = union(
+            select([literal(self.id), scrap_link.c.object_link_id])
+            .select_from(
+                scrap_link.join(
+                    session_scrap, session_scrap.c.scrap_id == scrap_link.c.scrap_id
+                )
+            )
+            .where(session_scrap.c.session_id == self.id),
+            select([literal(self.id), import_link.c.object_link_id])
+            .select_from(
+                import_link.join(
+                    session_import_file,
+                    session_import_file.c.import_file_id
+                    == import_link.c.import_file_id,
+                )
+            )
+            .where(session_import_file.c.session_id == self.id),
+        )
+
+        return session.execute(
+            session_link.insert().from_select(["session_id", "object_link_id"], links)
+        ).rowcount
+
 
 session_scrap = Table(
     "session_scrap",
@@ -299,3 +514,18 @@ session_import_file = Table(
         primary_key=True,
     ),
 )
+
+session_link = Table(
+    "session_link",
+    Base.metadata,
+    Column(
+        "session_id",
+        ForeignKey(Session.id, ondelete="CASCADE", onupdate="CASCADE"),
+        primary_key=True,
+    ),
+    Column(
+        "object_link_id",
+        ForeignKey("object_link.id", ondelete="CASCADE", onupdate="CASCADE"),
+        primary_key=True,
+    ),
+)
@@ -0,0 +1,238 @@
+"""Search the objects by their titles and names.
+
+The ``search_vector`` of :obj:`.views.AttributesView` only covers the first
+four titles, and ranking its matches means computing ``ts_rank`` for each of
+them. The ``object_search`` table instead holds, for each object, all of its
+titles and names without accents, indexed both for full text search and for
+fuzzy trigram matching, and a score computed ahead of time to order the
+results by.
+
+The rows are refreshed for the objects found by a scrap or an import when it
+is done, and all of them by the ``refresh_attributes`` task.
+
+"""
+from typing import List
+
+from sqlalchemy import (
+    Boolean,
+    Column,
+    Float,
+    ForeignKey,
+    Index,
+    Integer,
+    Text,
+    func,
+    literal_column,
+    or_,
+    select,
+)
+from sqlalchemy.dialects.postgresql import TSVECTOR, insert
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ColumnElement
+
+from .base import Base
+from .enums import ValueType
+
+__all__ = ["ObjectSearch"]
+
+
+class word_similar(ColumnElement):
+    """``term <% document``, true when the term is close to a part of the
+    document. Unlike ``.op("<%")``, the percent sign is escaped for the
+    driver with every SQLAlchemy version."""
+
+    type = Boolean()
+    inherit_cache = False
+
+    def __init__(self, term, document):
+        self.term = term
+        self.document = document
+
+    @property
+    def _from_objects(self):
+        return self.document._from_objects
+
+
+@compiles(word_similar, "postgresql")
+def visit_word_similar(element, compiler, **kw):
+    return "{} {} {}".format(
+        compiler.process(element.term, **kw),
+        compiler.escape_literal_column("<%"),
+        compiler.process(element.document, **kw),
+    )
+
+
+class ObjectSearch(Base):
+    """The searchable text of an object"""
+
+    __tablename__ = "object_search"
+
+    __table_args__ = (
+        Index(
+            "ix_object_search_search_vector", "search_vector", postgresql_using="gin"
+        ),
+        Index(
+            "ix_object_search_document",
+            "document",
+            postgresql_using="gin",
+            postgresql_ops={"document": "gin_trgm_ops"},
+        ),
+        Index("ix_object_search_score", "score", "external_object_id"),
+    )
+
+    external_object_id = Column(
+        Integer,
+        ForeignKey("external_object.id", ondelete="CASCADE", onupdate="CASCADE"),
+        primary_key=True,
+    )
+
+    document = Column(Text, nullable=False)
+    """:obj:`str` : all the titles and names, lowercased and without accents"""
+
+    search_vector = Column(TSVECTOR, nullable=False)
+    """the full text search vector of the document"""
+
+    score = Column(Float, nullable=False, default=0, server_default="0")
+    """:obj:`float` : how high the object ranks in the results. Objects found
+    on more platforms come first"""
+
+    def __repr__(self):
+        return self._repr(id=self.external_object_id, score=self.score)
+
+    @staticmethod
+    def normalize(term):
+        """Lowercase a search term and strip its accents, like the documents"""
+        return func.lower(func.unaccent(term))
+
+    @classmethod
+    def matches(cls, term: str):
+        """The condition for the objects matching a search term.
+
+        The term matches either with a full text search, or fuzzily with a
+        trigram word similarity, which tolerates typos.
+        """
+        normalized = cls.normalize(term)
+        return or_(
+            cls.search_vector.op("@@")(func.plainto_tsquery("simple", normalized)),
+            word_similar(normalized, cls.document),
+        )
+
+    @classmethod
+    def refresh(cls, session, external_object_ids=None):
+        """Recompute the searchable text of some objects.
+
+        Parameters
+        ----------
+        session : sqlalchemy.orm.session.Session
+        external_object_ids : optional
+            only refresh those objects, as a list of IDs or a subquery.
+            Refreshes everything if omitted.
+
+        Returns
+        -------
+        int
+            the number of rows written
+
+        """
+        from .object import ObjectLink
+        from .value import Value
+
+        delete = cls.__table__.delete()
+        if external_object_ids is not None:
+            delete = delete.where(cls.external_object_id.in_(external_object_ids))
+        session.execute(delete)
+
+        documents = (
+            select(
+                [
+                    Value.external_object_id.label("external_object_id"),
+                    cls.normalize(func.string_agg(Value.text, " ")).label("document"),
+                ]
+            )
+            .where(Value.type.in_([ValueType.TITLE, ValueType.NAME]))
+            .group_by(Value.external_object_id)
+        )
+        if external_object_ids is not None:
+            documents = documents.where(
+                Value.external_object_id.in_(external_object_ids)
+            )
+        documents = documents.alias("documents")
+
+        links_count = (
+            select([func.count()])
+            .where(ObjectLink.external_object_id == documents.c.external_object_id)
+            .as_scalar()
+        )
+
+        stmt = insert(cls.__table__).from_select(
+            ["external_object_id", "document", "search_vector", "score"],
+            select(
+                [
+                    documents.c.external_object_id,
+                    documents.c.document,
+                    func.to_tsvector(literal_column("'simple'"), documents.c.document),
+                    links_count,
+                ]
+            ),
+        )
+        # A concurrent refresh of the same objects might have been quicker
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[cls.external_object_id],
+            set_={
+                "document": stmt.excluded.document,
+                "search_vector": stmt.excluded.search_vector,
+                "score": stmt.excluded.score,
+            },
+        )
+        return session.execute(stmt).rowcount
+
+    @staticmethod
+    def touched(scrap=None, import_file=None):
+        """Query the objects linked by a scrap or an import.
+
+        Returns
+        -------
+        sqlalchemy.sql.expression.Select
+            a query of object IDs
+
+        """
+        from .import_ import import_link
+        from .object import ObjectLink, scrap_link
+
+        if scrap is not None:
+            (association, condition) = (scrap_link, scrap_link.c.scrap_id == scrap.id)
+        else:
+            (association, condition) = (
+                import_link,
+                import_link.c.import_file_id == import_file.id,
+            )
+
+        return (
+            select([ObjectLink.external_object_id])
+            .select_from(
+                association.join(
+                    ObjectLink, ObjectLink.id == association.c.object_link_id
+                )
+            )
+            .where(condition)
+        )
+
+    @staticmethod
+    def hydrate(query, ids: List[int]) -> list:
+        """Load the objects of a page of results, in the order of their IDs.
+
+        Parameters
+        ----------
+        query : sqlalchemy.orm.query.Query
+            a query of :obj:`.object.ExternalObject`, with the options needed
+            to show them
+        ids : list of int
+
+        """
+        from .object import ExternalObject
+
+        if not ids:
+            return []
+
+        objects = {obj.id: obj for obj in query.filter(ExternalObject.id.in_(ids))}
+        return [objects[id] for id in ids if id in objects]
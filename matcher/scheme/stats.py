@@ -0,0 +1,549 @@
+# -*- coding: utf-8 -*-
+"""Precomputed statistics.
+
+Counting the episodes of a series means joining :obj:`.object.Episode` with
+:obj:`.object.ObjectLink`, which is too slow to do for every row of an export
+or of an admin listing. Those counts are kept in the ``series_stats`` table
+instead, and refreshed when episodes are linked or merged.
+
+The totals shown on the dashboard home are kept in the ``count_stats`` table,
+see :obj:`CountStats`, and the daily totals of the scraps in the
+``scrap_rollup`` table, see :obj:`ScrapRollup`.
+
+"""
+from collections import Counter, defaultdict
+from datetime import date, datetime
+from typing import Dict
+
+from sqlalchemy import (
+    DATE,
+    TIMESTAMP,
+    BigInteger,
+    Column,
+    ForeignKey,
+    Index,
+    Integer,
+    Interval,
+    Sequence,
+    String,
+    and_,
+    cast,
+    event,
+    func,
+    inspect,
+    literal,
+    literal_column,
+    not_,
+    or_,
+    select,
+    text,
+    tuple_,
+    union_all,
+)
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session, relationship
+
+from .base import Base
+from .enums import ScrapStatus
+
+__all__ = ["CountStats", "ScrapRollup", "SeriesStats"]
+
+
+class SeriesStats(Base):
+    """Number of seasons and episodes of a series, per platform.
+
+    The row without a platform counts all the episodes of the series, linked
+    or not.
+    """
+
+    __tablename__ = "series_stats"
+
+    __table_args__ = (
+        Index(
+            "uq_series_stats_series_id_platform_id",
+            "series_id",
+            text("coalesce(platform_id, 0)"),
+            unique=True,
+        ),
+    )
+
+    series_stats_id_seq = Sequence("series_stats_id_seq", metadata=Base.metadata)
+    id = Column(
+        Integer,
+        series_stats_id_seq,
+        server_default=series_stats_id_seq.next_value(),
+        primary_key=True,
+    )
+    """:obj:`int` : primary key"""
+
+    series_id = Column(
+        Integer,
+        ForeignKey("external_object.id", ondelete="CASCADE", onupdate="CASCADE"),
+        nullable=False,
+    )
+
+    platform_id = Column(
+        Integer,
+        ForeignKey("platform.id", ondelete="CASCADE", onupdate="CASCADE"),
+        nullable=True,
+    )
+
+    seasons_count = Column(Integer, nullable=False, default=0, server_default="0")
+    """:obj:`int` : number of distinct seasons"""
+
+    episodes_count = Column(Integer, nullable=False, default=0, server_default="0")
+    """:obj:`int` : number of distinct (season, episode) pairs"""
+
+    series = relationship("ExternalObject", foreign_keys=[series_id])
+    """:obj:`.object.ExternalObject` : the series those counts are for"""
+
+    platform = relationship("Platform", foreign_keys=[platform_id])
+    """:obj:`.platform.Platform` : the platform the episodes are linked to, if any"""
+
+    def __repr__(self):
+        return self._repr(
+            series=self.series_id,
+            platform=self.platform_id,
+            seasons=self.seasons_count,
+            episodes=self.episodes_count,
+        )
+
+    @classmethod
+    def refresh(cls, session, series_ids=None):
+        """Recompute the statistics of some series.
+
+        Both the per-platform rows and the overall row are computed in one
+        pass over the episodes, using grouping sets.
+
+        Parameters
+        ----------
+        session : sqlalchemy.orm.session.Session
+        series_ids : optional
+            only refresh those series, as a list of IDs or a subquery.
+            Refreshes everything if omitted.
+
+        Returns
+        -------
+        int
+            the number of rows written
+
+        """
+        from .object import Episode, ObjectLink
+
+        delete = cls.__table__.delete()
+        if series_ids is not None:
+            delete = delete.where(cls.series_id.in_(series_ids))
+        session.execute(delete)
+
+        stats = (
+            select(
+                [
+                    Episode.series_id,
+                    ObjectLink.platform_id,
+                    func.count(func.distinct(Episode.season)),
+                    func.count(func.distinct(Episode.season, Episode.episode)),
+                ]
+            )
+            .select_from(
+                Episode.__table__.outerjoin(
+                    ObjectLink,
+                    Episode.external_object_id == ObjectLink.external_object_id,
+                )
+            )
+            .where(Episode.series_id.isnot(None))
+            .group_by(
+                func.grouping_sets(
+                    tuple_(Episode.series_id, ObjectLink.platform_id),
+                    tuple_(Episode.series_id),
+                )
+            )
+            # Unlinked episodes are only counted in the overall row
+            .having(
+                not_(
+                    and_(
+                        func.grouping(ObjectLink.platform_id) == 0,
+                        ObjectLink.platform_id.is_(None),
+                    )
+                )
+            )
+        )
+        if series_ids is not None:
+            stats = stats.where(Episode.series_id.in_(series_ids))
+
+        stmt = insert(cls.__table__).from_select(
+            ["series_id", "platform_id", "seasons_count", "episodes_count"], stats
+        )
+        # A concurrent refresh of the same series might have been quicker
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[cls.series_id, literal_column("coalesce(platform_id, 0)")],
+            set_={
+                "seasons_count": stmt.excluded.seasons_count,
+                "episodes_count": stmt.excluded.episodes_count,
+            },
+        )
+        return session.execute(stmt).rowcount
+
+
+class CountStats(Base):
+    """Running totals, like the number of objects of each type.
+
+    Each change is recorded as a new row holding the difference, so that
+    concurrent transactions never wait on each other to update a total. The
+    totals are the sums of those rows, which :meth:`compact` folds back into
+    one row per total.
+
+    The changes are recorded when objects, links and platforms are added or
+    deleted through the ORM, and when a scrap succeeds. The bulk deletes of
+    the merges record their own changes, the other ones are not seen, so
+    :meth:`refresh` recounts everything from time to time and records the
+    differences.
+    """
+
+    __tablename__ = "count_stats"
+
+    __table_args__ = (Index("ix_count_stats_name_key", "name", "key"),)
+
+    count_stats_id_seq = Sequence("count_stats_id_seq", metadata=Base.metadata)
+    id = Column(
+        Integer,
+        count_stats_id_seq,
+        server_default=count_stats_id_seq.next_value(),
+        primary_key=True,
+    )
+    """:obj:`int` : primary key"""
+
+    name = Column(String, nullable=False)
+    """:obj:`str` : what is counted, like ``external_object``"""
+
+    key = Column(String, nullable=False, default="", server_default="")
+    """:obj:`str` : the group counted, like the type of the objects, or the
+    day of the successful scraps"""
+
+    value = Column(BigInteger, nullable=False)
+    """:obj:`int` : the difference to add to the total"""
+
+    def __repr__(self):
+        return self._repr(name=self.name, key=self.key, value=self.value)
+
+    @classmethod
+    def add(cls, connection, counts: Dict[tuple, int]):
+        """Record changes of the totals, as a dict of (name, key) to difference"""
+        rows = [
+            {"name": name, "key": key, "value": value}
+            for ((name, key), value) in counts.items()
+            if value
+        ]
+        if rows:
+            connection.execute(cls.__table__.insert(), rows)
+
+    @classmethod
+    def totals(cls, session, since: date = None) -> Dict[str, Dict[str, int]]:
+        """Sum the changes, by name and key.
+
+        Parameters
+        ----------
+        session : sqlalchemy.orm.session.Session
+        since : datetime.date, optional
+            skip the successful scraps of the days before this one
+
+        """
+        query = session.query(cls.name, cls.key, func.sum(cls.value)).group_by(
+            cls.name, cls.key
+        )
+        if since is not None:
+            query = query.filter(
+                or_(cls.name != "scrap_success", cls.key >= since.isoformat())
+            )
+
+        totals = defaultdict(dict)  # type: Dict[str, Dict[str, int]]
+        for (name, key, value) in query:
+            totals[name][key] = int(value)
+        return totals
+
+    @classmethod
+    def compact(cls, session):
+        """Replace the changes with their sums.
+
+        The changes committed while this runs are not touched, and are summed
+        by the next compaction.
+        """
+        deleted = cls.__table__.delete().returning(cls.name, cls.key, cls.value).cte()
+        session.execute(
+            cls.__table__.insert().from_select(
+                ["name", "key", "value"],
+                select([deleted.c.name, deleted.c.key, func.sum(deleted.c.value)])
+                .group_by(deleted.c.name, deleted.c.key)
+                .having(func.sum(deleted.c.value) != 0),
+            )
+        )
+
+    @classmethod
+    def refresh(cls, session):
+        """Recount everything.
+
+        The differences between the recount and the current totals are
+        recorded as new changes, in one statement: it sees the same snapshot
+        as the recount, so the changes committed meanwhile are neither counted
+        twice nor lost, and nothing waits on the table. It should be committed
+        right away, in a transaction of its own.
+        """
+        from .object import ExternalObject, ObjectLink
+        from .platform import Platform, Scrap
+
+        queries = [
+            select(
+                [
+                    literal("external_object").label("name"),
+                    cast(ExternalObject.type, String).label("key"),
+                    func.count().label("value"),
+                ]
+            )
+            .where(ExternalObject.type.isnot(None))
+            .group_by(ExternalObject.type),
+            select(
+                [literal("platform"), cast(Platform.type, String), func.count()]
+            ).group_by(Platform.type),
+            select([literal("object_link"), literal(""), func.count()]).select_from(
+                ObjectLink.__table__
+            ),
+            select(
+                [
+                    literal("scrap_success"),
+                    cast(cast(Scrap.date, DATE), String),
+                    func.count(),
+                ]
+            )
+            .where(Scrap.status == ScrapStatus.SUCCESS)
+            .where(Scrap.date.isnot(None))
+            .group_by(cast(Scrap.date, DATE)),
+        ]
+        recount = union_all(*queries).alias()
+        current = (
+            select([cls.name, cls.key, func.sum(cls.value).label("value")])
+            .group_by(cls.name, cls.key)
+            .alias()
+        )
+        difference = func.coalesce(recount.c.value, 0) - func.coalesce(
+            current.c.value, 0
+        )
+        session.execute(
+            cls.__table__.insert().from_select(
+                ["name", "key", "value"],
+                select(
+                    [
+                        func.coalesce(recount.c.name, current.c.name),
+                        func.coalesce(recount.c.key, current.c.key),
+                        difference,
+                    ]
+                )
+                .select_from(
+                    recount.outerjoin(
+                        current,
+                        and_(
+                            recount.c.name == current.c.name,
+                            recount.c.key == current.c.key,
+                        ),
+                        full=True,
+                    )
+                )
+                .where(difference != 0),
+            )
+        )
+
+
+class ScrapRollup(Base):
+    """Number of finished scraps, and of what they found, per day and platform.
+
+    A row is updated by :meth:`record` when a scrap succeeds or fails, so that
+    the statistics over long periods do not count the links of every scrap.
+    The links are counted while the scrap runs, and corrected once they are
+    recounted, see :func:`.platform.Scrap.recount_links`.
+    """
+
+    __tablename__ = "scrap_rollup"
+
+    __table_args__ = (
+        Index("uq_scrap_rollup_day_platform_id", "day", "platform_id", unique=True),
+    )
+
+    GRANULARITIES = ("day", "week", "month", "year")
+    """The granularities :meth:`series` can group the days by"""
+
+    scrap_rollup_id_seq = Sequence("scrap_rollup_id_seq", metadata=Base.metadata)
+    id = Column(
+        Integer,
+        scrap_rollup_id_seq,
+        server_default=scrap_rollup_id_seq.next_value(),
+        primary_key=True,
+    )
+    """:obj:`int` : primary key"""
+
+    day = Column(DATE, nullable=False)
+    """:obj:`datetime.date` : the day the scraps started"""
+
+    platform_id = Column(
+        Integer,
+        ForeignKey("platform.id", ondelete="CASCADE", onupdate="CASCADE"),
+        nullable=False,
+    )
+
+    scraps_count = Column(Integer, nullable=False, default=0, server_default="0")
+    """:obj:`int` : number of finished scraps"""
+
+    links_count = Column(BigInteger, nullable=False, default=0, server_default="0")
+    """:obj:`int` : number of links they found"""
+
+    objects_count = Column(BigInteger, nullable=False, default=0, server_default="0")
+    """:obj:`int` : number of objects they sent"""
+
+    platform = relationship("Platform", foreign_keys=[platform_id])
+    """:obj:`.platform.Platform` : the platform scrapped"""
+
+    def __repr__(self):
+        return self._repr(
+            day=self.day,
+            platform=self.platform_id,
+            scraps=self.scraps_count,
+            links=self.links_count,
+        )
+
+    @classmethod
+    def record(cls, session, scrap, undo=False):
+        """Add a finished scrap to the row of its day and platform.
+
+        With ``undo``, the scrap is removed instead, like when a failed scrap
+        is rescheduled: it is recorded again once it finishes.
+        """
+        sign = -1 if undo else 1
+        cls.add(
+            session,
+            scrap,
+            scraps=sign,
+            links=sign * scrap.links_count,
+            objects=sign * scrap.objects_count,
+        )
+
+    @classmethod
+    def add(cls, session, scrap, scraps=0, links=0, objects=0):
+        """Add differences to the row of the day and platform of a scrap"""
+        stmt = insert(cls.__table__).values(
+            day=(scrap.date or datetime.now()).date(),
+            platform_id=scrap.platform_id,
+            scraps_count=scraps,
+            links_count=links,
+            objects_count=objects,
+        )
+        table = cls.__table__
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[cls.day, cls.platform_id],
+            set_={
+                "scraps_count": table.c.scraps_count + stmt.excluded.scraps_count,
+                "links_count": table.c.links_count + stmt.excluded.links_count,
+                "objects_count": table.c.objects_count + stmt.excluded.objects_count,
+            },
+        )
+        session.execute(stmt)
+
+    @classmethod
+    def series(cls, session, start: date, end: date, granularity="day", platforms=None):
+        """Sum the rows by day, week, month or year.
+
+        Parameters
+        ----------
+        session : sqlalchemy.orm.session.Session
+        start : datetime.date
+        end : datetime.date
+            both included
+        granularity : str
+            one of :attr:`GRANULARITIES`
+        platforms : list of int, optional
+            only count the scraps of those platforms
+
+        Returns
+        -------
+        list of tuple
+            the first day of each period, the number of scraps, links and
+            objects. Periods without scraps are included.
+
+        """
+        if granularity not in cls.GRANULARITIES:
+            raise ValueError("invalid granularity {!r}".format(granularity))
+
+        steps = select(
+            [
+                func.generate_series(
+                    func.date_trunc(granularity, cast(start, TIMESTAMP)),
+                    cast(end, TIMESTAMP),
+                    cast("1 " + granularity, Interval),
+                ).label("step")
+            ]
+        ).alias()
+
+        step = func.date_trunc(granularity, cast(cls.day, TIMESTAMP))
+        totals = (
+            select(
+                [
+                    step.label("step"),
+                    func.sum(cls.scraps_count).label("scraps"),
+                    func.sum(cls.links_count).label("links"),
+                    func.sum(cls.objects_count).label("objects"),
+                ]
+            )
+            .where(cls.day.between(start, end))
+            .group_by(step)
+        )
+        if platforms:
+            totals = totals.where(cls.platform_id.in_(platforms))
+        totals = totals.alias()
+
+        stmt = (
+            select(
+                [
+                    cast(steps.c.step, DATE),
+                    func.coalesce(totals.c.scraps, 0),
+                    func.coalesce(totals.c.links, 0),
+                    func.coalesce(totals.c.objects, 0),
+                ]
+            )
+            .select_from(steps.outerjoin(totals, totals.c.step == steps.c.step))
+            .order_by(steps.c.step)
+        )
+        return [
+            (day, int(scraps), int(links), int(objects))
+            for (day, scraps, links, objects) in session.execute(stmt)
+        ]
+
+
+def _scrap_success(scrap):
+    day = scrap.date or date.today()
+    return ("scrap_success", day.strftime("%Y-%m-%d"))
+
+
+def _count_changes(session, flush_context):
+    """Record the changes of the totals made by a flush"""
+    from .object import ExternalObject, ObjectLink
+    from .platform import Platform, Scrap
+
+    counts = Counter()
+
+    for (instances, sign) in [(session.new, 1), (session.deleted, -1)]:
+        for instance in instances:
+            if isinstance(instance, ExternalObject) and instance.type is not None:
+                counts[("external_object", instance.type.name)] += sign
+            elif isinstance(instance, ObjectLink):
+                counts[("object_link", "")] += sign
+            elif isinstance(instance, Platform) and instance.type is not None:
+                counts[("platform", instance.type.name)] += sign
+            elif isinstance(instance, Scrap) and instance.status is ScrapStatus.SUCCESS:
+                counts[_scrap_success(instance)] += sign
+
+    for instance in session.dirty:
+        if isinstance(instance, Scrap):
+            history = inspect(instance).attrs.status.history
+            if ScrapStatus.SUCCESS in history.added:
+                counts[_scrap_success(instance)] += 1
+
+    CountStats.add(session.connection(), counts)
+
+
+event.listen(Session, "after_flush", _count_changes)
@@ -1,3 +1,5 @@
+import gzip
+from io import BytesIO
 from itertools import chain
 
 from jinja2.exceptions import UndefinedError
@@ -14,19 +16,24 @@ from matcher.scheme import (
     Platform,
     PlatformGroup,
     Scrap,
+    SeriesStats,
     Session,
     Value,
     ValueSource,
 )
 from matcher.scheme.enums import (
+    ExportCodec,
+    ExportCompression,
     ExportFactoryIterator,
     ExportFileStatus,
+    ExportFormat,
     ExportRowType,
     ExternalObjectType,
     ImportFileStatus,
     PlatformType,
     ValueType,
 )
+from matcher.scheme.export import AttributesWrapper, _coerce, _value_kind, _widen
 from matcher.scheme.views import AttributesView
 
 
@@ -214,6 +221,44 @@ class TestExportTemplate(object):
             template({"foo": "hello", "bar": "world"}) == "hello\tworld"
         ), "the compiled template should be a callable"
 
+    def test_compile_columns(self):
+        template = ExportTemplate(
+            fields=[
+                {"name": "ID", "value": "external_object.id"},
+                {"name": "Titles", "value": "attributes.titles"},
+                {"value": "links.foo", "type": "string"},
+            ]
+        )
+        columns = template.compile_columns()
+
+        assert [(name, kind) for (name, kind, _) in columns] == [
+            ("ID", None),
+            ("Titles", None),
+            ("column_2", "string"),
+        ]
+
+        context = {
+            "external_object": ExternalObject(id=42),
+            "attributes": AttributesWrapper(AttributesView(titles=["Foo", "Bar"])),
+            "links": {"foo": 12},
+        }
+        values = [expression(**context) for (_, _, expression) in columns]
+        assert values == [42, ["Foo", "Bar"], 12]
+
+        # Lists are kept as lists, the rest is converted to the column kind
+        assert [_value_kind(v) for v in values] == ["integer", "list", "integer"]
+        assert _coerce("list", values[1]) == ["Foo", "Bar"]
+        assert _coerce("list", "Foo") == ["Foo"]
+        assert _coerce("string", values[2]) == "12"
+        assert _coerce("integer", None) is None
+
+        # Guessed kinds are widened to fit the values seen later
+        assert _widen(None, "integer") == "integer"
+        assert _widen("integer", None) == "integer"
+        assert _widen("boolean", "float") == "float"
+        assert _widen("integer", "string") == "string"
+        assert _widen("string", "list") == "list"
+
     def test_valid_template(self):
         assert ExportTemplate(fields=[]).valid_template
         assert ExportTemplate(
@@ -272,6 +317,8 @@ class TestExportTemplate(object):
 
         session.add_all(platforms + movies + series + links + episodes_rel + episodes)
         session.commit()
+        SeriesStats.refresh(session)
+        session.commit()
 
         # Start by checking the row count matches
         assert ExportTemplate(
@@ -494,6 +541,55 @@ class TestExportTemplate(object):
 
         assert sorted(rows, key=sort_key) == sorted(expected, key=sort_key)
 
+    def test_row_query_series_counts(self, session):
+        platforms = [
+            Platform(slug="platform-" + str(i), name="Platform " + str(i))
+            for i in range(2)
+        ]
+        series = ExternalObject(
+            type=ExternalObjectType.SERIES,
+            links=[ObjectLink(platform=p, external_id="series") for p in platforms],
+        )
+        # Each platform has the episodes of one season
+        episodes = [
+            Episode(
+                series=series,
+                season=season,
+                episode=episode,
+                external_object=ExternalObject(
+                    type=ExternalObjectType.EPISODE,
+                    links=[
+                        ObjectLink(
+                            platform=platform,
+                            external_id="episode-{}-{}".format(season, episode),
+                        )
+                    ],
+                ),
+            )
+            for (season, platform) in enumerate(platforms)
+            for episode in range(2)
+        ]
+        session.add_all([series] + episodes)
+        session.commit()
+        SeriesStats.refresh(session)
+        session.commit()
+
+        fields = [{"value": "seasons_count"}, {"value": "episodes_count"}]
+        assert list(
+            ExportTemplate(
+                external_object_type=ExternalObjectType.SERIES,
+                row_type=ExportRowType.EXTERNAL_OBJECT,
+                fields=fields,
+            ).get_row_query(session=session)
+        ) == [(series, 2, 4)]
+        assert set(
+            ExportTemplate(
+                external_object_type=ExternalObjectType.SERIES,
+                row_type=ExportRowType.OBJECT_LINK,
+                fields=fields,
+            ).get_row_query(session=session)
+        ) == set((link, series, 1, 2) for link in series.links)
+
 
 class TestExportFactory(object):
     def test_iterate(self, session):
@@ -646,8 +742,113 @@ class TestExportFactory(object):
         assert files[0].filters == {"platform.id": str(platforms[0].id)}
         assert files[1].filters == {"platform.id": str(platforms[1].id)}
 
+        # The output settings are copied from the factory
+        factory.codec = ExportCodec.UTF_8
+        factory.compression = ExportCompression.NONE
+        files = list(factory.generate(scrap_session=scrap_session, session=session))
+        assert all(file.codec == ExportCodec.UTF_8 for file in files)
+        assert all(file.compression == ExportCompression.NONE for file in files)
+        assert all(file.content_coding is None for file in files)
+
 
 class TestExportFile(object):
+    def test_compressor(self):
+        data = "foo\tbar\r\n".encode("utf-8") * 100
+
+        file = ExportFile(compression=ExportCompression.GZIP, compression_level=1)
+        assert file.content_coding == "gzip"
+        buffer = BytesIO()
+        with file.compressor(buffer) as compressed:
+            compressed.write(data)
+        assert gzip.decompress(buffer.getvalue()) == data
+
+        file = ExportFile(compression=ExportCompression.NONE)
+        assert file.content_coding is None
+        buffer = BytesIO()
+        with file.compressor(buffer) as compressed:
+            compressed.write(data)
+        assert buffer.getvalue() == data
+
+    def test_download_name(self):
+        template = ExportTemplate(format=ExportFormat.CSV)
+        file = ExportFile(
+            template=template, path="a/foo.csv", compression=ExportCompression.GZIP
+        )
+        assert file.download_name() == "foo.csv.gz"
+        assert file.download_name(decoded=True) == "foo.csv"
+
+        file.path = "foo"
+        file.compression = ExportCompression.NONE
+        assert file.download_name() == "foo.csv"
+
+        template.format = ExportFormat.PARQUET
+        file.path = "foo.v2.csv"
+        assert file.download_name() == "foo.v2.parquet"
+
+    def test_process_columnar(self, app, session, tmp_path, monkeypatch):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        (tmp_path / "exports").mkdir()
+        monkeypatch.setitem(app.config, "DATA_DIR", tmp_path)
+        # One row per batch, the kinds guessed from the first one don't fit all
+        monkeypatch.setattr("matcher.scheme.export.COLUMNAR_BATCH_SIZE", 1)
+
+        platform = Platform(name="Platform", type=PlatformType.TVOD)
+        object_session = Session(name="test")
+        scrap = Scrap(platform=platform, sessions=[object_session])
+        objects = [
+            ExternalObject(
+                type=ExternalObjectType.MOVIE,
+                links=[
+                    ObjectLink(platform=platform, external_id=str(n), scraps=[scrap])
+                ],
+            )
+            for n in range(3)
+        ]
+        session.add_all(objects + [scrap])
+        session.commit()
+        object_session.refresh_links(session=session)
+        session.commit()
+        last = max(obj.id for obj in objects)
+
+        for file_format in [ExportFormat.PARQUET, ExportFormat.ARROW]:
+            template = ExportTemplate(
+                format=file_format,
+                row_type=ExportRowType.OBJECT_LINK,
+                external_object_type=ExternalObjectType.MOVIE,
+                fields=[
+                    {"name": "ID", "value": "external_object.id", "type": "integer"},
+                    {
+                        "name": "Value",
+                        "value": 'external_object.id if external_object.id != {}'
+                        ' else "last"'.format(last),
+                    },
+                ],
+            )
+            file = ExportFile(
+                template=template,
+                session=object_session,
+                status=ExportFileStatus.PROCESSING,
+                path="foo.csv",
+                filters={},
+            )
+            session.add(file)
+            session.flush()
+
+            file.process_columnar(session=session)
+
+            if file_format is ExportFormat.PARQUET:
+                table = pq.read_table(str(tmp_path / "exports" / file.real_name))
+            else:
+                with file.open(mode="rb") as f:
+                    table = pa.ipc.open_file(f).read_all()
+            assert table.schema.types == [pa.int64(), pa.string()]
+            assert sorted(zip(*table.to_pydict().values())) == [
+                (obj.id, "last" if obj.id == last else str(obj.id))
+                for obj in sorted(objects, key=lambda obj: obj.id)
+            ]
+
     def test_count_links(self, session):
         object_session = Session(name="test")
         import_file = ImportFile(
@@ -669,6 +870,8 @@ class TestExportFile(object):
             [external_object, empty_platform, linked_platform, link, import_file]
         )
         session.commit()
+        object_session.refresh_links(session=session)
+        session.commit()
 
         template = ExportTemplate(
             external_object_type=ExternalObjectType.MOVIE,
@@ -707,6 +910,58 @@ class TestExportFile(object):
             == 0
         )
 
+    def test_dispatch_scheduled(self, session):
+        object_session = Session(name="test")
+        template = ExportTemplate(
+            external_object_type=ExternalObjectType.MOVIE,
+            row_type=ExportRowType.OBJECT_LINK,
+            fields={},
+        )
+
+        def export_file(rows, status=ExportFileStatus.SCHEDULED):
+            return ExportFile(
+                template=template,
+                session=object_session,
+                status=status,
+                path="{}.csv".format(rows),
+                filters={},
+                expected_rows=rows,
+            )
+
+        small = [export_file(rows) for rows in [8, 2, 5]]
+        large = [export_file(rows) for rows in [500, None, 100]]
+        running = export_file(1000, status=ExportFileStatus.PROCESSING)
+        session.add_all(small + large + [running])
+        session.commit()
+
+        queues = [("small", 10, 2), ("large", None, 4)]
+        dispatched = ExportFile.dispatch_scheduled(session, queues=queues)
+        session.commit()
+
+        # Smallest first, and the running file takes one of the large slots.
+        # The file not counted yet is not counted by the dispatch, and goes
+        # last to the large queue.
+        assert [(f.expected_rows, queue) for (f, queue) in dispatched] == [
+            (2, "small"),
+            (5, "small"),
+            (100, "large"),
+            (500, "large"),
+            (None, "large"),
+        ]
+        assert all(f.status == ExportFileStatus.DISPATCHED for (f, _) in dispatched)
+        assert small[0].status == ExportFileStatus.SCHEDULED
+
+        # Nothing goes while all the slots are taken
+        assert ExportFile.dispatch_scheduled(session, queues=queues) == []
+        session.rollback()
+
+        # The dispatch itself is an active query
+        assert (
+            ExportFile.dispatch_scheduled(session, queues=queues, max_active_queries=1)
+            is None
+        )
+        session.rollback()
+
     def test_filtered_query(self, session):
         platforms = [
             Platform(name="TVOD FR", type=PlatformType.TVOD, country="FR"),
@@ -786,6 +1041,8 @@ class TestExportFile(object):
 
         session.add_all(platforms + groups + objects + [scrap])
         session.commit()
+        object_session.refresh_links(session=session)
+        session.commit()
 
         template = ExportTemplate(
             fields=[{"value": 'links["{}"]'.format(platforms[0].slug)}],
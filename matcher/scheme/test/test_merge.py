@@ -0,0 +1,135 @@
+from matcher.scheme.enums import ExternalObjectType, MergeCandidateStatus
+from matcher.scheme.merge import MergeCandidate
+from matcher.scheme.object import ExternalObject, ObjectLink, ScoredCandidate
+from matcher.scheme.platform import Platform
+
+
+class TestMergeCandidate(object):
+    def test_bulk_insert(self, session):
+        count = MergeCandidate.bulk_insert(
+            [
+                ScoredCandidate(obj=1, into=2, score=3.0),
+                ScoredCandidate(obj=1, into=2, score=4.0),  # duplicate pair
+                ScoredCandidate(obj=2, into=3, score=1.0),
+                ScoredCandidate(obj=3, into=3, score=9.0),  # same object
+            ],
+            session=session,
+        )
+        session.commit()
+
+        assert count == 2
+        assert session.query(MergeCandidate).count() == 2
+
+        candidate = session.query(MergeCandidate).filter_by(obj_id=1).one()
+        assert candidate.into_id == 2
+        assert candidate.score == 4.0
+        assert candidate.status == MergeCandidateStatus.PENDING
+
+        # Pending candidates get their score updated…
+        MergeCandidate.bulk_insert(
+            [ScoredCandidate(obj=1, into=2, score=5.0)], session=session
+        )
+        session.commit()
+        session.refresh(candidate)
+        assert candidate.score == 5.0
+
+        # …but not the reviewed ones
+        candidate.status = MergeCandidateStatus.REJECTED
+        session.commit()
+        MergeCandidate.bulk_insert(
+            [ScoredCandidate(obj=1, into=2, score=6.0)], session=session
+        )
+        session.commit()
+        session.refresh(candidate)
+        assert candidate.score == 5.0
+        assert candidate.status == MergeCandidateStatus.REJECTED
+
+    def test_queue(self, session):
+        MergeCandidate.bulk_insert(
+            [
+                ScoredCandidate(obj=1, into=2, score=1.0),
+                ScoredCandidate(obj=3, into=4, score=3.0),
+                ScoredCandidate(obj=5, into=6, score=2.0),
+            ],
+            session=session,
+        )
+        session.commit()
+
+        queue = MergeCandidate.queue(session, threshold=1.5)
+        assert [c.obj_id for c in queue] == [3, 5]
+
+        # Accepted candidates are queued regardless of their score
+        session.query(MergeCandidate).filter_by(obj_id=1).update(
+            {MergeCandidate.status: MergeCandidateStatus.ACCEPTED}
+        )
+        session.commit()
+
+        queue = MergeCandidate.queue(session, threshold=1.5)
+        assert [c.obj_id for c in queue] == [3, 5, 1]
+
+        queue = MergeCandidate.queue(session)
+        assert [c.obj_id for c in queue] == [1]
+
+    def test_process(self, session):
+        platform = Platform(name="Platform", slug="platform")
+        objects = [ExternalObject(type=ExternalObjectType.MOVIE) for _ in range(4)]
+        # The last two objects can't be merged because their links overlap
+        objects[2].links.append(ObjectLink(platform=platform, external_id="foo"))
+        objects[3].links.append(ObjectLink(platform=platform, external_id="bar"))
+        session.add_all([platform] + objects)
+        session.commit()
+
+        (a, b, c, d) = [o.id for o in objects]
+        MergeCandidate.bulk_insert(
+            [
+                ScoredCandidate(obj=a, into=b, score=3.0),
+                ScoredCandidate(obj=c, into=d, score=2.0),
+                ScoredCandidate(obj=b, into=c, score=0.5),  # below threshold
+            ],
+            session=session,
+        )
+        session.commit()
+
+        counts = MergeCandidate.process(session, threshold=1.0, batch_size=1)
+
+        assert counts["merged"] == 1
+        assert counts["failed"] == 1
+        assert session.query(ExternalObject).count() == 3
+        assert session.query(ExternalObject).get(a) is None
+
+        statuses = dict(session.query(MergeCandidate.obj_id, MergeCandidate.status))
+        assert statuses == {
+            a: MergeCandidateStatus.MERGED,
+            c: MergeCandidateStatus.FAILED,
+            b: MergeCandidateStatus.PENDING,
+        }
+
+    def test_process_chains(self, session):
+        objects = [ExternalObject(type=ExternalObjectType.MOVIE) for _ in range(4)]
+        session.add_all(objects)
+        session.commit()
+
+        (a, b, c, d) = [o.id for o in objects]
+        MergeCandidate.bulk_insert(
+            [
+                ScoredCandidate(obj=a, into=b, score=3.0),
+                ScoredCandidate(obj=b, into=c, score=2.0),
+            ],
+            session=session,
+        )
+        session.commit()
+
+        # A → B → C is merged in one go, into C
+        counts = MergeCandidate.process(session, threshold=1.0)
+        assert counts["merged"] == 2
+        assert sorted(o.id for o in session.query(ExternalObject)) == [c, d]
+
+        # A and B do not exist anymore, but they were merged into C
+        MergeCandidate.bulk_insert(
+            [ScoredCandidate(obj=d, into=a, score=3.0)], session=session
+        )
+        session.commit()
+
+        counts = MergeCandidate.process(session, threshold=1.0)
+        assert counts["merged"] == 1
+        assert [o.id for o in session.query(ExternalObject)] == [c]
@@ -1,6 +1,15 @@
-from matcher.scheme.enums import ExternalObjectType, ValueType
-from matcher.scheme.object import ExternalObject
-from matcher.scheme.platform import Platform
+from collections import Counter
+
+from matcher.scheme.enums import (
+    ExternalObjectType,
+    MergeCandidateStatus,
+    ScrapStatus,
+    ValueType,
+)
+from matcher.scheme.merge import MergeCandidate
+from matcher.scheme.object import Episode, ExternalObject, ObjectLink
+from matcher.scheme.platform import Platform, Scrap, Session, session_link
+from matcher.scheme.stats import CountStats
 from matcher.scheme.value import Value, ValueSource
 
 
@@ -40,6 +49,28 @@ class TestExternalObjectMerge(object):
 
         assert session.query(ExternalObject).count() == 1
 
+    def test_source_score_kept(self, session):
+        platform = Platform(name="Platform", slug="platform", base_score=200)
+        object1 = ExternalObject(type=ExternalObjectType.MOVIE)
+        object2 = ExternalObject(type=ExternalObjectType.MOVIE)
+        for (obj, score_factor) in [(object1, 100), (object2, 300)]:
+            session.add(
+                Value(
+                    external_object=obj,
+                    type=ValueType.TITLE,
+                    text="Foo",
+                    sources=[ValueSource(platform=platform, score_factor=score_factor)],
+                )
+            )
+        session.commit()
+
+        object2.merge_and_delete(object1, session)
+        session.expire_all()
+
+        # The better source of both sides is kept
+        [value] = object1.values
+        assert [source.score_factor for source in value.sources] == [300]
+
     def test_value_moving(self, session):
         # This tests for moving a lot of values at once. There was an issue of
         # value disappearing, hence this test.
@@ -102,3 +133,252 @@ class TestExternalObjectMerge(object):
         assert session.query(ExternalObject).count() == 1
         assert session.query(Value).count() == 10
         assert session.query(ValueSource).count() == 15
+
+    def test_links_moving(self, session):
+        platform1 = Platform(name="Platform 1", slug="platform-1")
+        platform2 = Platform(name="Platform 2", slug="platform-2")
+        session.add_all([platform1, platform2])
+
+        object1 = ExternalObject(type=ExternalObjectType.MOVIE)
+        object2 = ExternalObject(type=ExternalObjectType.MOVIE)
+        object1.links.append(ObjectLink(platform=platform1, external_id="foo"))
+        object2.links.append(ObjectLink(platform=platform2, external_id="bar"))
+        session.add_all([object1, object2])
+
+        session.commit()
+
+        object2.merge_and_delete(object1, session)
+        session.commit()
+
+        assert session.query(ExternalObject).count() == 1
+        assert sorted(link.external_id for link in object1.links) == ["bar", "foo"]
+        assert session.query(ObjectLink).count() == 2
+
+    def test_duplicate_links_sessions(self, session):
+        platform = Platform(name="Platform", slug="platform")
+        object1 = ExternalObject(type=ExternalObjectType.MOVIE)
+        object2 = ExternalObject(type=ExternalObjectType.MOVIE)
+        link1 = ObjectLink(platform=platform, external_id="foo")
+        link2 = ObjectLink(platform=platform, external_id="foo")
+        object1.links.append(link1)
+        object2.links.append(link2)
+        export_session = Session(name="Session")
+        session.add_all([object1, object2, export_session])
+        session.flush()
+        # Only the dropped link was in the session
+        session.execute(
+            session_link.insert().values(
+                session_id=export_session.id, object_link_id=link2.id
+            )
+        )
+        session.commit()
+
+        object2.merge_and_delete(object1, session)
+        session.commit()
+
+        assert session.query(ObjectLink).count() == 1
+        rows = session.execute(session_link.select()).fetchall()
+        assert [(row.session_id, row.object_link_id) for row in rows] == [
+            (export_session.id, link1.id)
+        ]
+        # The links deleted in bulk are counted out too
+        assert CountStats.totals(session)["object_link"] == {"": 1}
+
+
+class TestExternalObjectInsert(object):
+    def test_counts(self, session):
+        platform = Platform(name="Platform", slug="platform")
+        scrap = Scrap(platform=platform, status=ScrapStatus.RUNNING)
+        session.add(scrap)
+        session.commit()
+
+        def payload(id):
+            return ExternalObject.normalize_dict(
+                {
+                    "type": "movie",
+                    "attributes": {"title": ["Title {}".format(id)]},
+                    "links": [{"platform": "platform", "id": str(id)}],
+                }
+            )
+
+        ExternalObject.insert_dict(payload(1), scrap)
+        assert (scrap.objects_count, scrap.links_count) == (1, 1)
+
+        # The caller can count a whole batch, and add it at once
+        counts = Counter()
+        for id in [2, 3]:
+            ExternalObject.insert_dict(payload(id), scrap, counts=counts)
+        assert counts == {"objects": 2, "links": 2}
+        assert (scrap.objects_count, scrap.links_count) == (1, 1)
+
+        scrap.add_counts(counts)
+        session.commit()
+        assert (scrap.objects_count, scrap.links_count) == (3, 3)
+
+    def test_batch(self, session):
+        platform = Platform(name="Platform", slug="platform")
+        scrap = Scrap(platform=platform, status=ScrapStatus.RUNNING)
+        session.add(scrap)
+        session.commit()
+
+        def payload(id, platform="platform"):
+            return {
+                "type": "movie",
+                "attributes": {"title": ["Title {}".format(id)]},
+                "links": [{"platform": platform, "id": str(id)}],
+            }
+
+        # The second object is on an unknown platform, it is skipped
+        batch = [payload(1), payload(2, platform="unknown"), payload(3)]
+        assert ExternalObject.insert_batch(batch, scrap) == 2
+
+        links = session.query(ObjectLink).order_by(ObjectLink.external_id)
+        assert [link.external_id for link in links] == ["1", "3"]
+        assert all(link.scraps == [scrap] for link in links)
+        assert (scrap.objects_count, scrap.links_count) == (2, 2)
+
+
+class TestExternalObjectLookup(object):
+    def test_deferred_merge(self, session):
+        platform1 = Platform(name="Platform 1", slug="platform-1")
+        platform2 = Platform(name="Platform 2", slug="platform-2")
+        session.add_all([platform1, platform2])
+
+        object1 = ExternalObject(type=ExternalObjectType.MOVIE)
+        object2 = ExternalObject(type=ExternalObjectType.MOVIE)
+        object1.links.append(ObjectLink(platform=platform1, external_id="foo"))
+        object2.links.append(ObjectLink(platform=platform2, external_id="bar"))
+        session.add_all([object1, object2])
+        session.commit()
+
+        links = [(platform1.id, "foo"), (platform2.id, "bar")]
+        obj = ExternalObject.lookup_or_create(
+            obj_type=ExternalObjectType.MOVIE,
+            links=links,
+            session=session,
+            defer_merges=True,
+        )
+        session.commit()
+
+        # Nothing was merged yet, the first object is used in the meantime
+        assert obj == object1
+        assert session.query(ExternalObject).count() == 2
+        # …without duplicating the links of the other one, even when looked up
+        # again before the merge
+        ExternalObject.lookup_or_create(
+            obj_type=ExternalObjectType.MOVIE,
+            links=links,
+            session=session,
+            defer_merges=True,
+        )
+        session.commit()
+        assert session.query(ObjectLink).count() == 2
+
+        candidate = session.query(MergeCandidate).one()
+        assert (candidate.obj_id, candidate.into_id) == (object2.id, object1.id)
+        assert candidate.status == MergeCandidateStatus.ACCEPTED
+
+        MergeCandidate.process(session)
+
+        assert session.query(ExternalObject).count() == 1
+        assert sorted(link.external_id for link in object1.links) == ["bar", "foo"]
+
+
+class TestEpisodeConsolidation(object):
+    def test_consolidate(self, session):
+        series = ExternalObject(type=ExternalObjectType.SERIES)
+        episodes = [ExternalObject(type=ExternalObjectType.EPISODE) for _ in range(4)]
+        session.add_all([series] + episodes)
+        session.flush()
+
+        # The first three are the same episode, the last one is another one
+        session.add_all(
+            [
+                Episode(external_object=episode, series=series, season=1, episode=n)
+                for (episode, n) in zip(episodes, [1, 1, 1, 2])
+            ]
+        )
+        # An unrelated candidate, left to the merge job
+        movies = [ExternalObject(type=ExternalObjectType.MOVIE) for _ in range(2)]
+        session.add_all(movies)
+        session.flush()
+        other = MergeCandidate(
+            obj_id=movies[0].id,
+            into_id=movies[1].id,
+            score=1.0,
+            status=MergeCandidateStatus.ACCEPTED,
+        )
+        session.add(other)
+        session.commit()
+
+        counts = Episode.consolidate(session)
+
+        assert counts["merged"] == 2
+        assert session.query(Episode).count() == 2
+        assert session.query(ExternalObject).count() == 5
+        assert sorted(e.external_object_id for e in session.query(Episode)) == [
+            episodes[0].id,
+            episodes[3].id,
+        ]
+        assert other.status == MergeCandidateStatus.ACCEPTED
+
+    def test_scheduled_on_success(self, session):
+        class FakeCelery(object):
+            def __init__(self):
+                self.sent = []
+
+            def send_task(self, name, **kwargs):
+                self.sent.append((name, kwargs["kwargs"]))
+
+        celery = FakeCelery()
+        scrap = Scrap(
+            platform=Platform(name="Platform", slug="platform"),
+            status=ScrapStatus.RUNNING,
+        )
+        session.add(scrap)
+        session.commit()
+
+        scrap.to_status(ScrapStatus.SUCCESS, celery=celery)
+        session.commit()
+
+        assert celery.sent == [
+            ("matcher.tasks.object.finish_scrap", {"scrap_id": scrap.id}),
+            ("matcher.tasks.object.consolidate_episodes", {"scrap_id": scrap.id}),
+        ]
+
+
+class TestObjectLinkDeduplicate(object):
+    def test_deduplicate(self, session):
+        platform = Platform(name="Platform", slug="platform")
+        obj = ExternalObject(type=ExternalObjectType.MOVIE)
+        scraps = [Scrap(platform=platform) for _ in range(2)]
+        links = [ObjectLink(platform=platform, external_id="foo") for _ in range(2)]
+        for (link, scrap) in zip(links, scraps):
+            link.scraps.append(scrap)
+            obj.links.append(link)
+        export_session = Session(name="Session")
+        session.add_all([platform, obj, export_session] + scraps)
+        session.flush()
+        session.execute(
+            session_link.insert().values(
+                session_id=export_session.id, object_link_id=links[1].id
+            )
+        )
+        session.commit()
+
+        expected = {"links": 1, "scraps": 1, "imports": 0, "sessions": 1}
+        counts = ObjectLink.deduplicate(session, dry_run=True)
+        assert counts == expected
+        assert session.query(ObjectLink).count() == 2
+
+        counts = ObjectLink.deduplicate(session)
+        session.commit()
+        session.expire_all()
+
+        assert counts == expected
+        link = session.query(ObjectLink).one()
+        assert link.id == links[0].id
+        assert set(link.scraps) == set(scraps)
+        rows = session.execute(session_link.select()).fetchall()
+        assert [row.object_link_id for row in rows] == [link.id]
+        assert CountStats.totals(session)["object_link"] == {"": 1}
@@ -0,0 +1,123 @@
+from datetime import datetime
+
+from matcher.scheme.enums import ExternalObjectType, ScrapStatus, ValueType
+from matcher.scheme.object import ExternalObject, ObjectLink
+from matcher.scheme.platform import Platform, Scrap, Session, session_link
+from matcher.scheme.search import ObjectSearch
+from matcher.scheme.stats import ScrapRollup
+from matcher.scheme.value import Value
+
+
+class FakeCelery(object):
+    def __init__(self):
+        self.sent = []
+
+    def send_task(self, name, **kwargs):
+        self.sent.append((name, kwargs["kwargs"]))
+
+
+class TestScrapFinish(object):
+    def test_scheduled(self, session):
+        celery = FakeCelery()
+        platform = Platform(name="Platform", slug="platform")
+        scraps = [Scrap(platform=platform, status=ScrapStatus.RUNNING) for _ in "ab"]
+        session.add_all(scraps)
+        session.commit()
+
+        scraps[0].to_status(ScrapStatus.FAILED, celery=celery)
+        session.commit()
+        scraps[1].to_status(ScrapStatus.SUCCESS, celery=celery)
+        session.commit()
+
+        finished = [kwargs for (name, kwargs) in celery.sent if "finish" in name]
+        assert finished == [{"scrap_id": scraps[0].id}, {"scrap_id": scraps[1].id}]
+
+    def test_session_links(self, session):
+        platform = Platform(name="Platform", slug="platform")
+        links = [ObjectLink(platform=platform, external_id=id) for id in "abc"]
+        obj = ExternalObject(type=ExternalObjectType.MOVIE, links=links)
+        scrap = Scrap(platform=platform, status=ScrapStatus.RUNNING)
+        scrap.links.extend(links[1:])
+        export_session = Session(name="Session", scraps=[scrap])
+        session.add_all([obj, export_session])
+        session.flush()
+        # One link came from elsewhere, one was already added
+        session.execute(
+            session_link.insert().values(
+                [
+                    {"session_id": export_session.id, "object_link_id": link.id}
+                    for link in links[:2]
+                ]
+            )
+        )
+        session.commit()
+
+        scrap.to_status(ScrapStatus.SUCCESS)
+        scrap.finish(session)
+        session.commit()
+
+        rows = session.execute(session_link.select()).fetchall()
+        assert sorted(row.object_link_id for row in rows) == [
+            link.id for link in links
+        ]
+        assert all(row.session_id == export_session.id for row in rows)
+
+    def test_search(self, session):
+        platform = Platform(name="Platform", slug="platform")
+        objects = [
+            ExternalObject(
+                type=ExternalObjectType.MOVIE,
+                links=[ObjectLink(platform=platform, external_id=id)],
+                values=[Value(type=ValueType.TITLE, text="Title " + id)],
+            )
+            for id in "ab"
+        ]
+        scrap = Scrap(platform=platform, status=ScrapStatus.RUNNING)
+        scrap.links.append(objects[0].links[0])
+        session.add_all(objects + [scrap])
+        session.commit()
+
+        # Only the objects found by the scrap are indexed
+        scrap.to_status(ScrapStatus.SUCCESS)
+        scrap.finish(session)
+        session.commit()
+        rows = session.query(ObjectSearch.external_object_id).all()
+        assert rows == [(objects[0].id,)]
+
+    def test_recount_links(self, session):
+        platform = Platform(name="Platform", slug="platform")
+        links = [ObjectLink(platform=platform, external_id=id) for id in "ab"]
+        obj = ExternalObject(type=ExternalObjectType.MOVIE, links=links)
+        scraps = [
+            Scrap(
+                platform=platform,
+                status=ScrapStatus.RUNNING,
+                date=datetime(2019, 3, 4),
+                links=links,
+                links_count=3,
+            )
+            for _ in "ab"
+        ]
+        session.add_all([obj] + scraps)
+        session.commit()
+
+        def rollup():
+            row = session.query(ScrapRollup).one()
+            session.refresh(row)
+            return (row.scraps_count, row.links_count)
+
+        # The links are counted as they were when the scraps finished
+        for scrap in scraps:
+            scrap.to_status(ScrapStatus.FAILED)
+            session.commit()
+        assert rollup() == (2, 6)
+
+        # The rescheduled one is counted again when it finishes
+        scraps[1].to_status(ScrapStatus.SCHEDULED)
+        session.commit()
+        assert rollup() == (1, 3)
+        for scrap in scraps:
+            scrap.finish(session)
+            session.commit()
+        assert rollup() == (1, 2)
+        assert [scrap.links_count for scrap in scraps] == [2, 3]
@@ -0,0 +1,106 @@
+from matcher.scheme.enums import ExternalObjectType
+from matcher.scheme.object import Episode, ExternalObject, ObjectLink
+from matcher.scheme.platform import Platform
+from matcher.scheme.stats import CountStats, SeriesStats
+
+
+class TestSeriesStats(object):
+    def test_refresh(self, session):
+        platforms = [
+            Platform(slug="platform-" + str(i), name="Platform " + str(i))
+            for i in range(2)
+        ]
+        series = ExternalObject(type=ExternalObjectType.SERIES)
+        episodes = []
+        episodes_rel = []
+        for season in range(2):
+            for episode in range(3):
+                obj = ExternalObject(type=ExternalObjectType.EPISODE)
+                rel = Episode(
+                    external_object=obj, series=series, season=season, episode=episode
+                )
+                episodes.append(obj)
+                episodes_rel.append(rel)
+
+        # The first platform has everything, the second only the first season,
+        # and the last episode is not linked at all
+        for index, obj in enumerate(episodes[:-1]):
+            for platform in platforms if index < 3 else platforms[:1]:
+                obj.links.append(
+                    ObjectLink(platform=platform, external_id="{}".format(index))
+                )
+
+        session.add_all(platforms + [series] + episodes + episodes_rel)
+        session.commit()
+
+        SeriesStats.refresh(session, [series.id])
+        session.commit()
+
+        stats = {
+            s.platform_id: (s.seasons_count, s.episodes_count)
+            for s in session.query(SeriesStats).filter_by(series_id=series.id)
+        }
+        assert stats == {
+            platforms[0].id: (2, 5),
+            platforms[1].id: (1, 3),
+            None: (2, 6),
+        }
+
+        # Refreshing again replaces the rows
+        SeriesStats.refresh(session)
+        session.commit()
+        assert session.query(SeriesStats).count() == 3
+
+
+class TestCountStats(object):
+    def test_totals(self, session):
+        platform = Platform(slug="platform", name="Platform")
+        movies = [
+            ExternalObject(
+                type=ExternalObjectType.MOVIE,
+                links=[ObjectLink(platform=platform, external_id=str(i))],
+            )
+            for i in range(3)
+        ]
+        series = ExternalObject(type=ExternalObjectType.SERIES)
+        session.add_all(movies + [series])
+        session.commit()
+
+        def totals():
+            totals = CountStats.totals(session)
+            return (
+                totals["external_object"],
+                totals["object_link"],
+                totals["platform"],
+            )
+
+        expected = ({"MOVIE": 3, "SERIES": 1}, {"": 3}, {"INFO": 1})
+        assert totals() == expected
+
+        session.delete(movies[0])
+        session.commit()
+        expected = ({"MOVIE": 2, "SERIES": 1}, {"": 2}, {"INFO": 1})
+        assert totals() == expected
+
+        # Compacting and recounting keep the same totals, in fewer rows
+        CountStats.compact(session)
+        session.commit()
+        assert totals() == expected
+        assert session.query(CountStats).count() == 4
+
+        CountStats.refresh(session)
+        session.commit()
+        assert totals() == expected
+        assert session.query(CountStats).count() == 4
+
+        # The changes the running totals do not see are recorded by the recount
+        session.query(ObjectLink).filter(
+            ObjectLink.external_object_id == movies[1].id
+        ).delete(synchronize_session=False)
+        session.add(CountStats(name="external_object", key="EPISODE", value=2))
+        session.commit()
+        CountStats.refresh(session)
+        session.commit()
+        expected = ({"MOVIE": 2, "SERIES": 1, "EPISODE": 0}, {"": 1}, {"INFO": 1})
+        assert totals() == expected
+        assert session.query(CountStats).count() == 7
@@ -0,0 +1,42 @@
+from matcher.scheme.enums import ExternalObjectType, ValueType
+from matcher.scheme.object import ExternalObject
+from matcher.scheme.platform import Platform
+from matcher.scheme.value import Value, ValueSource
+
+
+class TestValueNormalize(object):
+    def test_normalize(self, session):
+        platform = Platform(name="Platform", slug="platform")
+        objects = [ExternalObject(type=ExternalObjectType.MOVIE) for _ in range(3)]
+        session.add_all([platform] + objects)
+
+        for (obj, text) in zip(objects, ["Foo (2018)", "Bar (2018)", "Baz"]):
+            obj.values.append(
+                Value(
+                    type=ValueType.TITLE,
+                    text=text,
+                    sources=[ValueSource(platform=platform, score_factor=200)],
+                )
+            )
+        # This one already has the normalized value
+        objects[1].values.append(Value(type=ValueType.TITLE, text="Bar"))
+        session.commit()
+
+        added, read = Value.normalize(session, type=ValueType.TITLE, chunk_size=2)
+
+        assert (added, read) == (1, 4)
+
+        value = session.query(Value).filter_by(text="Foo").one()
+        assert value.external_object == objects[0]
+        assert [(s.platform, s.score_factor) for s in value.sources] == [
+            (platform, 200)
+        ]
+
+        value = session.query(Value).filter_by(text="Bar").one()
+        assert [(s.platform, s.score_factor) for s in value.sources] == [
+            (platform, 200)
+        ]
+
+        # Running it again does not change anything
+        assert Value.normalize(session, type=ValueType.TITLE) == (0, 5)
+        assert session.query(ValueSource).count() == 5
@@ -1,3 +1,5 @@
+import logging
+
 from sqlalchemy import (
     Column,
     Enum,
@@ -5,13 +7,16 @@ from sqlalchemy import (
     Integer,
     Sequence,
     Text,
+    and_,
     column,
     func,
     select,
     table,
+    tuple_,
 )
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.hybrid import hybrid_property
-from sqlalchemy.orm import column_property, relationship
+from sqlalchemy.orm import column_property, relationship, selectinload
 
 from . import Base
 from .enums import ValueType
@@ -19,6 +24,8 @@ from .platform import Platform
 
 __all__ = ["Value", "ValueSource"]
 
+logger = logging.getLogger(__name__)
+
 
 class Value(Base):
     __tablename__ = "value"
@@ -64,6 +71,228 @@ class Value(Base):
     def __str__(self):
         return "{}({}): {}".format(self.type, self.score, self.text)
 
+    @classmethod
+    def of_object(cls, session, external_object_id):
+        """Query the values of an object, with their sources and platforms
+        loaded in one batch for all the values fetched"""
+        return (
+            session.query(cls)
+            .filter(cls.external_object_id == external_object_id)
+            .options(selectinload(cls.sources).joinedload(ValueSource.platform))
+        )
+
+    @classmethod
+    def deduplicate(cls, session, dry_run=False):
+        """Fold values with the same type and text on the same object.
+
+        The sources of the duplicates are copied to the first value of each
+        group, keeping the existing ones, then the duplicates are deleted.
+        Nothing is commited.
+
+        Parameters
+        ----------
+        session : sqlalchemy.orm.session.Session
+        dry_run : bool
+            only count what would be changed
+
+        Returns
+        -------
+        dict
+            how many values were deleted and sources were moved
+
+        """
+        keep_id = func.first_value(cls.id).over(
+            partition_by=(cls.external_object_id, cls.type, cls.text), order_by=cls.id
+        )
+        groups = select([cls.id.label("id"), keep_id.label("keep_id")]).alias("groups")
+        duplicates = (
+            select([groups.c.id, groups.c.keep_id])
+            .where(groups.c.id != groups.c.keep_id)
+            .alias("duplicates")
+        )
+
+        source = ValueSource.__table__
+        sources = (
+            select([duplicates.c.keep_id, source.c.platform_id, source.c.score_factor])
+            .distinct(duplicates.c.keep_id, source.c.platform_id)
+            .select_from(source.join(duplicates, source.c.value_id == duplicates.c.id))
+            .order_by(
+                duplicates.c.keep_id,
+                source.c.platform_id,
+                source.c.score_factor.desc(),
+            )
+        )
+
+        if dry_run:
+            return {
+                "values": session.execute(
+                    select([func.count()]).select_from(duplicates)
+                ).scalar(),
+                "sources": session.execute(
+                    select([func.count()]).select_from(sources.alias())
+                ).scalar(),
+            }
+
+        moved = session.execute(
+            insert(source)
+            .from_select(["value_id", "platform_id", "score_factor"], sources)
+            .on_conflict_do_nothing()
+        )
+        # Their sources are deleted along with them
+        deleted = session.execute(
+            cls.__table__.delete().where(cls.id.in_(select([duplicates.c.id])))
+        )
+
+        return {"values": deleted.rowcount, "sources": moved.rowcount}
+
+    @classmethod
+    def normalize(cls, session, type, transform=None, where=None, chunk_size=1000):
+        """Add a normalized version of values, with the same sources.
+
+        Values are read in chunks of consecutive IDs, and each chunk is written
+        with a few bulk statements and commited on its own, so the job can be
+        interrupted and restarted without holding locks for too long.
+
+        Parameters
+        ----------
+        session : sqlalchemy.orm.session.Session
+        type : ValueType
+            the type of values to normalize
+        transform : callable, optional
+            gives the normalized text of a value, or ``None`` to skip it.
+            Defaults to :func:`.enums.ValueType.fmt`
+        where : optional
+            an additional filter on the values to normalize
+        chunk_size : int
+            how many values are read at once
+
+        Returns
+        -------
+        tuple of int
+            how many values were added and how many were read
+
+        """
+        if transform is None:
+            transform = type.fmt
+
+        value = cls.__table__
+        source = ValueSource.__table__
+        # The transforms can be slow (e.g. country lookups), and a lot of
+        # values share the same text
+        cache = {}
+        (added, read, last_id) = (0, 0, 0)
+        # Stop at the values that existed when the job started, instead of
+        # reading the ones it adds
+        max_id = session.execute(
+            select([func.max(value.c.id)]).where(value.c.type == type)
+        ).scalar()
+        if max_id is None:
+            return (added, read)
+
+        while True:
+            query = (
+                select([value.c.id, value.c.external_object_id, value.c.text])
+                .where(
+                    and_(
+                        value.c.type == type,
+                        value.c.id > last_id,
+                        value.c.id <= max_id,
+                    )
+                )
+                .order_by(value.c.id)
+                .limit(chunk_size)
+            )
+            if where is not None:
+                query = query.where(where)
+            rows = session.execute(query).fetchall()
+
+            if not rows:
+                break
+
+            last_id = rows[-1].id
+            read += len(rows)
+
+            # Map each (object, normalized text) to the values it comes from
+            targets = {}
+            for (id, external_object_id, text) in rows:
+                if text not in cache:
+                    cache[text] = transform(text)
+                new = cache[text]
+                if new and new != text:
+                    targets.setdefault((external_object_id, new), []).append(id)
+
+            if not targets:
+                session.commit()
+                continue
+
+            existing = {
+                (external_object_id, text): id
+                for (id, external_object_id, text) in session.execute(
+                    select([value.c.id, value.c.external_object_id, value.c.text])
+                    .where(value.c.type == type)
+                    .where(
+                        tuple_(value.c.external_object_id, value.c.text).in_(
+                            list(targets)
+                        )
+                    )
+                )
+            }
+
+            missing = [key for key in targets if key not in existing]
+            if missing:
+                inserted = session.execute(
+                    insert(value)
+                    .values(
+                        [
+                            {"type": type, "external_object_id": obj_id, "text": text}
+                            for (obj_id, text) in missing
+                        ]
+                    )
+                    .returning(value.c.id, value.c.external_object_id, value.c.text)
+                )
+                for (id, external_object_id, text) in inserted:
+                    existing[(external_object_id, text)] = id
+                added += len(missing)
+
+            new_ids = {
+                old_id: existing[key] for (key, ids) in targets.items() for old_id in ids
+            }
+            sources = session.execute(
+                select(
+                    [source.c.value_id, source.c.platform_id, source.c.score_factor]
+                ).where(source.c.value_id.in_(list(new_ids)))
+            )
+            # Keep the best score factor when several values are normalized
+            # into the same one
+            new_sources = {}
+            for (value_id, platform_id, score_factor) in sources:
+                key = (new_ids[value_id], platform_id)
+                new_sources[key] = max(new_sources.get(key, score_factor), score_factor)
+
+            if new_sources:
+                session.execute(
+                    insert(source)
+                    .values(
+                        [
+                            {
+                                "value_id": value_id,
+                                "platform_id": platform_id,
+                                "score_factor": score_factor,
+                            }
+                            for (
+                                (value_id, platform_id),
+                                score_factor,
+                            ) in new_sources.items()
+                        ]
+                    )
+                    .on_conflict_do_nothing()
+                )
+
+            session.commit()
+            logger.info("Normalized %d values, added %d", read, added)
+
+        return (added, read)
+
 
 class ValueSource(Base):
     __tablename__ = "value_source"
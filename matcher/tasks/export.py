@@ -1,3 +1,5 @@
+from flask import current_app
+
 from matcher import celery
 from matcher.app import db
 from matcher.scheme.enums import ExportFileStatus
@@ -17,7 +19,8 @@ def run_factory(factory_id, session_id):
 
     for file in factory.generate(scrap_session=scrap_session):
         file.status = ExportFileStatus.SCHEDULED
-        if file.count_links(session=db.session) > 0:
+        file.expected_rows = file.count_links(session=db.session)
+        if file.expected_rows > 0:
             files.append(file)
 
     db.session.add_all(files)
@@ -30,6 +33,39 @@ def run_factory(factory_id, session_id):
     db.session.commit()
 
 
+@celery.task
+def count_rows(file_id):
+    """Count the rows of a scheduled file, then dispatch it."""
+    file = db.session.query(ExportFile).get(file_id)
+    assert file
+
+    if file.status is ExportFileStatus.SCHEDULED and file.expected_rows is None:
+        file.expected_rows = file.count_links(session=db.session)
+        db.session.commit()
+
+    dispatch_files.delay()
+
+
+@celery.task
+def dispatch_files():
+    """Send the scheduled export files to their queue, within the limits."""
+    config = current_app.config
+    dispatched = ExportFile.dispatch_scheduled(
+        db.session,
+        queues=config["EXPORT_QUEUES"],
+        max_active_queries=config["EXPORT_MAX_ACTIVE_QUERIES"],
+    )
+    db.session.commit()
+
+    if dispatched is None:
+        # The database is busy, try again later
+        dispatch_files.apply_async(countdown=config["EXPORT_THROTTLE_DELAY"])
+        return
+
+    for (file, queue) in dispatched:
+        process_file.apply_async([file.id], queue=queue)
+
+
 @celery.task(base=celery.OnceTask)
 def process_file(file_id):
     file = db.session.query(ExportFile).get(file_id)
@@ -42,7 +78,10 @@ def process_file(file_id):
         db.session.add(file)
         db.session.commit()
         raise
-
-    file.done()
-    db.session.add(file)
-    db.session.commit()
+    else:
+        file.done()
+        db.session.add(file)
+        db.session.commit()
+    finally:
+        # A slot was freed, the next file can go
+        dispatch_files.delay()
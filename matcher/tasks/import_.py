@@ -9,6 +9,8 @@ from matcher.app import db
 from matcher.scheme.enums import ValueType
 from matcher.scheme.import_ import ImportFile
 from matcher.scheme.platform import Platform
+from matcher.scheme.stats import CountStats
+from matcher.tasks.object import consolidate_episodes
 
 logger = logging.getLogger(__name__)
 
@@ -38,8 +40,12 @@ def mark_done(file_id):
 
     file.done()
     db.session.add(file)
+    CountStats.compact(db.session)
     db.session.commit()
 
+    # The import might have brought duplicate episodes
+    consolidate_episodes.delay(import_file_id=file_id)
+
 
 # Import one row of a file
 # TODO: it works but its ugly
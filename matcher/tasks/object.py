@@ -1,9 +1,15 @@
+from flask import current_app
 from sqlalchemy.exc import ResourceClosedError
 
 from matcher import celery
 from matcher.app import db
-from matcher.scheme.object import ExternalObject
+from matcher.metrics import stage
+from matcher.scheme.import_ import ImportFile
+from matcher.scheme.merge import MergeCandidate
+from matcher.scheme.object import Episode, ExternalObject
 from matcher.scheme.platform import Scrap
+from matcher.scheme.search import ObjectSearch
+from matcher.scheme.stats import CountStats
 from matcher.scheme.views import (
     AttributesView,
     PlatformSourceOrderByValueType,
@@ -16,17 +22,79 @@ def insert_dict(data, scrap_id):
     scrap = db.session.query(Scrap).get(scrap_id)
     assert scrap
 
-    data = ExternalObject.normalize_dict(data)
+    ExternalObject.insert_raw(data, scrap)
 
-    # FIXME: kinda ugly workaround
-    assert data["type"] is not None or data["any_type"]
-    assert data["relation"] is None
-    ExternalObject.insert_dict(data, scrap)
+    if current_app.config["DEFER_MERGES"]:
+        # Ambiguous links were recorded as merge candidates, merge them soon
+        merge_candidates.apply_async(countdown=60, once={"graceful": True})
+
+
+@celery.task(autoretry_for=(ResourceClosedError,), max_retries=5)
+def insert_batch(objects, scrap_id):
+    """Insert a batch of objects sent by the gateway.
+
+    See :func:`ExternalObject.insert_batch`
+    """
+    scrap = db.session.query(Scrap).get(scrap_id)
+    assert scrap
+
+    inserted = ExternalObject.insert_batch(objects, scrap)
+
+    if current_app.config["DEFER_MERGES"]:
+        # Ambiguous links were recorded as merge candidates, merge them soon
+        merge_candidates.apply_async(countdown=60, once={"graceful": True})
+
+    return inserted
 
 
 @celery.task
 def refresh_attributes():
-    ValueScoreView.refresh(session=db.session, concurrently=True)
-    PlatformSourceOrderByValueType.refresh(session=db.session, concurrently=True)
-    AttributesView.refresh(session=db.session, concurrently=True)
+    for view in [ValueScoreView, PlatformSourceOrderByValueType, AttributesView]:
+        with stage("refresh." + view.__tablename__):
+            view.refresh(session=db.session, concurrently=True)
+
+    with stage("refresh.object_search"):
+        ObjectSearch.refresh(db.session)
+
+    with stage("refresh.commit"):
+        db.session.commit()
+
+    # Some changes are not seen by the running totals, recount them in a
+    # short transaction of their own
+    with stage("refresh.count_stats"):
+        CountStats.refresh(db.session)
+        db.session.commit()
+
+
+@celery.task(base=celery.OnceTask)
+def merge_candidates(threshold=None, batch_size=100):
+    return MergeCandidate.process(
+        session=db.session, threshold=threshold, batch_size=batch_size
+    )
+
+
+@celery.task
+def finish_scrap(scrap_id):
+    scrap = db.session.query(Scrap).get(scrap_id)
+    assert scrap
+
+    scrap.finish(db.session)
     db.session.commit()
+
+
+@celery.task(base=celery.OnceTask)
+def consolidate_episodes(scrap_id=None, import_file_id=None, batch_size=100):
+    scrap = import_file = None
+    if scrap_id is not None:
+        scrap = db.session.query(Scrap).get(scrap_id)
+        assert scrap
+    if import_file_id is not None:
+        import_file = db.session.query(ImportFile).get(import_file_id)
+        assert import_file
+
+    return Episode.consolidate(
+        session=db.session,
+        scrap=scrap,
+        import_file=import_file,
+        batch_size=batch_size,
+    )
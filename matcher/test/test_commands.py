@@ -0,0 +1,189 @@
+from datetime import datetime
+
+from sqlalchemy.engine.url import make_url
+
+from matcher.commands import attach_session, bench, fix_countries, import_csv
+from matcher.scheme.enums import ExternalObjectType, ScrapStatus, ValueType
+from matcher.scheme.object import ExternalObject, ObjectLink
+from matcher.scheme.platform import Platform, Scrap, Session, session_link
+from matcher.scheme.value import Value, ValueSource
+
+
+class TestAttachSession(object):
+    def test_attach(self, app, session):
+        platform = Platform(name="Platform", slug="platform")
+        statuses = [ScrapStatus.SUCCESS, ScrapStatus.SUCCESS, ScrapStatus.FAILED]
+        scraps = [
+            Scrap(platform=platform, status=status, date=datetime(2018, 1, 1))
+            for status in statuses
+        ]
+        # Only the first scrap is successful and found enough objects
+        links = []
+        for (index, (scrap, count)) in enumerate(zip(scraps, [2, 1, 2])):
+            for n in range(count):
+                link = ObjectLink(
+                    platform=platform,
+                    external_id="{}-{}".format(index, n),
+                    external_object=ExternalObject(type=ExternalObjectType.MOVIE),
+                )
+                link.scraps.append(scrap)
+                links.append(link)
+        export_session = Session(name="Session")
+        session.add_all([export_session] + scraps + links)
+        session.commit()
+        # The command removes the session when it is done
+        (session_id, scrap_id) = (export_session.id, scraps[0].id)
+        link_ids = sorted(link.id for link in scraps[0].links)
+
+        runner = app.test_cli_runner()
+        result = runner.invoke(
+            attach_session, ["--limit", "2", "--status", "success", "Session"]
+        )
+        assert result.exit_code == 0, result.output
+        assert "Attached 1 scraps, 0 were already attached" in result.output
+
+        export_session = session.query(Session).get(session_id)
+        assert [scrap.id for scrap in export_session.scraps] == [scrap_id]
+        attached = session.execute(
+            session_link.select().where(session_link.c.session_id == session_id)
+        ).fetchall()
+        assert sorted(row.object_link_id for row in attached) == link_ids
+
+        # Attaching again does nothing
+        result = runner.invoke(
+            attach_session, ["--limit", "2", "--status", "success", "Session"]
+        )
+        assert "Attached 0 scraps, 1 were already attached" in result.output
+
+
+class TestFixCountries(object):
+    def test_several_values(self, app, session, monkeypatch):
+        platform = Platform(name="Platform", slug="platform")
+        objects = [ExternalObject(type=ExternalObjectType.MOVIE) for _ in range(2)]
+        texts = [["France", "Allemagne"], ["FR", "Germany"]]
+        for (obj, values) in zip(objects, texts):
+            obj.values = [
+                Value(
+                    type=ValueType.COUNTRY,
+                    text=text,
+                    sources=[ValueSource(platform=platform, score_factor=1)],
+                )
+                for text in values
+            ]
+        session.add_all(objects)
+        session.commit()
+        ids = [obj.id for obj in objects]
+        codes = {"france": "FR", "allemagne": "DE", "germany": "DE"}
+        monkeypatch.setattr("matcher.countries.lookup", lambda t: codes[t.lower()])
+
+        # The code added by the first chunk does not stop the second one
+        runner = app.test_cli_runner()
+        result = runner.invoke(fix_countries, ["--chunk-size", "1"])
+        assert result.exit_code == 0, result.output
+
+        def texts_of(id):
+            values = session.query(Value.text).filter(Value.external_object_id == id)
+            return sorted(text for (text,) in values)
+
+        assert texts_of(ids[0]) == ["Allemagne", "DE", "FR", "France"]
+        # Objects which already had a code are left alone
+        assert texts_of(ids[1]) == ["FR", "Germany"]
+
+
+class TestImportCsv(object):
+    def test_resume(self, app, session, tmp_path):
+        platform = Platform(name="Platform", slug="platform")
+        imdb = Platform(name="IMDb", slug="imdb")
+        objects = [ExternalObject(type=ExternalObjectType.MOVIE) for _ in range(5)]
+        # The last object has an outdated link, with a title from it
+        objects[4].links.append(ObjectLink(platform=imdb, external_id="old"))
+        objects[4].values.append(
+            Value(
+                type=ValueType.TITLE,
+                text="Outdated",
+                sources=[ValueSource(platform=imdb, score_factor=100)],
+            )
+        )
+        session.add_all([platform, imdb] + objects)
+        session.commit()
+        ids = [obj.id for obj in objects]
+
+        path = tmp_path / "import.csv"
+        path.write_text(
+            "id,title,imdb\n"
+            + "".join(
+                "{},Title {},tt{}\n".format(id, index, index)
+                for (index, id) in enumerate(ids)
+            )
+        )
+        # The first two rows were imported by a previous run
+        checkpoint = tmp_path / "import.checkpoint"
+        checkpoint.write_text("2")
+
+        result = app.test_cli_runner().invoke(
+            import_csv,
+            [
+                "--platform",
+                "platform",
+                "--attribute",
+                "1",
+                "title",
+                "--external-id",
+                "2",
+                "imdb",
+                "--chunk-size",
+                "2",
+                "--checkpoint",
+                str(checkpoint),
+                str(path),
+            ],
+        )
+        assert result.exit_code == 0, result.output
+        assert not checkpoint.exists()
+
+        titles = {
+            obj.id: sorted(value.text for value in obj.values)
+            for obj in session.query(ExternalObject)
+        }
+        assert titles == {
+            ids[0]: [],
+            ids[1]: [],
+            ids[2]: ["Title 2"],
+            ids[3]: ["Title 3"],
+            ids[4]: ["Title 4"],
+        }
+        links = session.query(ObjectLink).order_by(ObjectLink.external_id)
+        assert [(link.external_object_id, link.external_id) for link in links] == [
+            (ids[2], "tt2"),
+            (ids[3], "tt3"),
+            (ids[4], "tt4"),
+        ]
+
+
+class TestBench(object):
+    def test_refuse_app_database(self, app, session, monkeypatch):
+        platform = Platform(name="Platform", slug="platform")
+        session.add(platform)
+        session.commit()
+        runner = app.test_cli_runner()
+
+        monkeypatch.setitem(app.config, "BENCH_DATABASE_URI", None)
+        result = runner.invoke(bench, ["--yes"])
+        assert result.exit_code == 2
+        assert "Set BENCH_DATABASE_URI" in result.output
+
+        # The same database, even written differently: another driver, some
+        # connection arguments, and the default port left implicit
+        url = make_url(app.config["SQLALCHEMY_DATABASE_URI"])
+        url.drivername = "postgresql+pg8000"
+        url.query = {"application_name": "bench"}
+        if url.port == 5432:
+            url.port = None
+        uri = str(url)
+        assert uri != app.config["SQLALCHEMY_DATABASE_URI"]
+        monkeypatch.setitem(app.config, "BENCH_DATABASE_URI", uri)
+        result = runner.invoke(bench, ["--yes"])
+        assert result.exit_code == 2
+        assert "refusing to empty it" in result.output
+
+        assert session.query(Platform).count() == 1
@@ -0,0 +1,85 @@
+import asyncio
+import json
+
+from matcher.gateway import Gateway, ScrapCache
+
+
+def run(coroutine):
+    return asyncio.get_event_loop().run_until_complete(coroutine)
+
+
+async def request(port, head, chunks=()):
+    (reader, writer) = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(head.encode("latin-1"))
+    for chunk in chunks:
+        writer.write("{:x}\r\n".format(len(chunk)).encode("ascii") + chunk + b"\r\n")
+    if chunks:
+        writer.write(b"0\r\n\r\n")
+
+    response = await reader.read()
+    writer.close()
+    (status, _, body) = response.partition(b"\r\n\r\n")
+    return (int(status.split(b" ")[1]), json.loads(body.decode("utf-8")))
+
+
+class TestGateway(object):
+    def setup_method(self):
+        self.lookups = []
+        self.batches = []
+
+        def lookup(scrap_id):
+            self.lookups.append(scrap_id)
+            return scrap_id == 42
+
+        def publish(objects, scrap_id):
+            self.batches.append((scrap_id, objects))
+
+        self.gateway = Gateway(ScrapCache(lookup), publish, batch_size=2, max_pending=1)
+        server = run(self.gateway.start("127.0.0.1", 0))
+        self.port = server.sockets[0].getsockname()[1]
+
+    def teardown_method(self):
+        run(self.gateway.close())
+
+    def test_ingest(self):
+        head = (
+            "POST /ingest HTTP/1.1\r\n"
+            "X-Scrap-Id: 42\r\n"
+            "Transfer-Encoding: chunked\r\n\r\n"
+        )
+        # Lines can be split across chunks
+        chunks = [b'{"id": 1}\n{"id"', b': 2}\nnot json\n{"id": 3}\n', b"[4]\n"]
+
+        (status, body) = run(request(self.port, head, chunks))
+        assert status == 200
+        assert body == {"status": "queued", "queued": 3, "invalid": 2}
+        assert self.batches == [(42, [{"id": 1}, {"id": 2}]), (42, [{"id": 3}])]
+
+        # The scrap was only looked up once
+        run(request(self.port, head, [b'{"id": 5}\n']))
+        assert self.lookups == [42]
+
+    def test_content_length(self):
+        data = '{"id": 1}\n{"id": 2}'
+        head = (
+            "POST /ingest HTTP/1.1\r\n"
+            "X-Scrap-Id: 42\r\n"
+            "Content-Length: {}\r\n\r\n{}"
+        ).format(len(data), data)
+
+        (status, body) = run(request(self.port, head))
+        assert status == 200
+        assert body["queued"] == 2
+
+    def test_errors(self):
+        head = "POST /ingest HTTP/1.1\r\nX-Scrap-Id: {}\r\n{}\r\n"
+
+        (status, _) = run(request(self.port, head.format(1, "Content-Length: 0\r\n")))
+        assert status == 404
+        (status, _) = run(request(self.port, head.format("foo", "")))
+        assert status == 400
+        (status, _) = run(request(self.port, head.format(42, "")))
+        assert status == 411
+        (status, _) = run(request(self.port, "GET /ingest HTTP/1.1\r\n\r\n"))
+        assert status == 405
+        assert self.batches == []
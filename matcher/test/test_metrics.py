@@ -0,0 +1,57 @@
+from matcher.metrics import COUNT_BUCKETS, Registry, StatsdSink, registry, stage
+
+
+class TestRegistry(object):
+    def test_counter(self):
+        metrics = Registry()
+        metrics.inc("rows_total", kind="import")
+        metrics.inc("rows_total", 2, kind="import")
+        metrics.inc("rows_total", kind="export")
+
+        assert metrics.render().splitlines() == [
+            "# TYPE rows_total counter",
+            'rows_total{kind="export"} 1',
+            'rows_total{kind="import"} 3',
+        ]
+
+    def test_histogram(self):
+        metrics = Registry()
+        for value in [1, 7, 7, 20000]:
+            metrics.observe("queries", value, buckets=COUNT_BUCKETS, task="foo")
+
+        lines = metrics.render().splitlines()
+        assert lines[0] == "# TYPE queries histogram"
+        assert 'queries_bucket{task="foo",le="1"} 1' in lines
+        assert 'queries_bucket{task="foo",le="5"} 1' in lines
+        assert 'queries_bucket{task="foo",le="10"} 3' in lines
+        assert 'queries_bucket{task="foo",le="10000"} 3' in lines
+        assert 'queries_bucket{task="foo",le="+Inf"} 4' in lines
+        assert 'queries_sum{task="foo"} 20015.0' in lines
+        assert 'queries_count{task="foo"} 4' in lines
+
+    def test_stage(self):
+        registry.clear()
+        with stage("foo"):
+            pass
+
+        try:
+            with stage("bar"):
+                raise ValueError()
+        except ValueError:
+            pass
+
+        stages = {
+            dict(labels)["stage"]: histogram.count
+            for ((name, labels), histogram) in registry.histograms.items()
+            if name == "matcher_stage_seconds"
+        }
+        assert stages == {"foo": 1, "bar": 1}, "failed stages should be timed too"
+
+
+class TestStatsdSink(object):
+    def test_name(self):
+        sink = StatsdSink("localhost", prefix="matcher")
+        assert (
+            sink.name("matcher_stage_seconds", (("stage", "import.merge"),))
+            == "matcher.matcher_stage_seconds.import_merge"
+        )
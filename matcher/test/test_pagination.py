@@ -0,0 +1,32 @@
+import pytest
+
+from matcher.pagination import (
+    InvalidCursor,
+    decode_cursor,
+    encode_cursor,
+    ordering_keys,
+)
+from matcher.scheme.platform import Scrap
+
+
+def test_cursor():
+    cursor = encode_cursor(["2019-01-01 00:00:00", 42], backwards=True)
+    assert decode_cursor(cursor) == (["2019-01-01 00:00:00", 42], True)
+
+    with pytest.raises(InvalidCursor):
+        decode_cursor("garbage")
+
+
+def test_ordering_keys():
+    order_map = {"date": (Scrap.date, True), None: Scrap.id}
+
+    def describe(keys):
+        return [(key.attribute.key, key.descending, key.nullable) for key in keys]
+
+    keys = ordering_keys(order_map, Scrap.id, key="date", direction="desc")
+    assert describe(keys) == [("date", True, True), ("id", True, False)]
+
+    keys = ordering_keys(order_map, Scrap.id)
+    assert describe(keys) == [
+        ("id", False, False)
+    ], "the unique key should not be repeated"
@@ -0,0 +1,81 @@
+from flask import Flask
+
+from matcher.profiler import (
+    QueryProfile,
+    current_profile,
+    setup_profiler,
+    statement_shape,
+)
+
+
+def test_statement_shape():
+    assert (
+        statement_shape("SELECT * FROM value\nWHERE id = %(id_1)s AND text = 'foo'")
+        == "SELECT * FROM value WHERE id = ? AND text = ?"
+    )
+    assert statement_shape(
+        "SELECT * FROM value WHERE id IN (%(id_1_1)s, %(id_1_2)s)"
+    ) == statement_shape(
+        "SELECT * FROM value WHERE id IN (%(id_1_1)s)"
+    ), "IN lists of any length should have the same shape"
+    assert statement_shape("SELECT vw_000_platform.id_1 FROM vw_000_platform") == (
+        "SELECT vw_000_platform.id_1 FROM vw_000_platform"
+    ), "identifiers should be kept"
+
+
+def test_suspects():
+    profile = QueryProfile("test")
+    for id in range(12):
+        profile.record("SELECT * FROM scrap WHERE id = {}".format(id), 0.001)
+    profile.record("SELECT * FROM platform", 0.002)
+
+    assert profile.count == 13
+    assert [entry["shape"] for entry in profile.shapes()] == [
+        "SELECT * FROM scrap WHERE id = ?",
+        "SELECT * FROM platform",
+    ]
+    assert [entry["count"] for entry in profile.suspects(threshold=10)] == [12]
+
+
+def test_headers():
+    app = Flask(__name__)
+    app.config.update(QUERY_PROFILER_THRESHOLD=5, QUERY_PROFILER_REPORT=True)
+    setup_profiler(app)
+
+    @app.route("/lazy")
+    def lazy():
+        for id in range(6):
+            current_profile().record(
+                "SELECT * FROM value WHERE id = %(id)s", 0.0005 * id
+            )
+        return "ok"
+
+    client = app.test_client()
+    response = client.get("/lazy")
+    assert response.headers["X-Query-Count"] == "6"
+    assert response.headers["X-Query-Time"] == "7.5"
+    assert response.headers["X-Query-Repeated"] == "1"
+
+    report = client.get("/_profiler").json
+    assert report[0]["name"] == "GET /lazy"
+    assert [(entry["shape"], entry["count"]) for entry in report[0]["suspects"]] == [
+        ("SELECT * FROM value WHERE id = ?", 6)
+    ]
+
+
+def test_queries():
+    from sqlalchemy import create_engine
+
+    app = Flask(__name__)
+    setup_profiler(app)
+    engine = create_engine("sqlite://")
+
+    @app.route("/queries")
+    def queries():
+        for _ in range(2):
+            engine.execute("SELECT 1")
+        return "ok"
+
+    # The queries are timed by the listeners of the metrics
+    response = app.test_client().get("/queries")
+    assert response.headers["X-Query-Count"] == "2"
@@ -0,0 +1,75 @@
+import logging
+
+from matcher.utils import trace, trace_stats
+
+
+class Loud(object):
+    """Counts how many times it was formatted"""
+
+    formatted = 0
+
+    def __repr__(self):
+        Loud.formatted += 1
+        return "Loud()"
+
+
+class TestTrace(object):
+    def test_disabled(self):
+        logger = logging.getLogger("test_trace.disabled")
+        logger.setLevel(logging.INFO)
+
+        @trace(logger)
+        def add(a, b):
+            return a + b
+
+        Loud.formatted = 0
+        assert add(1, 2) == 3
+        assert len(add([Loud()], [Loud()])) == 2
+        assert Loud.formatted == 0, "arguments should not be formatted"
+
+    def test_enabled(self, caplog):
+        logger = logging.getLogger("test_trace.enabled")
+        logger.setLevel(logging.DEBUG)
+
+        @trace(logger)
+        def add(a, b):
+            return a + b
+
+        with caplog.at_level(logging.DEBUG, logger="test_trace.enabled"):
+            add(1, b=2)
+
+        assert [record.getMessage() for record in caplog.records] == [
+            "add(1, b=2) = 3"
+        ]
+
+    def test_sample(self, caplog):
+        logger = logging.getLogger("test_trace.sample")
+
+        @trace(logger, sample=0)
+        def add(a, b):
+            return a + b
+
+        with caplog.at_level(logging.DEBUG, logger="test_trace.sample"):
+            for i in range(10):
+                add(i, i)
+
+        assert caplog.records == [], "no call should be sampled"
+
+    def test_stats(self):
+        logger = logging.getLogger("test_trace.stats")
+        logger.setLevel(logging.INFO)
+
+        @trace(logger, stats=True)
+        def add(a, b):
+            return a + b
+
+        for i in range(5):
+            add(i, i)
+
+        [entry] = [
+            entry
+            for (name, entry) in trace_stats.items()
+            if name.endswith(".test_stats.<locals>.add")
+        ]
+        assert entry.calls == 5
+        assert entry.max <= entry.total
@@ -45,6 +45,10 @@ setup(
     packages=find_packages(),
     install_requires=req(),
     tests_require=req('test'),
+    extras_require={
+        'zstd': ['zstandard'],
+        'columnar': ['pyarrow'],
+    },
     setup_requires=req('dev'),
     include_package_data=True,
 